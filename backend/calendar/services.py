@@ -0,0 +1,63 @@
+import copy
+from datetime import timedelta
+from django.db.backends.postgresql.psycopg_any import DateTimeTZRange
+from django.db.models import Q
+from common.models import CalendarEvent, EventAttendance
+
+# Longest window calendar views may expand recurrences over
+MAX_WINDOW = timedelta(days=366)
+
+
+class CalendarService:
+    """
+    Events of a user within a time window. Recurring events are stored once
+    with their series span (start_time .. series_end) and expanded lazily
+    per requested window; nothing is materialized per occurrence.
+    """
+
+    @staticmethod
+    def visible_events(user):
+        """Events the user created or is invited to, without a join that needs distinct()"""
+        return CalendarEvent.objects.filter(
+            Q(created_by=user) | Q(pk__in=EventAttendance.objects.filter(user=user).values('event_id'))
+        )
+
+    @classmethod
+    def events_in_window(cls, user, start, end):
+        """Single query: series whose span overlaps [start, end), on the calendar_event_span_gist index"""
+        return cls.visible_events(user).annotate(
+            span=CalendarEvent.span()
+        ).filter(
+            span__overlap=DateTimeTZRange(start, end, '[)')
+        ).order_by('start_time')
+
+    @staticmethod
+    def expand(events, start, end):
+        """
+        One event instance per occurrence overlapping [start, end), sorted by
+        start; an occurrence is a copy of its series with start_time/end_time
+        moved and keeps the series id
+        """
+        occurrences = []
+        for event in events:
+            for occurrence_start in event.occurrences(start, end):
+                if occurrence_start == event.start_time:
+                    occurrences.append(event)
+                    continue
+                occurrence = copy.copy(event)
+                occurrence.start_time = occurrence_start
+                occurrence.end_time = occurrence_start + event.duration
+                occurrences.append(occurrence)
+        occurrences.sort(key=lambda occurrence: (occurrence.start_time, occurrence.pk))
+        return occurrences
+
+    @classmethod
+    def occurrences_for(cls, user, start, end):
+        if end <= start:
+            raise ValueError('end must be after start')
+        if end - start > MAX_WINDOW:
+            raise ValueError(f'The window may span at most {MAX_WINDOW.days} days')
+        events = cls.events_in_window(user, start, end).select_related(
+            'created_by'
+        ).prefetch_related('attendance__user')
+        return cls.expand(events, start, end)
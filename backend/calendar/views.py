@@ -1,7 +1,9 @@
 from rest_framework import viewsets, status, permissions
 from rest_framework.decorators import action
 from rest_framework.response import Response
+from rest_framework.exceptions import ValidationError
 from rest_framework.permissions import IsAuthenticated
+from django.core.exceptions import ValidationError as DjangoValidationError
 from django.db.models import Q, Prefetch
 from django.utils import timezone
 from datetime import datetime, timedelta
@@ -12,6 +14,7 @@ from .serializers import (
 )
 from authentication.models import CustomUser
 from common.models import Notification, Mention
+from .services import CalendarService
 
 class CalendarEventViewSet(viewsets.ModelViewSet):
     """مدیریت رویدادهای تقویم"""
@@ -20,21 +23,42 @@ class CalendarEventViewSet(viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated]
     
     def get_queryset(self):
-        user = self.request.user
-        return CalendarEvent.objects.filter(
-            Q(created_by=user) | Q(attendees__user=user)
+        return CalendarService.visible_events(self.request.user).select_related(
+            'created_by'
         ).prefetch_related(
-            'attendees__user', 'created_by'
-        ).distinct()
+            'attendance__user'
+        )
     
     def get_serializer_class(self):
         if self.action == 'create':
             return CreateEventSerializer
         return CalendarEventSerializer
     
+    # فیلدهایی که بازه و تکرار رویداد را تعیین می‌کنند
+    SCHEDULE_FIELDS = ('start_time', 'end_time', 'is_recurring', 'recurrence_pattern')
+    
+    def validate_schedule(self, serializer):
+        """اعتبارسنجی زمان‌بندی پیش از ذخیره تا خطا ۴۰۰ باشد، نه ۵۰۰ از save مدل"""
+        instance = serializer.instance
+        values = {field: getattr(instance, field) for field in self.SCHEDULE_FIELDS} if instance else {}
+        values.update({
+            field: serializer.validated_data[field]
+            for field in self.SCHEDULE_FIELDS
+            if field in serializer.validated_data
+        })
+        try:
+            CalendarEvent(**values).validate_schedule()
+        except DjangoValidationError as e:
+            raise ValidationError(e.message_dict)
+    
     def perform_create(self, serializer):
+        self.validate_schedule(serializer)
         serializer.save(created_by=self.request.user)
     
+    def perform_update(self, serializer):
+        self.validate_schedule(serializer)
+        serializer.save()
+    
     @action(detail=False, methods=['get'])
     def calendar_view(self, request):
         """نمای تقویم"""
@@ -50,11 +74,16 @@ class CalendarEventViewSet(viewsets.ModelViewSet):
             end = datetime.fromisoformat(end_date.replace('Z', '+00:00'))
         except ValueError:
             return Response({'error': 'Invalid date format'}, status=status.HTTP_400_BAD_REQUEST)
+        if timezone.is_naive(start):
+            start = timezone.make_aware(start)
+        if timezone.is_naive(end):
+            end = timezone.make_aware(end)
         
-        events = self.get_queryset().filter(
-            start_time__gte=start,
-            end_time__lte=end
-        ).order_by('start_time')
+        # رویدادهای هم‌پوشان با پنجره در یک کوئری؛ تکرارها فقط داخل پنجره باز می‌شوند
+        try:
+            events = CalendarService.occurrences_for(request.user, start, end)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
         
         serializer = self.get_serializer(events, many=True)
         return Response(serializer.data)
@@ -123,12 +152,15 @@ class CalendarEventViewSet(viewsets.ModelViewSet):
     def upcoming(self, request):
         """رویدادهای آینده"""
         days = int(request.query_params.get('days', 7))
-        end_date = timezone.now() + timedelta(days=days)
+        now = timezone.now()
         
-        events = self.get_queryset().filter(
-            start_time__gte=timezone.now(),
-            start_time__lte=end_date
-        ).order_by('start_time')
+        try:
+            events = [
+                event for event in CalendarService.occurrences_for(request.user, now, now + timedelta(days=days))
+                if event.start_time >= now
+            ]
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
         
         serializer = self.get_serializer(events, many=True)
         return Response(serializer.data)
@@ -138,12 +170,12 @@ class CalendarEventViewSet(viewsets.ModelViewSet):
         """رویدادهای امروز"""
         today = timezone.now().date()
         start_of_day = timezone.make_aware(datetime.combine(today, datetime.min.time()))
-        end_of_day = timezone.make_aware(datetime.combine(today, datetime.max.time()))
+        end_of_day = start_of_day + timedelta(days=1)
         
-        events = self.get_queryset().filter(
-            start_time__gte=start_of_day,
-            start_time__lte=end_of_day
-        ).order_by('start_time')
+        events = [
+            event for event in CalendarService.occurrences_for(request.user, start_of_day, end_of_day)
+            if event.start_time >= start_of_day
+        ]
         
         serializer = self.get_serializer(events, many=True)
         return Response(serializer.data)
@@ -0,0 +1,131 @@
+import json
+from asgiref.sync import sync_to_async
+from channels.generic.websocket import AsyncWebsocketConsumer
+from channels.db import database_sync_to_async
+from common.models import ChatRoomMembership
+from .services import ChatPresence, ReadReceiptService, room_group
+
+
+class ChatConsumer(AsyncWebsocketConsumer):
+    """اتصال زنده به یک اتاق چت: پیام‌ها، حضور و در حال نوشتن"""
+    
+    async def connect(self):
+        self.user = self.scope["user"]
+        if not self.user.is_authenticated:
+            await self.close()
+            return
+        
+        self.room_id = int(self.scope['url_route']['kwargs']['room_id'])
+        member_ids = await self.get_member_ids()
+        if self.user.id not in member_ids:
+            await self.close()
+            return
+        
+        # Join room group
+        self.room_group_name = room_group(self.room_id)
+        await self.channel_layer.group_add(
+            self.room_group_name,
+            self.channel_name
+        )
+        
+        await self.accept()
+        
+        await sync_to_async(ChatPresence.touch)(self.user.id)
+        await self.broadcast_presence(True)
+        
+        # Members already online in the room
+        online = await sync_to_async(ChatPresence.online)(member_ids)
+        await self.send(text_data=json.dumps({
+            'type': 'presence_list',
+            'online_user_ids': sorted(online)
+        }))
+    
+    async def disconnect(self, close_code):
+        if not hasattr(self, 'room_group_name'):
+            return
+        
+        await sync_to_async(ChatPresence.leave)(self.user.id)
+        await self.broadcast_presence(False)
+        
+        # Leave room group
+        await self.channel_layer.group_discard(
+            self.room_group_name,
+            self.channel_name
+        )
+    
+    # Receive message from WebSocket
+    async def receive(self, text_data):
+        try:
+            text_data_json = json.loads(text_data)
+        except (TypeError, ValueError):
+            text_data_json = None
+        if not isinstance(text_data_json, dict):
+            await self.send_error('پیام نامعتبر است')
+            return
+        message_type = text_data_json.get('type')
+        
+        if message_type == 'heartbeat':
+            await sync_to_async(ChatPresence.touch)(self.user.id)
+        elif message_type == 'typing':
+            # Typing indicators only go over the channel layer, never to the database
+            await self.channel_layer.group_send(self.room_group_name, {
+                'type': 'typing',
+                'user_id': self.user.id,
+                'is_typing': bool(text_data_json.get('is_typing', True))
+            })
+        elif message_type == 'mark_read':
+            message_id = text_data_json.get('message_id')
+            if not isinstance(message_id, int) or isinstance(message_id, bool):
+                await self.send_error('شناسه پیام نامعتبر است')
+                return
+            await self.mark_read(message_id)
+    
+    async def send_error(self, error):
+        await self.send(text_data=json.dumps({
+            'type': 'error',
+            'error': error
+        }))
+    
+    # Receive message from room group
+    async def chat_event(self, event):
+        # message.new / message.edited / message.deleted
+        await self.send(text_data=json.dumps({
+            'type': event['event'],
+            'message': event['message']
+        }, default=str))
+    
+    async def typing(self, event):
+        if event['user_id'] == self.user.id:
+            return
+        await self.send(text_data=json.dumps({
+            'type': 'typing',
+            'user_id': event['user_id'],
+            'is_typing': event['is_typing']
+        }))
+    
+    async def presence(self, event):
+        if event['user_id'] == self.user.id:
+            return
+        await self.send(text_data=json.dumps({
+            'type': 'presence',
+            'user_id': event['user_id'],
+            'online': event['online']
+        }))
+    
+    async def broadcast_presence(self, online):
+        await self.channel_layer.group_send(self.room_group_name, {
+            'type': 'presence',
+            'user_id': self.user.id,
+            'online': online
+        })
+    
+    @database_sync_to_async
+    def get_member_ids(self):
+        return list(ChatRoomMembership.objects.filter(
+            room_id=self.room_id,
+            is_active=True
+        ).values_list('user_id', flat=True))
+    
+    @database_sync_to_async
+    def mark_read(self, message_id):
+        return ReadReceiptService.mark_read(self.room_id, self.user, message_id)
@@ -2,6 +2,7 @@ from rest_framework import serializers
 from .models import ChatRoom, ChatMessage, MessageReadStatus, ChatRoomMembership
 from authentication.models import CustomUser
 from common.models import Mention, Notification
+from .services import ReadReceiptService
 
 class UserBasicSerializer(serializers.ModelSerializer):
     """سریالایزر پایه کاربر"""
@@ -58,20 +59,32 @@ class ChatMessageSerializer(serializers.ModelSerializer):
             }
         return None
     
+    def _watermarks(self, obj):
+        """واترمارک‌های خواندن اتاق پیام، یک بار برای همه پیام‌های سریالایز شده"""
+        watermarks = self.context.setdefault('room_watermarks', {})
+        if obj.room_id not in watermarks:
+            watermarks[obj.room_id] = ReadReceiptService.watermarks(obj.room_id)
+        return watermarks[obj.room_id]
+    
     def get_read_by(self, obj):
-        read_statuses = obj.read_status.all()
         return [
             {
-                'user': UserBasicSerializer(status.user).data,
-                'read_at': status.read_at
+                'user': UserBasicSerializer(membership.user).data,
+                'read_at': membership.last_read_at
             }
-            for status in read_statuses
+            for membership in self._watermarks(obj)
+            if membership.last_read_message_id >= obj.id and membership.user_id != obj.sender_id
         ]
     
     def get_is_read_by_me(self, obj):
         request = self.context.get('request')
         if request and request.user.is_authenticated:
-            return obj.read_status.filter(user=request.user).exists()
+            if obj.sender_id == request.user.id:
+                return True
+            return any(
+                membership.user_id == request.user.id and membership.last_read_message_id >= obj.id
+                for membership in self._watermarks(obj)
+            )
         return False
     
     def get_mentions(self, obj):
@@ -133,8 +146,9 @@ class ChatRoomSerializer(serializers.ModelSerializer):
         read_only_fields = ['created_by', 'created_at', 'updated_at']
     
     def get_last_message(self, obj):
-        last_message = obj.messages.filter(is_deleted=False).order_by('-created_at').first()
-        if last_message:
+        # ستون غیرنرمال، با select_related('last_message__sender') در لیست اتاق‌ها
+        last_message = obj.last_message
+        if last_message and not last_message.is_deleted:
             return {
                 'id': last_message.id,
                 'content': last_message.content[:100] + '...' if len(last_message.content) > 100 else last_message.content,
@@ -144,20 +158,25 @@ class ChatRoomSerializer(serializers.ModelSerializer):
         return None
     
     def get_unread_count(self, obj):
+        # محاسبه شده در ReadReceiptService.rooms_for
+        if hasattr(obj, 'unread_count'):
+            return obj.unread_count
         request = self.context.get('request')
         if request and request.user.is_authenticated:
-            return obj.messages.filter(
-                is_deleted=False,
-                sender__ne=request.user
-            ).exclude(
-                read_status__user=request.user
-            ).count()
+            membership = obj.memberships.filter(user=request.user, is_active=True).first()
+            if membership:
+                return ReadReceiptService.unread_messages(
+                    obj.id, request.user, membership.last_read_message_id
+                ).count()
         return 0
     
     def get_member_count(self, obj):
-        return obj.memberships.filter(is_active=True).count()
+        # از عضویت‌های prefetch شده شمرده می‌شود
+        return sum(1 for membership in obj.memberships.all() if membership.is_active)
     
     def get_my_role(self, obj):
+        if hasattr(obj, 'my_role'):
+            return obj.my_role
         request = self.context.get('request')
         if request and request.user.is_authenticated:
             try:
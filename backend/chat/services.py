@@ -0,0 +1,369 @@
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.db import connection, models, transaction
+from django.db.models import Count, Exists, F, Max, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from authentication.models import CustomUser
+from common.models import ChatRoom, ChatRoomMembership, ChatMessage, MessageReadStatus, Mention, Notification
+import logging
+import re
+import threading
+
+logger = logging.getLogger(__name__)
+
+MENTION_PATTERN = re.compile(r'@(\w+)')
+
+# Seconds a presence entry lives without a heartbeat; clients beat every PRESENCE_TTL / 2
+PRESENCE_TTL = 60
+
+
+def room_group(room_id):
+    """Channel group of a chat room's websocket connections"""
+    return f"chat_room_{room_id}"
+
+
+class ReadReceiptService:
+    """
+    Read receipts kept as one watermark per membership (the id of the newest
+    message the member has read) instead of a row per (message, user)
+    """
+
+    @staticmethod
+    def mark_read(room_id, user, message_id):
+        """
+        Advance the user's watermark in the room up to message_id; it never
+        moves back. message_id must be a message of the room, so a client
+        cannot push its watermark past the room's newest message or to
+        another room's id.
+        """
+        return ChatRoomMembership.objects.filter(
+            room_id=room_id,
+            user=user,
+            is_active=True
+        ).filter(
+            Q(last_read_message__isnull=True) | Q(last_read_message_id__lt=message_id)
+        ).filter(
+            Exists(ChatMessage.objects.filter(pk=message_id, room_id=room_id))
+        ).update(last_read_message_id=message_id, last_read_at=timezone.now()) > 0
+
+    @staticmethod
+    def unread_messages(room_id, user, last_read_message_id):
+        """Messages of the room after the watermark that were not sent by the user"""
+        return ChatMessage.objects.filter(
+            room_id=room_id,
+            is_deleted=False,
+            id__gt=last_read_message_id or 0
+        ).exclude(sender=user)
+
+    @staticmethod
+    def rooms_for(user):
+        """
+        Active rooms of the user annotated with my_role, my_last_read_id and
+        unread_count; the unread counts are range counts on (room, id)
+        computed in the same query
+        """
+        unread = ChatMessage.objects.filter(
+            room=OuterRef('pk'),
+            is_deleted=False,
+            id__gt=OuterRef('my_last_read_id')
+        ).exclude(sender=user).order_by().values('room').annotate(count=Count('pk')).values('count')
+
+        # One membership per (room, user), so the join does not duplicate rooms
+        return ChatRoom.objects.filter(
+            memberships__user=user,
+            memberships__is_active=True
+        ).annotate(
+            my_role=F('memberships__role'),
+            my_last_read_id=Coalesce('memberships__last_read_message_id', 0, output_field=models.BigIntegerField()),
+        ).annotate(
+            unread_count=Coalesce(Subquery(unread), 0)
+        )
+
+    @staticmethod
+    def watermarks(room_id):
+        """Active memberships of the room that have read something, with their users"""
+        return list(ChatRoomMembership.objects.filter(
+            room_id=room_id,
+            is_active=True,
+            last_read_message__isnull=False
+        ).select_related('user'))
+
+    @staticmethod
+    def backfill_watermarks(chunk_size=2000):
+        """
+        Seed the watermarks from the legacy MessageReadStatus rows: each
+        membership moves up to the newest message it has a read row for.
+        Watermarks only move forward, so this is safe to run again.
+        """
+        latest = MessageReadStatus.objects.values(
+            'message__room_id', 'user_id'
+        ).annotate(
+            last_id=Max('message_id'),
+            last_at=Max('read_at')
+        ).order_by()
+
+        updated = 0
+        for row in latest.iterator(chunk_size=chunk_size):
+            updated += ChatRoomMembership.objects.filter(
+                room_id=row['message__room_id'],
+                user_id=row['user_id']
+            ).filter(
+                Q(last_read_message__isnull=True) | Q(last_read_message_id__lt=row['last_id'])
+            ).update(last_read_message_id=row['last_id'], last_read_at=row['last_at'])
+
+        logger.info("Backfilled %s chat read watermarks", updated)
+        return updated
+
+
+class RoomActivityService:
+    """Denormalized last message / last activity of chat rooms, kept current on send and delete"""
+
+    @staticmethod
+    def record_message(message):
+        """Make message the room's last message unless a newer one is already recorded"""
+        ChatRoom.objects.filter(
+            pk=message.room_id
+        ).filter(
+            Q(last_message__isnull=True) | Q(last_message_id__lt=message.id)
+        ).update(last_message=message, last_activity_at=message.created_at)
+
+    @staticmethod
+    def refresh(room_id):
+        """Recompute the room's last message, e.g. after that message was deleted"""
+        last_message = ChatMessage.objects.filter(
+            room_id=room_id,
+            is_deleted=False
+        ).order_by('-id').only('id', 'created_at').first()
+        ChatRoom.objects.filter(pk=room_id).update(
+            last_message=last_message,
+            last_activity_at=last_message.created_at if last_message else None
+        )
+
+    @staticmethod
+    def backfill(chunk_size=2000):
+        """
+        Fill the last message of rooms that have none recorded (rooms from
+        before the column existed) from their newest visible message, one
+        UPDATE per chunk of rooms. Recorded rooms are skipped, so this is
+        safe to run again.
+        """
+        newest = ChatMessage.objects.filter(
+            room=OuterRef('pk'),
+            is_deleted=False
+        ).order_by('-id')
+        room_ids = list(ChatRoom.objects.filter(
+            last_message__isnull=True
+        ).order_by('pk').values_list('pk', flat=True))
+
+        updated = 0
+        for start in range(0, len(room_ids), chunk_size):
+            updated += ChatRoom.objects.filter(
+                pk__in=room_ids[start:start + chunk_size],
+                last_message__isnull=True
+            ).update(
+                last_message=Subquery(newest.values('id')[:1]),
+                last_activity_at=Subquery(newest.values('created_at')[:1])
+            )
+
+        logger.info("Backfilled the last message of %s chat rooms", updated)
+        return updated
+
+
+class MessageHistory:
+    """Keyset (cursor) pagination of a room's messages on (room, id)"""
+
+    DEFAULT_LIMIT = 50
+    MAX_LIMIT = 200
+
+    @classmethod
+    def parse(cls, params):
+        """before, after and limit from query params; raises ValueError on bad values"""
+        cursors = {}
+        for name in ('before', 'after'):
+            value = params.get(name)
+            if value not in (None, ''):
+                if not str(value).isdigit() or int(value) < 1:
+                    raise ValueError(f"{name} must be a message id")
+                cursors[name] = int(value)
+        if len(cursors) > 1:
+            raise ValueError("Use either before or after, not both")
+
+        limit = params.get('limit') or cls.DEFAULT_LIMIT
+        if not str(limit).isdigit() or int(limit) < 1:
+            raise ValueError("limit must be a positive integer")
+        limit = int(limit)
+        return cursors.get('before'), cursors.get('after'), min(limit, cls.MAX_LIMIT)
+
+    @classmethod
+    def page(cls, room_id, before=None, after=None, limit=DEFAULT_LIMIT):
+        """
+        Up to limit messages in chronological order: the newest ones, the
+        ones older than before, or the ones newer than after. Returns
+        (messages, next_cursor); next_cursor is the id to pass as the same
+        parameter for the following page, or None at the end.
+        """
+        messages = ChatMessage.objects.filter(
+            room_id=room_id,
+            is_deleted=False
+        ).select_related('sender', 'reply_to__sender')
+
+        if after is not None:
+            messages = list(messages.filter(id__gt=after).order_by('id')[:limit + 1])
+            has_more = len(messages) > limit
+            messages = messages[:limit]
+            return messages, messages[-1].id if has_more else None
+
+        if before is not None:
+            messages = messages.filter(id__lt=before)
+        messages = list(messages.order_by('-id')[:limit + 1])
+        has_more = len(messages) > limit
+        messages = messages[:limit][::-1]
+        return messages, messages[0].id if has_more else None
+
+
+class ChatPresence:
+    """
+    Online users kept in the cache (Redis) as keys with a TTL that the chat
+    consumer refreshes on every heartbeat; a connection that dies without
+    disconnecting simply expires. A user with several tabs open may show
+    offline for up to one heartbeat after closing one of them.
+    """
+
+    @staticmethod
+    def key(user_id):
+        return f"chat_presence:{user_id}"
+
+    @classmethod
+    def touch(cls, user_id):
+        cache.set(cls.key(user_id), 1, PRESENCE_TTL)
+
+    @classmethod
+    def leave(cls, user_id):
+        cache.delete(cls.key(user_id))
+
+    @classmethod
+    def online(cls, user_ids):
+        """The subset of user_ids that is online, read in one round trip"""
+        keys = {cls.key(user_id): user_id for user_id in user_ids}
+        if not keys:
+            return set()
+        return {keys[key] for key in cache.get_many(list(keys))}
+
+
+class ChatBroadcast:
+    """Pushes message events to the room's channel group once the transaction commits"""
+
+    @staticmethod
+    def send(room_id, event, message):
+        def push():
+            channel_layer = get_channel_layer()
+            if not channel_layer:
+                return
+            async_to_sync(channel_layer.group_send)(room_group(room_id), {
+                'type': 'chat_event',
+                'event': event,
+                'message': message,
+            })
+
+        transaction.on_commit(push)
+
+
+class MessagePostProcessor:
+    """
+    Mentions and member notifications of a new message. Whatever the number
+    of mentions or members, this is one username__in query, one presence
+    lookup and one bulk_create per model.
+
+    schedule() runs it after the message's transaction commits, on a daemon
+    thread when CHAT_POSTPROCESS_IN_BACKGROUND is set. A thread is not
+    durable: notifications of a process that dies first are lost.
+    """
+
+    @classmethod
+    def schedule(cls, message, background=None):
+        if background is None:
+            background = getattr(settings, 'CHAT_POSTPROCESS_IN_BACKGROUND', False)
+
+        def run():
+            if background:
+                threading.Thread(target=cls.process_in_thread, args=(message,), daemon=True).start()
+            else:
+                cls.process(message)
+
+        transaction.on_commit(run)
+
+    @classmethod
+    def process_in_thread(cls, message):
+        try:
+            cls.process(message)
+        except Exception:
+            logger.exception("Post-processing of chat message %s failed", message.id)
+        finally:
+            connection.close()
+
+    @classmethod
+    def process(cls, message):
+        content_type = ContentType.objects.get_for_model(message)
+        mentioned = cls.process_mentions(message, content_type)
+        notified = cls.notify_members(message, content_type)
+        return {'mentions': mentioned, 'notifications': notified}
+
+    @staticmethod
+    def process_mentions(message, content_type):
+        """Mention and notify every @username in the message that exists"""
+        usernames = list(dict.fromkeys(MENTION_PATTERN.findall(message.content)))
+        if not usernames:
+            return 0
+
+        users = list(CustomUser.objects.filter(username__in=usernames).only('id', 'username'))
+        Mention.objects.bulk_create([
+            Mention(
+                mentioned_user=user,
+                content_type=content_type,
+                object_id=message.id,
+                mention_type='message',
+                text=message.content,
+                position=message.content.find(f'@{user.username}'),
+                created_by_id=message.sender_id
+            )
+            for user in users
+        ])
+        Notification.objects.bulk_create([
+            Notification(
+                user=user,
+                notification_type='mention',
+                title='در پیام منشن شدید',
+                message=f'{message.sender.get_full_name()} شما را در پیام منشن کرد',
+                content_type=content_type,
+                object_id=message.id
+            )
+            for user in users
+        ])
+        return len(users)
+
+    @staticmethod
+    def notify_members(message, content_type):
+        """Notify the room's offline members; online members get the message over the websocket"""
+        member_ids = list(ChatRoomMembership.objects.filter(
+            room_id=message.room_id,
+            is_active=True
+        ).exclude(user_id=message.sender_id).values_list('user_id', flat=True))
+        online_ids = ChatPresence.online(member_ids)
+
+        notifications = Notification.objects.bulk_create([
+            Notification(
+                user_id=user_id,
+                notification_type='mention',
+                title=f'پیام جدید در {message.room.name}',
+                message=f'{message.sender.get_full_name()}: {message.content[:100]}...',
+                content_type=content_type,
+                object_id=message.id
+            )
+            for user_id in member_ids
+            if user_id not in online_ids
+        ])
+        return len(notifications)
@@ -2,7 +2,7 @@ from rest_framework import viewsets, status, permissions
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
-from django.db.models import Q, Prefetch
+from django.db.models import F, Q, Prefetch
 from django.contrib.contenttypes.models import ContentType
 from django.utils import timezone
 from .models import ChatRoom, ChatMessage, MessageReadStatus, ChatRoomMembership
@@ -12,6 +12,7 @@ from .serializers import (
 )
 from authentication.models import CustomUser
 from common.models import Mention, Notification
+from .services import ChatBroadcast, MessageHistory, MessagePostProcessor, ReadReceiptService, RoomActivityService
 import json
 
 class ChatRoomViewSet(viewsets.ModelViewSet):
@@ -21,15 +22,13 @@ class ChatRoomViewSet(viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated]
     
     def get_queryset(self):
-        user = self.request.user
-        return ChatRoom.objects.filter(
-            memberships__user=user,
-            memberships__is_active=True
+        # نقش من و تعداد خوانده نشده‌ها در همان کوئری محاسبه می‌شوند و آخرین پیام
+        # از ستون غیرنرمال last_message خوانده می‌شود؛ ردیف پیام‌ها پیمایش نمی‌شوند
+        return ReadReceiptService.rooms_for(self.request.user).select_related(
+            'last_message__sender'
         ).prefetch_related(
-            'members',
-            'messages__sender',
             'memberships__user'
-        ).distinct()
+        ).order_by(F('last_activity_at').desc(nulls_last=True), '-id')
     
     def get_serializer_class(self):
         if self.action == 'create':
@@ -110,18 +109,20 @@ class ChatRoomViewSet(viewsets.ModelViewSet):
     
     @action(detail=True, methods=['get'])
     def messages(self, request, pk=None):
-        """پیام‌های اتاق"""
+        """پیام‌های اتاق (صفحه‌بندی با نشانگر: before/after شناسه پیام و limit)"""
         room = self.get_object()
-        page = int(request.query_params.get('page', 1))
-        page_size = int(request.query_params.get('page_size', 50))
+        try:
+            before, after, limit = MessageHistory.parse(request.query_params)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
         
-        messages = ChatMessage.objects.filter(
-            room=room,
-            is_deleted=False
-        ).select_related('sender').prefetch_related('read_status__user')[:page_size * page]
+        messages, next_cursor = MessageHistory.page(room.id, before=before, after=after, limit=limit)
         
         serializer = ChatMessageSerializer(messages, many=True, context={'request': request})
-        return Response(serializer.data)
+        return Response({
+            'results': serializer.data,
+            'next_cursor': next_cursor
+        })
     
     def _has_room_permission(self, room, user, required_role):
         """بررسی دسترسی کاربر در اتاق"""
@@ -144,7 +145,7 @@ class ChatMessageViewSet(viewsets.ModelViewSet):
             room__memberships__user=user,
             room__memberships__is_active=True,
             is_deleted=False
-        ).select_related('sender', 'room').prefetch_related('read_status__user')
+        ).select_related('sender', 'room')
     
     def perform_create(self, serializer):
         # بررسی دسترسی ارسال پیام
@@ -153,26 +154,19 @@ class ChatMessageViewSet(viewsets.ModelViewSet):
             raise permissions.PermissionDenied("You don't have permission to send messages in this room")
         
         message = serializer.save(sender=self.request.user)
+        RoomActivityService.record_message(message)
+        ChatBroadcast.send(message.room_id, 'message.new', ChatMessageSerializer(message).data)
         
-        # پردازش منشن‌ها
-        self._process_mentions(message)
-        
-        # ارسال اعلان به اعضا
-        self._notify_room_members(message)
+        # پردازش منشن‌ها و اعلان اعضا پس از ثبت تراکنش
+        MessagePostProcessor.schedule(message)
     
     @action(detail=True, methods=['post'])
     def mark_as_read(self, request, pk=None):
         """علامت‌گذاری پیام به عنوان خوانده شده"""
         message = self.get_object()
         
-        read_status, created = MessageReadStatus.objects.get_or_create(
-            message=message,
-            user=request.user
-        )
-        
-        if not created:
-            read_status.read_at = timezone.now()
-            read_status.save()
+        # پیام و همه پیام‌های قبلی اتاق خوانده شده‌اند
+        ReadReceiptService.mark_read(message.room_id, request.user, message.id)
         
         return Response({'message': 'Message marked as read'}, status=status.HTTP_200_OK)
     
@@ -191,8 +185,10 @@ class ChatMessageViewSet(viewsets.ModelViewSet):
             content=content,
             reply_to=parent_message
         )
+        RoomActivityService.record_message(reply_message)
         
         serializer = ChatMessageSerializer(reply_message, context={'request': request})
+        ChatBroadcast.send(reply_message.room_id, 'message.new', ChatMessageSerializer(reply_message).data)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
     
     @action(detail=True, methods=['post'])
@@ -214,6 +210,7 @@ class ChatMessageViewSet(viewsets.ModelViewSet):
         message.save()
         
         serializer = ChatMessageSerializer(message, context={'request': request})
+        ChatBroadcast.send(message.room_id, 'message.edited', ChatMessageSerializer(message).data)
         return Response(serializer.data)
     
     @action(detail=True, methods=['post'])
@@ -229,6 +226,10 @@ class ChatMessageViewSet(viewsets.ModelViewSet):
         message.deleted_at = timezone.now()
         message.save()
         
+        if message.room.last_message_id == message.id:
+            RoomActivityService.refresh(message.room_id)
+        ChatBroadcast.send(message.room_id, 'message.deleted', {'id': message.id})
+        
         return Response({'message': 'Message deleted'}, status=status.HTTP_200_OK)
     
     def _can_send_message(self, room, user):
@@ -246,56 +247,6 @@ class ChatMessageViewSet(viewsets.ModelViewSet):
             return membership.role in ['admin', 'moderator']
         except ChatRoomMembership.DoesNotExist:
             return False
-    
-    def _process_mentions(self, message):
-        """پردازش منشن‌ها در پیام"""
-        import re
-        
-        # پیدا کردن منشن‌ها (@username)
-        mention_pattern = r'@(\w+)'
-        mentions = re.findall(mention_pattern, message.content)
-        
-        for username in mentions:
-            try:
-                mentioned_user = CustomUser.objects.get(username=username)
-                
-                # ایجاد منشن
-                Mention.objects.create(
-                    mentioned_user=mentioned_user,
-                    content_object=message,
-                    mention_type='message',
-                    text=message.content,
-                    position=message.content.find(f'@{username}'),
-                    created_by=message.sender
-                )
-                
-                # ارسال اعلان
-                Notification.objects.create(
-                    user=mentioned_user,
-                    notification_type='mention',
-                    title=f'در پیام منشن شدید',
-                    message=f'{message.sender.get_full_name()} شما را در پیام منشن کرد',
-                    content_object=message
-                )
-                
-            except CustomUser.DoesNotExist:
-                continue
-    
-    def _notify_room_members(self, message):
-        """ارسال اعلان به اعضای اتاق"""
-        room_members = ChatRoomMembership.objects.filter(
-            room=message.room,
-            is_active=True
-        ).exclude(user=message.sender)
-        
-        for membership in room_members:
-            Notification.objects.create(
-                user=membership.user,
-                notification_type='mention',
-                title=f'پیام جدید در {message.room.name}',
-                message=f'{message.sender.get_full_name()}: {message.content[:100]}...',
-                content_object=message
-            )
 
 class MentionViewSet(viewsets.ReadOnlyModelViewSet):
     """مدیریت منشن‌ها"""
@@ -1,10 +1,21 @@
 from django.db import models
 from django.contrib.contenttypes.models import ContentType
 from django.contrib.contenttypes.fields import GenericForeignKey
+from django.contrib.postgres.fields import DateTimeRangeField
+from django.contrib.postgres.indexes import GistIndex
+from django.core.exceptions import ValidationError
 from django.core.validators import RegexValidator
 from django.utils import timezone
+from dateutil.rrule import rrulestr
 import uuid
 
+
+class TsTzRange(models.Func):
+    """tstzrange(lower, upper, bounds) در PostgreSQL؛ حد بالای NULL یعنی بی‌انتها"""
+    
+    function = 'TSTZRANGE'
+    output_field = DateTimeRangeField()
+
 class Tag(models.Model):
     """مدل برچسب‌ها"""
     
@@ -180,6 +191,14 @@ class ChatRoom(models.Model):
     is_private = models.BooleanField(default=False)
     created_by = models.ForeignKey('authentication.CustomUser', on_delete=models.CASCADE, related_name='created_rooms')
     members = models.ManyToManyField('authentication.CustomUser', through='ChatRoomMembership', related_name='chat_rooms')
+    
+    # آخرین پیام (غیرنرمال، با هر ارسال به‌روز می‌شود تا لیست اتاق‌ها پیامی نخواند؛
+    # اتاق‌های قدیمی با RoomActivityService.backfill پر می‌شوند)
+    last_message = models.ForeignKey(
+        'ChatMessage', on_delete=models.SET_NULL, null=True, blank=True, related_name='+', db_constraint=False
+    )
+    last_activity_at = models.DateTimeField(blank=True, null=True, db_index=True)
+    
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
@@ -208,6 +227,13 @@ class ChatRoomMembership(models.Model):
     invited_by = models.ForeignKey('authentication.CustomUser', on_delete=models.SET_NULL, null=True, blank=True, related_name='invited_to_rooms')
     is_active = models.BooleanField(default=True)
     
+    # واترمارک خواندن: همه پیام‌های اتاق تا این شناسه خوانده شده‌اند
+    # (فقط رو به جلو حرکت می‌کند، ReadReceiptService.mark_read)
+    last_read_message = models.ForeignKey(
+        'ChatMessage', on_delete=models.SET_NULL, null=True, blank=True, related_name='+', db_constraint=False
+    )
+    last_read_at = models.DateTimeField(blank=True, null=True)
+    
     class Meta:
         unique_together = ['room', 'user']
         verbose_name = 'عضویت اتاق چت'
@@ -249,12 +275,21 @@ class ChatMessage(models.Model):
         verbose_name = 'پیام چت'
         verbose_name_plural = 'پیام‌های چت'
         ordering = ['created_at']
+        indexes = [
+            # شمارش خوانده نشده‌ها و صفحه‌بندی تاریخچه روی بازه شناسه‌های یک اتاق
+            models.Index(fields=['room', 'id'], name='chat_message_room_id_idx'),
+        ]
     
     def __str__(self):
         return f"{self.sender.get_full_name()}: {self.content[:50]}..."
 
 class MessageReadStatus(models.Model):
-    """وضعیت خواندن پیام‌ها"""
+    """
+    وضعیت خواندن پیام‌ها (قدیمی)
+    
+    جای خود را به واترمارک ChatRoomMembership.last_read_message داده است و فقط تا
+    انتقال ردیف‌های موجود با ReadReceiptService.backfill_watermarks نگه داشته می‌شود.
+    """
     
     message = models.ForeignKey(ChatMessage, on_delete=models.CASCADE, related_name='read_status')
     user = models.ForeignKey('authentication.CustomUser', on_delete=models.CASCADE, related_name='message_reads')
@@ -339,7 +374,10 @@ class CalendarEvent(models.Model):
     end_time = models.DateTimeField()
     is_all_day = models.BooleanField(default=False)
     is_recurring = models.BooleanField(default=False)
-    recurrence_pattern = models.CharField(max_length=100, blank=True, null=True)
+    # قاعده تکرار RRULE (RFC 5545)، مثلاً FREQ=WEEKLY;BYDAY=MO,WE;COUNT=10
+    recurrence_pattern = models.CharField(max_length=255, blank=True, null=True)
+    # پایان آخرین تکرار (برای رویداد ساده همان end_time)؛ NULL یعنی تکرار بی‌پایان
+    series_end = models.DateTimeField(blank=True, null=True, editable=False)
     
     # شرکت‌کنندگان
     created_by = models.ForeignKey('authentication.CustomUser', on_delete=models.CASCADE, related_name='created_events')
@@ -360,9 +398,65 @@ class CalendarEvent(models.Model):
         verbose_name = 'رویداد تقویم'
         verbose_name_plural = 'رویدادهای تقویم'
         ordering = ['start_time']
+        indexes = [
+            # بازه کل سری؛ جستجوی رویدادهای هم‌پوشان با یک پنجره (&&) روی این ایندکس
+            GistIndex(TsTzRange('start_time', 'series_end', models.Value('[]')), name='calendar_event_span_gist'),
+        ]
     
     def __str__(self):
         return self.title
+    
+    @classmethod
+    def span(cls):
+        """عبارت بازه سری، همان عبارت ایندکس calendar_event_span_gist"""
+        return TsTzRange('start_time', 'series_end', models.Value('[]'))
+    
+    @property
+    def duration(self):
+        return self.end_time - self.start_time
+    
+    @property
+    def has_recurrence(self):
+        return bool(self.is_recurring and self.recurrence_pattern)
+    
+    def get_rrule(self):
+        """قاعده تکرار با شروع از start_time (به وقت محلی)"""
+        try:
+            return rrulestr(self.recurrence_pattern, dtstart=timezone.localtime(self.start_time))
+        except (ValueError, TypeError) as e:
+            raise ValidationError({'recurrence_pattern': f'قاعده تکرار نامعتبر است: {e}'})
+    
+    def compute_series_end(self):
+        if not self.has_recurrence:
+            return self.end_time
+        rule = self.get_rrule()
+        pattern = self.recurrence_pattern.upper()
+        if 'COUNT=' not in pattern and 'UNTIL=' not in pattern:
+            return None
+        if not rule.count():
+            return self.end_time
+        return rule[-1] + self.duration
+    
+    def occurrences(self, window_start, window_end):
+        """زمان شروع تکرارهایی که با پنجره [window_start, window_end) هم‌پوشانی دارند"""
+        if not self.has_recurrence:
+            if self.start_time < window_end and self.end_time > window_start:
+                return [self.start_time]
+            return []
+        return self.get_rrule().between(window_start - self.duration, window_end, inc=False)
+    
+    def validate_schedule(self):
+        """بازه زمانی و قاعده تکرار؛ در صورت نامعتبر بودن ValidationError"""
+        if self.end_time < self.start_time:
+            raise ValidationError({'end_time': 'زمان پایان نباید قبل از زمان شروع باشد'})
+        if self.has_recurrence:
+            self.get_rrule()
+    
+    def save(self, *args, **kwargs):
+        # API پیش از ذخیره اعتبارسنجی می‌کند (۴۰۰)؛ این آخرین محافظ است
+        self.validate_schedule()
+        self.series_end = self.compute_series_end()
+        super().save(*args, **kwargs)
 
 class EventAttendance(models.Model):
     """حضور در رویدادها"""
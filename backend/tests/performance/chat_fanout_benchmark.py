@@ -0,0 +1,104 @@
+"""
+Post-processing cost of chat messages in large rooms: the previous
+per-mention / per-member creates against MessagePostProcessor.
+
+    DJANGO_SETTINGS_MODULE=crm_erp.settings python tests/performance/chat_fanout_benchmark.py --members 500
+
+Everything runs in a transaction that is rolled back at the end.
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+import django
+
+django.setup()
+
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from authentication.models import CustomUser
+from chat.services import MENTION_PATTERN, MessagePostProcessor
+from common.models import ChatMessage, ChatRoom, ChatRoomMembership, Mention, Notification
+
+
+def legacy_process(message):
+    """The previous implementation: a lookup per mention and a create per mention and member"""
+    for username in MENTION_PATTERN.findall(message.content):
+        try:
+            mentioned_user = CustomUser.objects.get(username=username)
+            Mention.objects.create(
+                mentioned_user=mentioned_user,
+                content_object=message,
+                mention_type='message',
+                text=message.content,
+                position=message.content.find(f'@{username}'),
+                created_by=message.sender
+            )
+            Notification.objects.create(
+                user=mentioned_user,
+                notification_type='mention',
+                title='در پیام منشن شدید',
+                message=f'{message.sender.get_full_name()} شما را در پیام منشن کرد',
+                content_object=message
+            )
+        except CustomUser.DoesNotExist:
+            continue
+
+    for membership in ChatRoomMembership.objects.filter(room=message.room, is_active=True).exclude(user=message.sender):
+        Notification.objects.create(
+            user=membership.user,
+            notification_type='mention',
+            title=f'پیام جدید در {message.room.name}',
+            message=f'{message.sender.get_full_name()}: {message.content[:100]}...',
+            content_object=message
+        )
+
+
+def new_process(message):
+    MessagePostProcessor.process(message)
+
+
+def run(name, process, room, sender, mentions, count):
+    queries = 0
+    started = time.perf_counter()
+    for index in range(count):
+        message = ChatMessage.objects.create(
+            room=room, sender=sender, content=f'پیام {index} ' + ' '.join(f'@{username}' for username in mentions)
+        )
+        with CaptureQueriesContext(connection) as captured:
+            process(message)
+        queries += len(captured)
+    elapsed = time.perf_counter() - started
+    print(f'{name:<8} {elapsed * 1000 / count:>9.1f} ms/message  {queries / count:>7.1f} queries/message')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--members', type=int, default=500, help='Members of the room')
+    parser.add_argument('--mentions', type=int, default=10, help='@mentions per message')
+    parser.add_argument('--messages', type=int, default=20, help='Messages posted per implementation')
+    options = parser.parse_args()
+
+    with transaction.atomic():
+        run_id = int(time.time())
+        CustomUser.objects.bulk_create([
+            CustomUser(username=f'bench_{run_id}_{index}', email=f'bench_{run_id}_{index}@example.com')
+            for index in range(options.members)
+        ])
+        users = list(CustomUser.objects.filter(username__startswith=f'bench_{run_id}_').order_by('id'))
+        room = ChatRoom.objects.create(name=f'benchmark {run_id}', created_by=users[0])
+        ChatRoomMembership.objects.bulk_create([ChatRoomMembership(room=room, user=user) for user in users])
+        mentions = [user.username for user in users[1:options.mentions + 1]]
+
+        print(f'{options.members} members, {len(mentions)} mentions, {options.messages} messages (all members offline)')
+        run('legacy', legacy_process, room, users[0], mentions, options.messages)
+        run('bulk', new_process, room, users[0], mentions, options.messages)
+
+        transaction.set_rollback(True)
+
+
+if __name__ == '__main__':
+    main()
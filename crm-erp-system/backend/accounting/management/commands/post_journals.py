@@ -0,0 +1,53 @@
+from django.core.management.base import BaseCommand, CommandError
+from accounting.models import FiscalYear, Journal
+from accounting.services import JournalPostingService
+
+
+class Command(BaseCommand):
+    help = 'Post all unposted journals of a fiscal year to the ledger in bulk'
+
+    def add_arguments(self, parser):
+        parser.add_argument('fiscal_year_id', type=int, help='Fiscal year to post')
+        parser.add_argument('--date-to', help='Only post journals dated on or before this date (YYYY-MM-DD)')
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=5000,
+            help='Number of journals posted per transaction',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            fiscal_year = FiscalYear.objects.get(pk=options['fiscal_year_id'])
+        except FiscalYear.DoesNotExist:
+            raise CommandError(f"Fiscal year {options['fiscal_year_id']} does not exist")
+
+        journals = Journal.objects.filter(fiscal_year=fiscal_year, is_posted=False)
+        if options['date_to']:
+            journals = journals.filter(date__lte=options['date_to'])
+        journal_ids = list(journals.order_by('date', 'pk').values_list('pk', flat=True))
+
+        service = JournalPostingService()
+        chunk_size = options['chunk_size']
+        posted = ledger_entries = 0
+        duration = 0.0
+        skipped = {}
+
+        for start in range(0, len(journal_ids), chunk_size):
+            result = service.post(journal_ids[start:start + chunk_size])
+            posted += result['posted']
+            ledger_entries += result['ledger_entries']
+            duration += result['duration_seconds']
+            skipped.update(result['skipped'])
+            self.stdout.write(f"Posted {posted}/{len(journal_ids)} journals")
+
+        for journal_number, reason in skipped.items():
+            self.stdout.write(self.style.WARNING(f'Skipped {journal_number}: {reason}'))
+
+        rate = posted / duration if duration else 0
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Posted {posted} journals ({ledger_entries} ledger entries) '
+                f'in {duration:.2f}s - {rate:.1f} journals/sec'
+            )
+        )
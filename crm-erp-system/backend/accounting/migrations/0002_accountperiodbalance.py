@@ -0,0 +1,65 @@
+# Generated by Django 5.2.6 on 2026-10-16 22:36
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Sum
+from django.db.models.functions import ExtractMonth, ExtractYear
+
+
+def backfill_period_balances(apps, schema_editor):
+    Ledger = apps.get_model('accounting', 'Ledger')
+    AccountPeriodBalance = apps.get_model('accounting', 'AccountPeriodBalance')
+
+    totals = Ledger.objects.annotate(
+        period_year=ExtractYear('date'),
+        period_month=ExtractMonth('date'),
+    ).values('account_id', 'fiscal_year_id', 'period_year', 'period_month').annotate(
+        debit=Sum('debit_amount'),
+        credit=Sum('credit_amount'),
+    ).order_by()
+
+    AccountPeriodBalance.objects.bulk_create(
+        (
+            AccountPeriodBalance(
+                account_id=row['account_id'],
+                fiscal_year_id=row['fiscal_year_id'],
+                year=row['period_year'],
+                month=row['period_month'],
+                debit_total=row['debit'] or 0,
+                credit_total=row['credit'] or 0,
+            )
+            for row in totals.iterator()
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounting', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AccountPeriodBalance',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('year', models.PositiveSmallIntegerField(verbose_name='سال')),
+                ('month', models.PositiveSmallIntegerField(verbose_name='ماه')),
+                ('debit_total', models.DecimalField(decimal_places=2, default=0, max_digits=18, verbose_name='گردش بدهکار')),
+                ('credit_total', models.DecimalField(decimal_places=2, default=0, max_digits=18, verbose_name='گردش بستانکار')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='آخرین بروزرسانی')),
+                ('account', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='period_balances', to='accounting.chartofaccounts', verbose_name='حساب')),
+                ('fiscal_year', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='period_balances', to='accounting.fiscalyear', verbose_name='سال مالی')),
+            ],
+            options={
+                'verbose_name': 'گردش دوره\u200cای حساب',
+                'verbose_name_plural': 'گردش دوره\u200cای حساب\u200cها',
+                'ordering': ['fiscal_year', 'year', 'month', 'account'],
+                'indexes': [models.Index(fields=['fiscal_year', 'year', 'month'], name='accounting__fiscal__eaf6c9_idx')],
+                'unique_together': {('account', 'fiscal_year', 'year', 'month')},
+            },
+        ),
+        migrations.RunPython(backfill_period_balances, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 5.2.6 on 2026-10-16 22:39
+
+from django.db import migrations, models
+
+
+def build_paths(model, parent_field):
+    parents = dict(model.objects.values_list('id', f'{parent_field}_id'))
+
+    def path_of(node_id, seen=()):
+        parent_id = parents.get(node_id)
+        if parent_id is None or parent_id in seen:
+            return f"/{node_id}/"
+        return f"{path_of(parent_id, seen + (node_id,))}{node_id}/"
+
+    nodes = list(model.objects.only('id', 'path', 'level'))
+    for node in nodes:
+        node.path = path_of(node.id)
+        node.level = node.path.count('/') - 1
+    model.objects.bulk_update(nodes, ['path', 'level'], batch_size=1000)
+
+
+def populate_paths(apps, schema_editor):
+    build_paths(apps.get_model('accounting', 'ChartOfAccounts'), 'parent_account')
+    build_paths(apps.get_model('accounting', 'CostCenter'), 'parent')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounting', '0002_accountperiodbalance'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chartofaccounts',
+            name='path',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=255, verbose_name='مسیر'),
+        ),
+        migrations.AddField(
+            model_name='costcenter',
+            name='level',
+            field=models.PositiveIntegerField(default=1, verbose_name='سطح'),
+        ),
+        migrations.AddField(
+            model_name='costcenter',
+            name='path',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=255, verbose_name='مسیر'),
+        ),
+        migrations.RunPython(populate_paths, migrations.RunPython.noop),
+    ]
@@ -1,9 +1,106 @@
 from django.db import models
+from django.db.models import F, Value
+from django.db.models.functions import Concat, Substr
+from django.core.exceptions import ValidationError
 from django.core.validators import MinValueValidator
 from django.utils import timezone
 
 
-class ChartOfAccounts(models.Model):
+class MaterializedPathModel(models.Model):
+    """
+    ساختار درختی با مسیر مادی‌شده
+
+    path شامل شناسه همه اجداد و خود رکورد است (مثلاً /1/5/12/) و در save
+    نگهداری می‌شود، بنابراین زیردرخت، اجداد و کل درخت هر کدام با یک کوئری
+    خوانده می‌شوند.
+    """
+
+    parent_field = 'parent'
+
+    path = models.CharField(
+        max_length=255,
+        blank=True,
+        default='',
+        editable=False,
+        db_index=True,
+        verbose_name='مسیر'
+    )
+
+    class Meta:
+        abstract = True
+
+    @property
+    def path_ids(self):
+        """شناسه اجداد و خود رکورد از ریشه"""
+        return [int(node_id) for node_id in self.path.strip('/').split('/') if node_id]
+
+    def build_path(self):
+        parent = getattr(self, self.parent_field)
+        prefix = parent.path if parent else '/'
+        return f"{prefix}{self.pk}/"
+
+    def check_parent(self):
+        """جلوگیری از ایجاد حلقه: والد نمی‌تواند خود رکورد یا یکی از نوادگان آن باشد"""
+        parent_id = getattr(self, f"{self.parent_field}_id")
+        if parent_id is None or self.pk is None or not self.path:
+            return
+        parent_path = type(self).objects.filter(pk=parent_id).values_list('path', flat=True).first() or ''
+        if parent_id == self.pk or parent_path.startswith(self.path):
+            raise ValidationError('والد نمی‌تواند خود رکورد یا یکی از زیرمجموعه‌های آن باشد')
+
+    def save(self, *args, **kwargs):
+        self.check_parent()
+        old_path = self.path
+        old_level = self.level
+        super().save(*args, **kwargs)
+
+        new_path = self.build_path()
+        if new_path == old_path:
+            return
+
+        model = type(self)
+        new_level = new_path.count('/') - 1
+        model.objects.filter(pk=self.pk).update(path=new_path, level=new_level)
+
+        # جابجایی در درخت: مسیر همه نوادگان با یک UPDATE اصلاح می‌شود
+        if old_path:
+            model.objects.filter(path__startswith=old_path).exclude(pk=self.pk).update(
+                path=Concat(Value(new_path), Substr('path', len(old_path) + 1)),
+                level=F('level') + (new_level - old_level),
+            )
+
+        self.path = new_path
+        self.level = new_level
+
+    def get_ancestors(self):
+        return type(self).objects.filter(pk__in=self.path_ids[:-1]).order_by('level')
+
+    def get_descendants(self, include_self=False):
+        queryset = type(self).objects.filter(path__startswith=self.path)
+        if not include_self:
+            queryset = queryset.exclude(pk=self.pk)
+        return queryset
+
+    @classmethod
+    def build_tree(cls, nodes):
+        """ساخت درخت تو در تو از لیست دیکشنری‌ها (شامل id و <parent_field>_id) در حافظه"""
+        parent_key = f"{cls.parent_field}_id"
+        by_id = {}
+        for node in nodes:
+            node['children'] = []
+            by_id[node['id']] = node
+
+        roots = []
+        for node in by_id.values():
+            parent = by_id.get(node[parent_key])
+            if parent is None:
+                roots.append(node)
+            else:
+                parent['children'].append(node)
+        return roots
+
+
+class ChartOfAccounts(MaterializedPathModel):
     """کدینگ حسابداری - مطابق استاندارد ایران"""
     
     ACCOUNT_TYPES = [
@@ -19,6 +116,8 @@ class ChartOfAccounts(models.Model):
         ('credit', 'بستانکار'),
     ]
     
+    parent_field = 'parent_account'
+    
     # کدینگ 4 رقمی مطابق استاندارد ایران
     account_code = models.CharField(
         max_length=10, 
@@ -69,15 +168,23 @@ class ChartOfAccounts(models.Model):
     def __str__(self):
         return f"{self.account_code} - {self.account_name}"
     
+    def save(self, *args, **kwargs):
+        path_ids = self.path_ids
+        old_parent_id = path_ids[-2] if len(path_ids) > 1 else None
+        super().save(*args, **kwargs)
+        
+        # حساب والد دیگر حساب نهایی نیست
+        if self.parent_account_id:
+            ChartOfAccounts.objects.filter(pk=self.parent_account_id, is_leaf=True).update(is_leaf=False)
+        if old_parent_id and old_parent_id != self.parent_account_id:
+            if not ChartOfAccounts.objects.filter(parent_account_id=old_parent_id).exists():
+                ChartOfAccounts.objects.filter(pk=old_parent_id).update(is_leaf=True)
+    
     @property
     def full_path(self):
         """مسیر کامل حساب"""
-        path = [f"{self.account_code} - {self.account_name}"]
-        current = self.parent_account
-        while current:
-            path.insert(0, f"{current.account_code} - {current.account_name}")
-            current = current.parent_account
-        return ' > '.join(path)
+        nodes = list(self.get_ancestors()) + [self]
+        return ' > '.join(f"{node.account_code} - {node.account_name}" for node in nodes)
 
 
 class FiscalYear(models.Model):
@@ -344,7 +451,51 @@ class TrialBalance(models.Model):
         return f"{self.fiscal_year.name} - {self.account.account_name}"
 
 
-class CostCenter(models.Model):
+class AccountPeriodBalance(models.Model):
+    """گردش ماهانه حساب‌ها - با ثبت هر سند به‌روز می‌شود"""
+
+    account = models.ForeignKey(
+        ChartOfAccounts,
+        on_delete=models.CASCADE,
+        related_name='period_balances',
+        verbose_name='حساب'
+    )
+    fiscal_year = models.ForeignKey(
+        FiscalYear,
+        on_delete=models.CASCADE,
+        related_name='period_balances',
+        verbose_name='سال مالی'
+    )
+    year = models.PositiveSmallIntegerField(verbose_name='سال')
+    month = models.PositiveSmallIntegerField(verbose_name='ماه')
+    debit_total = models.DecimalField(
+        max_digits=18,
+        decimal_places=2,
+        default=0,
+        verbose_name='گردش بدهکار'
+    )
+    credit_total = models.DecimalField(
+        max_digits=18,
+        decimal_places=2,
+        default=0,
+        verbose_name='گردش بستانکار'
+    )
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='آخرین بروزرسانی')
+
+    class Meta:
+        verbose_name = 'گردش دوره‌ای حساب'
+        verbose_name_plural = 'گردش دوره‌ای حساب‌ها'
+        ordering = ['fiscal_year', 'year', 'month', 'account']
+        unique_together = ['account', 'fiscal_year', 'year', 'month']
+        indexes = [
+            models.Index(fields=['fiscal_year', 'year', 'month']),
+        ]
+
+    def __str__(self):
+        return f"{self.account.account_code} - {self.year}/{self.month:02d}"
+
+
+class CostCenter(MaterializedPathModel):
     """مرکز هزینه"""
     
     code = models.CharField(max_length=20, unique=True, verbose_name='کد مرکز هزینه')
@@ -357,6 +508,7 @@ class CostCenter(models.Model):
         related_name='sub_centers',
         verbose_name='مرکز والد'
     )
+    level = models.PositiveIntegerField(default=1, verbose_name='سطح')
     is_active = models.BooleanField(default=True, verbose_name='فعال')
     description = models.TextField(blank=True, null=True, verbose_name='توضیحات')
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='تاریخ ایجاد')
@@ -368,6 +520,12 @@ class CostCenter(models.Model):
     
     def __str__(self):
         return f"{self.code} - {self.name}"
+    
+    @property
+    def full_path(self):
+        """مسیر کامل مرکز هزینه"""
+        nodes = list(self.get_ancestors()) + [self]
+        return ' > '.join(node.name for node in nodes)
 
 
 class BankAccount(models.Model):
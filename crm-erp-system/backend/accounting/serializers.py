@@ -5,6 +5,13 @@ from .models import (
 )
 
 
+def validate_tree_parent(instance, parent):
+    """والد جدید نباید خود رکورد یا یکی از نوادگان آن باشد"""
+    if instance is not None and parent is not None and instance.path and parent.path.startswith(instance.path):
+        raise serializers.ValidationError('والد نمی‌تواند خود رکورد یا یکی از زیرمجموعه‌های آن باشد')
+    return parent
+
+
 class FiscalYearSerializer(serializers.ModelSerializer):
     is_active = serializers.ReadOnlyField()
     
@@ -22,16 +29,14 @@ class ChartOfAccountsSerializer(serializers.ModelSerializer):
     account_type_display = serializers.CharField(source='get_account_type_display', read_only=True)
     parent_account_name = serializers.CharField(source='parent_account.account_name', read_only=True)
     level = serializers.ReadOnlyField()
-    has_children = serializers.ReadOnlyField()
     
     class Meta:
         model = ChartOfAccounts
         fields = '__all__'
-        read_only_fields = ('created_at', 'created_by')
+        read_only_fields = ('created_at', 'path', 'is_leaf')
     
-    def create(self, validated_data):
-        validated_data['created_by'] = self.context['request'].user
-        return super().create(validated_data)
+    def validate_parent_account(self, value):
+        return validate_tree_parent(self.instance, value)
 
 
 class JournalSerializer(serializers.ModelSerializer):
@@ -107,18 +112,16 @@ class TrialBalanceSerializer(serializers.ModelSerializer):
 
 
 class CostCenterSerializer(serializers.ModelSerializer):
-    parent_center_name = serializers.CharField(source='parent_center.name', read_only=True)
+    parent_name = serializers.CharField(source='parent.name', read_only=True)
     level = serializers.ReadOnlyField()
-    has_children = serializers.ReadOnlyField()
     
     class Meta:
         model = CostCenter
         fields = '__all__'
-        read_only_fields = ('created_at', 'created_by')
+        read_only_fields = ('created_at', 'path')
     
-    def create(self, validated_data):
-        validated_data['created_by'] = self.context['request'].user
-        return super().create(validated_data)
+    def validate_parent(self, value):
+        return validate_tree_parent(self.instance, value)
 
 
 class BankAccountSerializer(serializers.ModelSerializer):
@@ -0,0 +1,269 @@
+from collections import defaultdict
+from decimal import Decimal
+import time
+from django.db import transaction
+from django.db.models import Sum
+from django.db.models.functions import ExtractMonth, ExtractYear
+from django.utils import timezone
+from .models import AccountPeriodBalance, ChartOfAccounts, Journal, JournalEntry, Ledger, TrialBalance
+import logging
+
+logger = logging.getLogger(__name__)
+
+ZERO = Decimal('0')
+
+
+class PeriodBalanceService:
+    """Maintains the per-account / per-month turnover table (AccountPeriodBalance)"""
+
+    @staticmethod
+    def lock_periods(period_keys):
+        """
+        Create any missing (account, fiscal year, year, month) rows and lock
+        every period row of the affected accounts, in sorted key order so
+        concurrent postings queue behind each other instead of deadlocking.
+        Must be called inside a transaction.
+        """
+        AccountPeriodBalance.objects.bulk_create(
+            [
+                AccountPeriodBalance(account_id=account_id, fiscal_year_id=fiscal_year_id, year=year, month=month)
+                for account_id, fiscal_year_id, year, month in sorted(period_keys)
+            ],
+            ignore_conflicts=True,
+        )
+        accounts = {(key[0], key[1]) for key in period_keys}
+        rows = AccountPeriodBalance.objects.select_for_update().filter(
+            account_id__in={key[0] for key in accounts},
+            fiscal_year_id__in={key[1] for key in accounts},
+        ).order_by('account_id', 'fiscal_year_id', 'year', 'month')
+        return [row for row in rows if (row.account_id, row.fiscal_year_id) in accounts]
+
+    @classmethod
+    def apply_ledger_entries(cls, ledger_entries):
+        """
+        Add freshly posted ledger lines to the monthly balances.
+
+        Deltas are grouped in memory first, so the cost is one insert, one
+        locked select and one bulk update regardless of the number of lines.
+        """
+        deltas = defaultdict(lambda: [ZERO, ZERO])
+        for entry in ledger_entries:
+            key = (entry.account_id, entry.fiscal_year_id, entry.date.year, entry.date.month)
+            deltas[key][0] += entry.debit_amount
+            deltas[key][1] += entry.credit_amount
+
+        if not deltas:
+            return 0
+
+        with transaction.atomic():
+            now = timezone.now()
+            changed = []
+            for row in cls.lock_periods(deltas):
+                delta = deltas.get((row.account_id, row.fiscal_year_id, row.year, row.month))
+                if delta is None:
+                    continue
+                row.debit_total += delta[0]
+                row.credit_total += delta[1]
+                row.updated_at = now
+                changed.append(row)
+
+            AccountPeriodBalance.objects.bulk_update(changed, ['debit_total', 'credit_total', 'updated_at'])
+
+        return len(changed)
+
+    @staticmethod
+    def rebuild(fiscal_year):
+        """Recompute the monthly balances of a fiscal year from the ledger in one grouped query"""
+        totals = Ledger.objects.filter(fiscal_year=fiscal_year).annotate(
+            period_year=ExtractYear('date'),
+            period_month=ExtractMonth('date'),
+        ).values('account_id', 'period_year', 'period_month').annotate(
+            debit=Sum('debit_amount'),
+            credit=Sum('credit_amount'),
+        ).order_by()
+
+        rows = [
+            AccountPeriodBalance(
+                account_id=row['account_id'],
+                fiscal_year=fiscal_year,
+                year=row['period_year'],
+                month=row['period_month'],
+                debit_total=row['debit'] or ZERO,
+                credit_total=row['credit'] or ZERO,
+            )
+            for row in totals
+        ]
+
+        with transaction.atomic():
+            AccountPeriodBalance.objects.filter(fiscal_year=fiscal_year).delete()
+            AccountPeriodBalance.objects.bulk_create(rows, batch_size=1000)
+
+        logger.info(f"Rebuilt {len(rows)} period balances for fiscal year {fiscal_year.pk}")
+        return len(rows)
+
+
+class TrialBalanceService:
+    """Set-based trial balance generation"""
+
+    @staticmethod
+    def account_totals(fiscal_year):
+        """Debit/credit turnover per account, read from the monthly balance table"""
+        totals = AccountPeriodBalance.objects.filter(fiscal_year=fiscal_year).values('account_id').annotate(
+            debit=Sum('debit_total'),
+            credit=Sum('credit_total'),
+        ).order_by()
+        return {row['account_id']: (row['debit'] or ZERO, row['credit'] or ZERO) for row in totals}
+
+    @staticmethod
+    def roll_up(totals, parents):
+        """Add every account's totals to all of its ancestors (parents: account id -> parent id)"""
+        rolled = defaultdict(lambda: [ZERO, ZERO])
+        for account_id, (debit, credit) in totals.items():
+            seen = set()
+            while account_id is not None and account_id not in seen:
+                seen.add(account_id)
+                rolled[account_id][0] += debit
+                rolled[account_id][1] += credit
+                account_id = parents.get(account_id)
+        return rolled
+
+    @classmethod
+    def generate(cls, fiscal_year, rebuild=False):
+        """Regenerate the trial balance of a fiscal year; returns the number of rows written"""
+        if rebuild:
+            PeriodBalanceService.rebuild(fiscal_year)
+
+        accounts = ChartOfAccounts.objects.values_list('id', 'parent_account_id', 'is_active')
+        parents = {}
+        active_ids = []
+        for account_id, parent_id, is_active in accounts:
+            parents[account_id] = parent_id
+            if is_active:
+                active_ids.append(account_id)
+
+        rolled = cls.roll_up(cls.account_totals(fiscal_year), parents)
+
+        rows = [
+            TrialBalance(
+                fiscal_year=fiscal_year,
+                account_id=account_id,
+                debit_balance=rolled[account_id][0] if account_id in rolled else ZERO,
+                credit_balance=rolled[account_id][1] if account_id in rolled else ZERO,
+            )
+            for account_id in active_ids
+        ]
+
+        with transaction.atomic():
+            TrialBalance.objects.filter(fiscal_year=fiscal_year).delete()
+            TrialBalance.objects.bulk_create(rows, batch_size=1000)
+
+        return len(rows)
+
+
+class JournalPostingService:
+    """Posts journals to the ledger in bulk"""
+
+    def __init__(self, user=None, batch_size=1000):
+        self.user = user
+        self.batch_size = batch_size
+
+    def opening_balances(self, period_keys):
+        """
+        Current balance per (account, fiscal year) of the period keys.
+
+        The period rows are locked before they are summed, so a concurrent
+        posting to the same accounts waits for this one to commit and then
+        starts from the updated balance.
+        """
+        balances = {}
+        for row in PeriodBalanceService.lock_periods(period_keys):
+            key = (row.account_id, row.fiscal_year_id)
+            balances[key] = balances.get(key, ZERO) + row.debit_total - row.credit_total
+        return balances
+
+    def post(self, journal_ids):
+        """
+        Post the given unposted journals in a single transaction.
+
+        Journals are locked, their entries read in one query, ledger rows
+        get a running balance per account from one ordered pass and are
+        written with bulk_create. Returns a summary with throughput.
+        """
+        started = time.monotonic()
+        skipped = {}
+
+        with transaction.atomic():
+            journals = list(
+                Journal.objects.select_for_update()
+                .filter(pk__in=journal_ids, is_posted=False)
+                .order_by('date', 'pk')
+            )
+
+            entries_by_journal = defaultdict(list)
+            entries = JournalEntry.objects.filter(journal__in=journals).order_by(
+                'journal_id', 'sort_order', 'pk'
+            ).values_list('journal_id', 'account_id', 'description', 'debit_amount', 'credit_amount')
+            for journal_id, *entry in entries:
+                entries_by_journal[journal_id].append(entry)
+
+            to_post = []
+            for journal in journals:
+                lines = entries_by_journal.get(journal.pk)
+                if not lines:
+                    skipped[journal.journal_number] = 'سند بدون آیتم است'
+                    continue
+                total_debit = sum((line[2] for line in lines), ZERO)
+                total_credit = sum((line[3] for line in lines), ZERO)
+                if total_debit != total_credit:
+                    skipped[journal.journal_number] = 'مجموع بدهکار و بستانکار برابر نیست'
+                    continue
+                journal.total_debit = total_debit
+                journal.total_credit = total_credit
+                to_post.append(journal)
+
+            running = self.opening_balances({
+                (line[0], journal.fiscal_year_id, journal.date.year, journal.date.month)
+                for journal in to_post
+                for line in entries_by_journal[journal.pk]
+            })
+
+            ledger_rows = []
+            for journal in to_post:
+                for account_id, description, debit, credit in entries_by_journal[journal.pk]:
+                    key = (account_id, journal.fiscal_year_id)
+                    running[key] = running.get(key, ZERO) + debit - credit
+                    ledger_rows.append(Ledger(
+                        account_id=account_id,
+                        fiscal_year_id=journal.fiscal_year_id,
+                        date=journal.date,
+                        journal=journal,
+                        description=description,
+                        debit_amount=debit,
+                        credit_amount=credit,
+                        balance=running[key],
+                    ))
+
+            Ledger.objects.bulk_create(ledger_rows, batch_size=self.batch_size)
+            PeriodBalanceService.apply_ledger_entries(ledger_rows)
+
+            now = timezone.now()
+            for journal in to_post:
+                journal.is_posted = True
+                journal.posted_by = self.user
+                journal.posted_at = now
+            Journal.objects.bulk_update(
+                to_post,
+                ['is_posted', 'posted_by', 'posted_at', 'total_debit', 'total_credit'],
+                batch_size=self.batch_size,
+            )
+
+        duration = time.monotonic() - started
+        result = {
+            'posted': len(to_post),
+            'ledger_entries': len(ledger_rows),
+            'skipped': skipped,
+            'duration_seconds': round(duration, 3),
+            'journals_per_second': round(len(to_post) / duration, 1) if duration > 0 else None,
+        }
+        logger.info(f"Posted {result['posted']} journals ({result['ledger_entries']} ledger lines) in {duration:.3f}s")
+        return result
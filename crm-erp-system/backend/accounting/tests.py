@@ -1,3 +1,270 @@
+import pytest
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
 from django.test import TestCase
+from rest_framework.test import APIClient
+from decimal import Decimal
+from datetime import date
+from .models import (
+    BankAccount, ChartOfAccounts, CostCenter, FiscalYear, Journal, JournalEntry, Ledger, AccountPeriodBalance, TrialBalance
+)
+from .services import JournalPostingService, PeriodBalanceService, TrialBalanceService
 
-# Create your tests here.
+
+def create_account(code, parent=None, **kwargs):
+    return ChartOfAccounts.objects.create(
+        account_code=code,
+        account_name=f"حساب {code}",
+        account_type=kwargs.pop('account_type', 'asset'),
+        balance_type=kwargs.pop('balance_type', 'debit'),
+        parent_account=parent,
+        **kwargs
+    )
+
+
+@pytest.mark.unit
+class TrialBalanceServiceTest(TestCase):
+    def setUp(self):
+        self.fiscal_year = FiscalYear.objects.create(
+            name="1403", start_date=date(2024, 3, 20), end_date=date(2025, 3, 20)
+        )
+        self.journal = Journal.objects.create(
+            journal_number="J-1", fiscal_year=self.fiscal_year, date=date(2024, 4, 1), description="سند تست"
+        )
+        self.root = create_account("1000")
+        self.group = create_account("1100", parent=self.root)
+        self.cash = create_account("1101", parent=self.group)
+        self.bank = create_account("1102", parent=self.group)
+
+    def post_lines(self, *lines):
+        entries = [
+            Ledger.objects.create(
+                account=account,
+                fiscal_year=self.fiscal_year,
+                date=entry_date,
+                journal=self.journal,
+                description="",
+                debit_amount=Decimal(debit),
+                credit_amount=Decimal(credit),
+            )
+            for account, entry_date, debit, credit in lines
+        ]
+        PeriodBalanceService.apply_ledger_entries(entries)
+        return entries
+
+    def test_apply_ledger_entries_accumulates_per_month(self):
+        """Test incremental posting groups lines by account and month"""
+        self.post_lines(
+            (self.cash, date(2024, 4, 1), "100", "0"),
+            (self.cash, date(2024, 4, 15), "50", "0"),
+            (self.cash, date(2024, 5, 1), "0", "30"),
+        )
+        self.post_lines((self.cash, date(2024, 4, 20), "25", "0"))
+
+        april = AccountPeriodBalance.objects.get(account=self.cash, year=2024, month=4)
+        may = AccountPeriodBalance.objects.get(account=self.cash, year=2024, month=5)
+        self.assertEqual(april.debit_total, Decimal("175"))
+        self.assertEqual(may.credit_total, Decimal("30"))
+
+    def test_generate_rolls_up_hierarchy(self):
+        """Test totals are rolled up to every ancestor account"""
+        self.post_lines(
+            (self.cash, date(2024, 4, 1), "100", "0"),
+            (self.bank, date(2024, 6, 1), "0", "40"),
+        )
+
+        count = TrialBalanceService.generate(self.fiscal_year)
+
+        self.assertEqual(count, 4)
+        group_row = TrialBalance.objects.get(fiscal_year=self.fiscal_year, account=self.group)
+        root_row = TrialBalance.objects.get(fiscal_year=self.fiscal_year, account=self.root)
+        self.assertEqual(group_row.debit_balance, Decimal("100"))
+        self.assertEqual(group_row.credit_balance, Decimal("40"))
+        self.assertEqual(root_row.debit_balance, Decimal("100"))
+
+    def test_rebuild_matches_incremental(self):
+        """Test rebuilding from the ledger gives the same balances"""
+        self.post_lines(
+            (self.cash, date(2024, 4, 1), "100", "0"),
+            (self.bank, date(2024, 4, 2), "0", "100"),
+        )
+        before = TrialBalanceService.account_totals(self.fiscal_year)
+
+        PeriodBalanceService.rebuild(self.fiscal_year)
+
+        self.assertEqual(TrialBalanceService.account_totals(self.fiscal_year), before)
+
+
+@pytest.mark.unit
+class JournalPostingServiceTest(TestCase):
+    def setUp(self):
+        self.fiscal_year = FiscalYear.objects.create(
+            name="1403", start_date=date(2024, 3, 20), end_date=date(2025, 3, 20)
+        )
+        self.cash = create_account("1101")
+        self.sales = create_account("4101", account_type='revenue', balance_type='credit')
+
+    def create_journal(self, number, entry_date, amount, credit_amount=None):
+        journal = Journal.objects.create(
+            journal_number=number, fiscal_year=self.fiscal_year, date=entry_date, description="فروش"
+        )
+        JournalEntry.objects.create(
+            journal=journal, account=self.cash, description="", debit_amount=Decimal(amount), sort_order=1
+        )
+        JournalEntry.objects.create(
+            journal=journal, account=self.sales, description="",
+            credit_amount=Decimal(credit_amount or amount), sort_order=2
+        )
+        return journal
+
+    def test_post_creates_ledger_with_running_balance(self):
+        """Test bulk posting writes ledger rows with running balances per account"""
+        first = self.create_journal("J-1", date(2024, 4, 1), "100")
+        second = self.create_journal("J-2", date(2024, 4, 2), "50")
+
+        result = JournalPostingService().post([second.pk, first.pk])
+
+        self.assertEqual(result['posted'], 2)
+        self.assertEqual(result['ledger_entries'], 4)
+        balances = list(
+            Ledger.objects.filter(account=self.cash).order_by('date').values_list('balance', flat=True)
+        )
+        self.assertEqual(balances, [Decimal("100"), Decimal("150")])
+        self.assertTrue(Journal.objects.get(pk=first.pk).is_posted)
+        self.assertEqual(
+            AccountPeriodBalance.objects.get(account=self.sales, month=4).credit_total, Decimal("150")
+        )
+
+    def test_post_continues_from_existing_balance(self):
+        """Test running balances continue across posting runs"""
+        JournalPostingService().post([self.create_journal("J-1", date(2024, 4, 1), "100").pk])
+        JournalPostingService().post([self.create_journal("J-2", date(2024, 5, 1), "20").pk])
+
+        last = Ledger.objects.filter(account=self.sales).order_by('-date').first()
+        self.assertEqual(last.balance, Decimal("-120"))
+
+    def test_unbalanced_journal_is_skipped(self):
+        """Test unbalanced journals are reported and not posted"""
+        journal = self.create_journal("J-1", date(2024, 4, 1), "100", credit_amount="90")
+
+        result = JournalPostingService().post([journal.pk])
+
+        self.assertEqual(result['posted'], 0)
+        self.assertIn("J-1", result['skipped'])
+        self.assertFalse(Ledger.objects.exists())
+
+    def test_opening_balance_locks_and_creates_period_rows(self):
+        """Test the posting periods exist before balances are read, so there is a row to lock"""
+        JournalPostingService().post([self.create_journal("J-1", date(2024, 4, 1), "100").pk])
+
+        balances = JournalPostingService().opening_balances({
+            (self.cash.pk, self.fiscal_year.pk, 2024, 6),
+            (self.sales.pk, self.fiscal_year.pk, 2024, 6),
+        })
+
+        self.assertEqual(balances[(self.cash.pk, self.fiscal_year.pk)], Decimal("100"))
+        self.assertEqual(balances[(self.sales.pk, self.fiscal_year.pk)], Decimal("-100"))
+        self.assertTrue(AccountPeriodBalance.objects.filter(account=self.cash, month=6).exists())
+
+    def test_bulk_post_rejects_invalid_input(self):
+        """Test malformed journal ids or dates are a 400, not a server error"""
+        client = APIClient()
+        client.force_authenticate(get_user_model().objects.create_user(username="accountant", password="pass"))
+        url = '/api/v1/accounting/journals/bulk_post/'
+
+        response = client.post(url, {'journal_ids': ['abc']}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+        response = client.post(url, {'fiscal_year_id': self.fiscal_year.pk, 'date_to': '2024-13-01'}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+
+@pytest.mark.unit
+class MaterializedPathTest(TestCase):
+    def setUp(self):
+        self.root = create_account("1000")
+        self.group = create_account("1100", parent=self.root)
+        self.cash = create_account("1101", parent=self.group)
+        self.other = create_account("2000", account_type='liability', balance_type='credit')
+
+    def test_path_and_level_are_maintained(self):
+        """Test path and level are set on create"""
+        self.assertEqual(self.cash.path, f"/{self.root.pk}/{self.group.pk}/{self.cash.pk}/")
+        self.assertEqual(self.cash.level, 3)
+        self.assertEqual(list(self.cash.get_ancestors()), [self.root, self.group])
+        self.assertEqual(set(self.root.get_descendants()), {self.group, self.cash})
+
+    def test_moving_subtree_updates_descendants(self):
+        """Test moving a node rewrites the path of its whole subtree"""
+        self.group.parent_account = self.other
+        self.group.save()
+
+        self.cash.refresh_from_db()
+        self.root.refresh_from_db()
+        self.assertEqual(self.cash.path, f"/{self.other.pk}/{self.group.pk}/{self.cash.pk}/")
+        self.assertEqual(self.cash.level, 3)
+        self.assertTrue(self.root.is_leaf)
+        self.assertFalse(ChartOfAccounts.objects.get(pk=self.other.pk).is_leaf)
+
+    def test_moving_under_own_descendant_is_rejected(self):
+        """Test reparenting a node below its own subtree raises instead of corrupting paths"""
+        self.root.parent_account = self.cash
+        with self.assertRaises(ValidationError):
+            self.root.save()
+
+        self.cash.refresh_from_db()
+        self.assertEqual(self.cash.path, f"/{self.root.pk}/{self.group.pk}/{self.cash.pk}/")
+
+    def test_api_rejects_invalid_tree_input(self):
+        """Test a malformed root_id or a cyclic parent is a 400"""
+        client = APIClient()
+        client.force_authenticate(get_user_model().objects.create_user(username="accountant", password="pass"))
+
+        response = client.get('/api/v1/accounting/chart-of-accounts/tree/', {'root_id': 'abc'})
+        self.assertEqual(response.status_code, 400)
+
+        response = client.patch(
+            f'/api/v1/accounting/chart-of-accounts/{self.group.pk}/', {'parent_account': self.cash.pk}, format='json'
+        )
+        self.assertEqual(response.status_code, 400)
+
+        response = client.get(
+            f'/api/v1/accounting/chart-of-accounts/{self.group.pk}/balance/', {'fiscal_year_id': 'abc'}
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_build_tree(self):
+        """Test the nested tree is built from a flat list"""
+        nodes = list(ChartOfAccounts.objects.values('id', 'account_code', 'parent_account_id'))
+
+        tree = ChartOfAccounts.build_tree(nodes)
+
+        self.assertEqual([node['account_code'] for node in tree], ["1000", "2000"])
+        self.assertEqual(tree[0]['children'][0]['children'][0]['id'], self.cash.pk)
+
+    def test_cost_center_path(self):
+        """Test cost centers share the same path maintenance"""
+        parent = CostCenter.objects.create(code="CC1", name="تولید")
+        child = CostCenter.objects.create(code="CC11", name="خط یک", parent=parent)
+
+        self.assertEqual(child.path, f"/{parent.pk}/{child.pk}/")
+        self.assertEqual(child.full_path, "تولید > خط یک")
+
+
+@pytest.mark.unit
+class BankAccountStatsTest(TestCase):
+    def test_stats_keep_currency_breakdown(self):
+        """Test bank account stats still report counts per currency"""
+        for number, currency in [("1", "IRR"), ("2", "IRR"), ("3", "USD")]:
+            BankAccount.objects.create(
+                bank_name="ملت", branch_name="مرکزی", account_number=number, account_type='current',
+                account_holder="شرکت", iban=f"IR{number:0>24}", currency=currency,
+            )
+        client = APIClient()
+        client.force_authenticate(get_user_model().objects.create_user(username="accountant", password="pass"))
+
+        response = client.get('/api/v1/accounting/bank-accounts/stats/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['total_accounts'], 3)
+        self.assertEqual(response.data['currency_stats'], {'IRR': 2, 'USD': 1})
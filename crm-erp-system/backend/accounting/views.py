@@ -4,10 +4,13 @@ from rest_framework.response import Response
 from django_filters.rest_framework import DjangoFilterBackend
 from django.db.models import Q, F, Sum, Count
 from django.utils import timezone
+from datetime import date
+from common.stats import STATS_CACHE_TIMEOUT, StatsBuilder
 from .models import (
     FiscalYear, ChartOfAccounts, Journal, JournalEntry, 
-    Ledger, TrialBalance, CostCenter, BankAccount
+    Ledger, TrialBalance, CostCenter, BankAccount, AccountPeriodBalance
 )
+from .services import JournalPostingService, TrialBalanceService
 from .serializers import (
     FiscalYearSerializer, ChartOfAccountsSerializer, JournalSerializer,
     JournalEntrySerializer, LedgerSerializer, TrialBalanceSerializer,
@@ -72,28 +75,81 @@ class ChartOfAccountsViewSet(viewsets.ModelViewSet):
         
         return queryset
     
+    tree_fields = (
+        'id', 'account_code', 'account_name', 'account_type', 'balance_type',
+        'level', 'is_leaf', 'is_active', 'parent_account_id',
+    )
+    
     @action(detail=False, methods=['get'])
     def tree(self, request):
-        """درخت حساب‌ها"""
-        accounts = self.get_queryset().filter(parent_account__isnull=True)
-        serializer = self.get_serializer(accounts, many=True)
+        """درخت حساب‌ها - کل درخت یا زیردرخت root_id با یک کوئری"""
+        queryset = self.get_queryset()
+        
+        root_id = request.query_params.get('root_id')
+        if root_id:
+            if not root_id.isdigit():
+                return Response({'error': 'شناسه ریشه باید عدد صحیح باشد'}, status=status.HTTP_400_BAD_REQUEST)
+            root = ChartOfAccounts.objects.filter(pk=root_id).first()
+            if not root:
+                return Response({'error': 'حساب یافت نشد'}, status=status.HTTP_404_NOT_FOUND)
+            queryset = queryset.filter(path__startswith=root.path)
+        
+        nodes = list(queryset.order_by('account_code').values(*self.tree_fields))
+        return Response(ChartOfAccounts.build_tree(nodes))
+    
+    @action(detail=True, methods=['get'])
+    def descendants(self, request, pk=None):
+        """زیرحساب‌ها در همه سطوح"""
+        account = self.get_object()
+        queryset = account.get_descendants()
+        
+        if request.query_params.get('leaf_only') == 'true':
+            queryset = queryset.filter(is_leaf=True)
+        
+        serializer = self.get_serializer(queryset.select_related('parent_account'), many=True)
         return Response(serializer.data)
     
-    @action(detail=False, methods=['get'])
-    def stats(self, request):
-        """آمار حساب‌ها"""
-        total_accounts = self.get_queryset().count()
-        active_accounts = self.get_queryset().filter(is_active=True).count()
+    @action(detail=True, methods=['get'])
+    def ancestors(self, request, pk=None):
+        """مسیر حساب از ریشه"""
+        account = self.get_object()
+        serializer = self.get_serializer(account.get_ancestors().select_related('parent_account'), many=True)
+        return Response(serializer.data)
+    
+    @action(detail=True, methods=['get'])
+    def balance(self, request, pk=None):
+        """گردش حساب و همه زیرحساب‌ها در یک سال مالی"""
+        account = self.get_object()
+        fiscal_year_id = request.query_params.get('fiscal_year_id')
+        if not fiscal_year_id:
+            return Response({'error': 'سال مالی الزامی است'}, status=status.HTTP_400_BAD_REQUEST)
+        if not fiscal_year_id.isdigit():
+            return Response({'error': 'شناسه سال مالی باید عدد صحیح باشد'}, status=status.HTTP_400_BAD_REQUEST)
         
-        type_stats = {}
-        for account_type, _ in ChartOfAccounts.ACCOUNT_TYPES:
-            type_stats[account_type] = self.get_queryset().filter(account_type=account_type).count()
+        totals = AccountPeriodBalance.objects.filter(
+            fiscal_year_id=fiscal_year_id,
+            account__path__startswith=account.path,
+        ).aggregate(debit=Sum('debit_total'), credit=Sum('credit_total'))
+        debit = totals['debit'] or 0
+        credit = totals['credit'] or 0
         
         return Response({
-            'total_accounts': total_accounts,
-            'active_accounts': active_accounts,
-            'type_stats': type_stats,
+            'account_id': account.id,
+            'fiscal_year_id': fiscal_year_id,
+            'debit_total': debit,
+            'credit_total': credit,
+            'balance': debit - credit,
         })
+    
+    @action(detail=False, methods=['get'])
+    def stats(self, request):
+        """آمار حساب‌ها"""
+        stats = StatsBuilder(self.get_queryset(), cache_timeout=STATS_CACHE_TIMEOUT)
+        stats.count('total_accounts')
+        stats.count('active_accounts', Q(is_active=True))
+        stats.breakdown('type_stats', 'account_type', ChartOfAccounts.ACCOUNT_TYPES)
+        
+        return Response(stats.build())
 
 
 class JournalViewSet(viewsets.ModelViewSet):
@@ -148,25 +204,53 @@ class JournalViewSet(viewsets.ModelViewSet):
         """ثبت دفتر روزنامه"""
         journal = self.get_object()
         
-        if journal.status != 'approved':
-            return Response({'error': 'فقط دفترهای روزنامه تأیید شده قابل ثبت هستند'}, 
+        if journal.is_posted:
+            return Response({'error': 'این سند قبلاً ثبت شده است'}, 
                           status=status.HTTP_400_BAD_REQUEST)
         
-        journal.status = 'posted'
-        journal.save()
-        
-        # ایجاد سند دفتر کل
-        for entry in journal.entries.all():
-            Ledger.objects.create(
-                account=entry.account,
-                journal_entry=entry,
-                debit_amount=entry.debit_amount,
-                credit_amount=entry.credit_amount,
-                balance=entry.debit_amount - entry.credit_amount,
-                created_by=request.user
-            )
+        result = JournalPostingService(user=request.user).post([journal.pk])
+        if journal.journal_number in result['skipped']:
+            return Response({'error': result['skipped'][journal.journal_number]}, 
+                          status=status.HTTP_400_BAD_REQUEST)
         
         return Response({'message': 'دفتر روزنامه با موفقیت ثبت شد'})
+    
+    @action(detail=False, methods=['post'])
+    def bulk_post(self, request):
+        """ثبت گروهی اسناد"""
+        journal_ids = request.data.get('journal_ids')
+        fiscal_year_id = request.data.get('fiscal_year_id')
+        date_to = request.data.get('date_to')
+        
+        if journal_ids is not None and not isinstance(journal_ids, list):
+            return Response({'error': 'شناسه اسناد باید به صورت لیست ارسال شوند'}, 
+                          status=status.HTTP_400_BAD_REQUEST)
+        if not journal_ids and not fiscal_year_id:
+            return Response({'error': 'لیست اسناد یا سال مالی الزامی است'}, 
+                          status=status.HTTP_400_BAD_REQUEST)
+        try:
+            journal_ids = [int(journal_id) for journal_id in journal_ids or []]
+            fiscal_year_id = int(fiscal_year_id) if fiscal_year_id else None
+        except (TypeError, ValueError):
+            return Response({'error': 'شناسه اسناد و سال مالی باید عدد صحیح باشند'}, 
+                          status=status.HTTP_400_BAD_REQUEST)
+        if date_to:
+            try:
+                date_to = date.fromisoformat(str(date_to))
+            except ValueError:
+                return Response({'error': 'فرمت تاریخ نامعتبر است (YYYY-MM-DD)'}, 
+                              status=status.HTTP_400_BAD_REQUEST)
+        
+        journals = Journal.objects.filter(is_posted=False)
+        if journal_ids:
+            journals = journals.filter(pk__in=journal_ids)
+        if fiscal_year_id:
+            journals = journals.filter(fiscal_year_id=fiscal_year_id)
+        if date_to:
+            journals = journals.filter(date__lte=date_to)
+        
+        result = JournalPostingService(user=request.user).post(journals.values_list('pk', flat=True))
+        return Response(result)
 
 
 class JournalEntryViewSet(viewsets.ModelViewSet):
@@ -216,32 +300,26 @@ class TrialBalanceViewSet(viewsets.ModelViewSet):
         if not fiscal_year_id:
             return Response({'error': 'سال مالی الزامی است'}, status=status.HTTP_400_BAD_REQUEST)
         
-        # حذف تراز آزمایشی قبلی
-        TrialBalance.objects.filter(fiscal_year_id=fiscal_year_id).delete()
-        
-        # تولید تراز آزمایشی جدید
-        accounts = ChartOfAccounts.objects.filter(is_active=True)
-        for account in accounts:
-            ledger_entries = Ledger.objects.filter(account=account)
-            debit_balance = ledger_entries.aggregate(total=Sum('debit_amount'))['total'] or 0
-            credit_balance = ledger_entries.aggregate(total=Sum('credit_amount'))['total'] or 0
-            
-            TrialBalance.objects.create(
-                fiscal_year_id=fiscal_year_id,
-                account=account,
-                debit_balance=debit_balance,
-                credit_balance=credit_balance,
-                created_by=request.user
-            )
-        
-        return Response({'message': 'تراز آزمایشی با موفقیت تولید شد'})
+        try:
+            fiscal_year = FiscalYear.objects.get(pk=fiscal_year_id)
+        except FiscalYear.DoesNotExist:
+            return Response({'error': 'سال مالی یافت نشد'}, status=status.HTTP_404_NOT_FOUND)
+        
+        # بازسازی گردش ماهانه از دفتر کل فقط در صورت درخواست
+        rebuild = request.query_params.get('rebuild') == 'true'
+        accounts_count = TrialBalanceService.generate(fiscal_year, rebuild=rebuild)
+        
+        return Response({
+            'message': 'تراز آزمایشی با موفقیت تولید شد',
+            'accounts_count': accounts_count,
+        })
 
 
 class CostCenterViewSet(viewsets.ModelViewSet):
     queryset = CostCenter.objects.all()
     serializer_class = CostCenterSerializer
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
-    filterset_fields = ['parent_center', 'is_active']
+    filterset_fields = ['parent', 'is_active']
     search_fields = ['code', 'name', 'description']
     ordering_fields = ['code', 'name', 'created_at']
     ordering = ['code']
@@ -257,15 +335,32 @@ class CostCenterViewSet(viewsets.ModelViewSet):
         # فیلتر بر اساس والد
         parent_id = self.request.query_params.get('parent_id')
         if parent_id:
-            queryset = queryset.filter(parent_center_id=parent_id)
+            queryset = queryset.filter(parent_id=parent_id)
         
         return queryset
     
     @action(detail=False, methods=['get'])
     def tree(self, request):
-        """درخت مراکز هزینه"""
-        centers = self.get_queryset().filter(parent_center__isnull=True)
-        serializer = self.get_serializer(centers, many=True)
+        """درخت مراکز هزینه - کل درخت یا زیردرخت root_id با یک کوئری"""
+        queryset = self.get_queryset()
+        
+        root_id = request.query_params.get('root_id')
+        if root_id:
+            if not root_id.isdigit():
+                return Response({'error': 'شناسه ریشه باید عدد صحیح باشد'}, status=status.HTTP_400_BAD_REQUEST)
+            root = CostCenter.objects.filter(pk=root_id).first()
+            if not root:
+                return Response({'error': 'مرکز هزینه یافت نشد'}, status=status.HTTP_404_NOT_FOUND)
+            queryset = queryset.filter(path__startswith=root.path)
+        
+        nodes = list(queryset.order_by('code').values('id', 'code', 'name', 'level', 'is_active', 'parent_id'))
+        return Response(CostCenter.build_tree(nodes))
+    
+    @action(detail=True, methods=['get'])
+    def descendants(self, request, pk=None):
+        """زیرمراکز در همه سطوح"""
+        center = self.get_object()
+        serializer = self.get_serializer(center.get_descendants().select_related('parent'), many=True)
         return Response(serializer.data)
 
 
@@ -281,15 +376,13 @@ class BankAccountViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['get'])
     def stats(self, request):
         """آمار حساب‌های بانکی"""
-        total_accounts = self.get_queryset().count()
-        active_accounts = self.get_queryset().filter(is_active=True).count()
+        stats = StatsBuilder(self.get_queryset(), cache_timeout=STATS_CACHE_TIMEOUT)
+        stats.count('total_accounts')
+        stats.count('active_accounts', Q(is_active=True))
+        data = stats.build()
         
-        currency_stats = {}
-        for currency, _ in BankAccount.CURRENCIES:
-            currency_stats[currency] = self.get_queryset().filter(currency=currency).count()
+        # currency is free text (no choices), so its breakdown is one grouped query
+        currencies = self.get_queryset().values('currency').annotate(count=Count('pk')).order_by()
+        data['currency_stats'] = {row['currency']: row['count'] for row in currencies}
         
-        return Response({
-            'total_accounts': total_accounts,
-            'active_accounts': active_accounts,
-            'currency_stats': currency_stats,
-        })
\ No newline at end of file
+        return Response(data)
@@ -0,0 +1,97 @@
+import threading
+import time
+from django.core.cache import cache, caches
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory
+from common.rate_limiting import RateLimiter, get_backend, local_backend
+
+
+class ListRateLimiter(RateLimiter):
+    """The previous implementation: a pickled list of timestamps read and rewritten per request"""
+
+    def is_allowed(self, request):
+        key = f"bench_list_{self.key_func(request)}"
+        current_time = int(time.time())
+        window_start = current_time - self.window
+
+        requests = [req_time for req_time in cache.get(key, []) if req_time > window_start]
+        if len(requests) >= self.requests:
+            return False, len(requests)
+
+        requests.append(current_time)
+        cache.set(key, requests, self.window)
+        return True, len(requests)
+
+    def get_remaining_requests(self, request):
+        key = f"bench_list_{self.key_func(request)}"
+        window_start = int(time.time()) - self.window
+        requests = [req_time for req_time in cache.get(key, []) if req_time > window_start]
+        return max(0, self.requests - len(requests))
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare the list-based rate limiter with the GCRA limiter (Redis when the default cache '
+        'is Redis, otherwise in-process): throughput and requests admitted under concurrency'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=8, help='Number of concurrent threads')
+        parser.add_argument('--requests', type=int, default=2000, help='Checks per worker')
+        parser.add_argument('--limit', type=int, default=1000, help='Allowed requests per window')
+        parser.add_argument('--window', type=int, default=3600, help='Window in seconds')
+
+    def run(self, name, check, workers, per_worker, limit):
+        admitted = [0] * workers
+
+        def worker(index):
+            for _ in range(per_worker):
+                if check():
+                    admitted[index] += 1
+
+        threads = [threading.Thread(target=worker, args=(index,)) for index in range(workers)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        total = workers * per_worker
+        allowed = sum(admitted)
+        self.stdout.write(
+            f'{name:<10} {total / elapsed:>10.0f} checks/s  {elapsed * 1e6 / total:>8.1f} us/check  '
+            f'admitted {allowed} of limit {limit}' + ('  (over limit!)' if allowed > limit else '')
+        )
+
+    def handle(self, *args, **options):
+        workers = options['workers']
+        per_worker = options['requests']
+        limit = options['limit']
+        window = options['window']
+        run_id = int(time.time() * 1000)
+
+        request = RequestFactory().get('/api/v1/', REMOTE_ADDR='203.0.113.7')
+        key_func = lambda r: f'bench_{run_id}'
+
+        backend = get_backend()
+        self.stdout.write(
+            f'Cache backend: {caches["default"].__class__.__name__}; GCRA backend: '
+            f'{"local" if backend is local_backend else "redis"}; {workers} workers x {per_worker} checks'
+        )
+
+        # Decorator/middleware usage: a check, then the remaining count for the headers
+        list_limiter = ListRateLimiter(limit, window, key_func)
+
+        def list_check():
+            allowed, _ = list_limiter.is_allowed(request)
+            list_limiter.get_remaining_requests(request)
+            return allowed
+
+        gcra_limiter = RateLimiter(limit, window, key_func)
+
+        def gcra_check():
+            return gcra_limiter.check(request).allowed
+
+        self.run('list', list_check, workers, per_worker, limit)
+        self.run('gcra', gcra_check, workers, per_worker, limit)
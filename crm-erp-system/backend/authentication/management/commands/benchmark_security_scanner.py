@@ -0,0 +1,53 @@
+import time
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory
+from common.security_scanner import get_scanner
+
+LEGACY_PATTERNS = ['..', 'script', 'union', 'select', 'drop']
+
+SAMPLE_REQUESTS = [
+    ('/api/v1/products/products/', {'search': 'dropdown menu', 'ordering': '-created_at', 'page': '3'}),
+    ('/api/v1/invoices/invoices/', {'status': 'paid', 'date_from': '2026-01-01', 'date_to': '2026-03-31'}),
+    ('/api/v1/customers/customers/selected/', {}),
+    ('/api/v1/crm/leads/', {'q': "x' UNION SELECT password FROM auth_user --"}),
+    ('/api/v1/reports/templates/', {'name': '<script>alert(1)</script>'}),
+    ('/static/../../etc/passwd', {}),
+]
+
+
+def legacy_scan(request):
+    """The previous check: lower-case path and str(GET) again for every pattern"""
+    for pattern in LEGACY_PATTERNS:
+        if pattern in request.path.lower() or pattern in str(request.GET).lower():
+            return [pattern]
+    return []
+
+
+class Command(BaseCommand):
+    help = 'Compare the substring pattern check with the compiled single-pass SecurityScanner'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=20000, help='Scans per implementation')
+
+    def run(self, name, scan, requests, iterations):
+        started = time.perf_counter()
+        for index in range(iterations):
+            scan(requests[index % len(requests)])
+        elapsed = time.perf_counter() - started
+        self.stdout.write(f'  {name:<8} {elapsed * 1e6 / iterations:>7.2f} us/request')
+
+    def handle(self, *args, **options):
+        factory = RequestFactory()
+        requests = [factory.get(path, params) for path, params in SAMPLE_REQUESTS]
+        scanner = get_scanner()
+
+        self.stdout.write('Matches per sample request (legacy / scanner):')
+        for request in requests:
+            self.stdout.write(f'  {request.get_full_path()[:70]:<70} {legacy_scan(request)} / {scanner.scan(request)}')
+
+        iterations = options['iterations']
+        clean = [request for request in requests if not scanner.scan(request)]
+        for label, sample in (('all', requests), ('clean', clean)):
+            self.stdout.write(f'{label} requests:')
+            self.run('legacy', legacy_scan, sample, iterations)
+            self.run('scanner', scanner.scan, sample, iterations)
@@ -0,0 +1,53 @@
+from django.db import connections
+import time
+
+
+class QueryStats:
+    """
+    Per-request query counter installed with connection.execute_wrapper.
+
+    Counts queries and accumulates their time without keeping SQL text, so
+    it works with DEBUG off and costs a few attribute updates per query.
+    Statements are grouped by their parameterized SQL (the "shape") to spot
+    the same query repeated many times in one request, the usual N+1 sign;
+    only the first statement of a shape that reaches the repeat threshold
+    is kept, as a sample for the log.
+    """
+
+    SAMPLE_LENGTH = 300
+
+    def __init__(self, repeat_threshold=10):
+        self.repeat_threshold = repeat_threshold
+        self.count = 0
+        self.duration = 0.0
+        self.shapes = {}
+        self.samples = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+            shape = hash(sql)
+            seen = self.shapes.get(shape, 0) + 1
+            self.shapes[shape] = seen
+            if seen == self.repeat_threshold:
+                self.samples[shape] = sql[:self.SAMPLE_LENGTH]
+
+    def repeated_queries(self):
+        """(times executed, sample SQL) of every shape that reached the repeat threshold, most frequent first"""
+        return sorted(
+            ((self.shapes[shape], sql) for shape, sql in self.samples.items()),
+            reverse=True,
+        )
+
+    def install(self):
+        for connection in connections.all():
+            connection.execute_wrappers.append(self)
+
+    def uninstall(self):
+        for connection in connections.all():
+            if self in connection.execute_wrappers:
+                connection.execute_wrappers.remove(self)
@@ -1,22 +1,121 @@
 from functools import wraps
 from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
 from django.utils.decorators import method_decorator
 from django.views.decorators.cache import cache_page
 from django.views.decorators.vary import vary_on_headers
 import hashlib
 import json
+import logging
+import time
 
+logger = logging.getLogger(__name__)
 
-def cache_view(timeout=300, key_prefix=''):
+# Prefix of the per-namespace generation counters embedded in cache keys
+VERSION_KEY_PREFIX = 'cache_version'
+
+
+def cache_namespace(target):
+    """Namespace of a model class or instance (its label, e.g. 'customers.customer'); strings pass through"""
+    if isinstance(target, str):
+        return target
+    return target._meta.label_lower
+
+
+def version_key(namespace):
+    return f"{VERSION_KEY_PREFIX}:{cache_namespace(namespace)}"
+
+
+def initial_version():
+    # Start from the clock rather than 1, so a counter that was evicted and
+    # recreated cannot reach a generation whose entries are still cached
+    return int(time.time() * 1000)
+
+
+def get_cache_versions(namespaces):
+    """Current generation of each namespace, read in one round trip"""
+    keys = [version_key(namespace) for namespace in namespaces]
+    if not keys:
+        return []
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, initial_version(), None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+def bump_cache_version(*namespaces):
+    """
+    Invalidate everything cached under the namespaces with one INCR each;
+    the old entries are never read again and expire on their own timeout
+    """
+    for namespace in namespaces:
+        key = version_key(namespace)
+        try:
+            cache.incr(key)
+        except ValueError:
+            # No counter yet, so nothing was cached under it
+            cache.add(key, initial_version(), None)
+
+
+def bump_cache_version_on_commit(*namespaces, using=None):
+    """
+    bump_cache_version() once the current transaction commits, for writes
+    that bypass the model signals (bulk_create, bulk_update, update());
+    a cache outage is logged and does not fail the write
+    """
+    targets = [cache_namespace(namespace) for namespace in namespaces]
+
+    def bump():
+        try:
+            bump_cache_version(*targets)
+        except Exception:
+            logger.warning("Cache invalidation of %s failed", ', '.join(targets), exc_info=True)
+
+    transaction.on_commit(bump, using=using)
+
+
+def versioned_cache_key(key_data, models=()):
+    """Hashed cache key of key_data stamped with the current generation of each model"""
+    versions = get_cache_versions(models)
+    if versions:
+        key_data = f"{key_data}_v{'.'.join(str(version) for version in versions)}"
+    return hashlib.md5(key_data.encode()).hexdigest()
+
+
+def invalidate_on_change(model, *namespaces):
+    """
+    Bump the model's namespace (and any extra namespaces, e.g. the parent of
+    an item model) whenever an instance is saved or deleted.
+
+    The bump runs after the surrounding transaction commits, so a request
+    racing the save cannot cache rows that are later rolled back under the
+    new generation. A cache outage is logged and does not fail the save.
+
+    Bulk queryset update()/delete() and raw SQL bypass the signals; call
+    bump_cache_version_on_commit() after those.
+    """
+    def handler(sender, using=None, **kwargs):
+        bump_cache_version_on_commit(model, *namespaces, using=using)
+
+    uid = f"invalidate_on_change:{cache_namespace(model)}"
+    post_save.connect(handler, sender=model, weak=False, dispatch_uid=uid)
+    post_delete.connect(handler, sender=model, weak=False, dispatch_uid=uid)
+    return handler
+
+
+def cache_view(timeout=300, key_prefix='', models=()):
     """
-    Cache decorator for class-based views
+    Cache decorator for class-based views; changes to any of models
+    (see invalidate_on_change) invalidate the cached responses
     """
     def decorator(view_func):
         @wraps(view_func)
         def wrapper(self, request, *args, **kwargs):
             # Create cache key based on request parameters
-            cache_key = f"{key_prefix}_{request.user.id}_{request.get_full_path()}"
-            cache_key = hashlib.md5(cache_key.encode()).hexdigest()
+            cache_key = versioned_cache_key(f"{key_prefix}_{request.user.id}_{request.get_full_path()}", models)
             
             # Try to get from cache
             cached_result = cache.get(cache_key)
@@ -31,16 +130,16 @@ def cache_view(timeout=300, key_prefix=''):
     return decorator
 
 
-def cache_method(timeout=300, key_prefix=''):
+def cache_method(timeout=300, key_prefix='', models=()):
     """
-    Cache decorator for methods
+    Cache decorator for methods; changes to any of models invalidate the cached results
     """
     def decorator(func):
         @wraps(func)
         def wrapper(*args, **kwargs):
             # Create cache key
             key_data = f"{key_prefix}_{func.__name__}_{str(args)}_{str(kwargs)}"
-            cache_key = hashlib.md5(key_data.encode()).hexdigest()
+            cache_key = versioned_cache_key(key_data, models)
             
             # Try to get from cache
             cached_result = cache.get(cache_key)
@@ -55,16 +154,15 @@ def cache_method(timeout=300, key_prefix=''):
     return decorator
 
 
-def invalidate_cache_pattern(pattern):
+def invalidate_cache(*namespaces):
     """
-    Invalidate cache entries matching a pattern
+    Invalidate the cache namespaces (models or namespace strings) after the decorated function runs
     """
     def decorator(func):
         @wraps(func)
         def wrapper(*args, **kwargs):
             result = func(*args, **kwargs)
-            # Invalidate cache (simplified - in production use Redis SCAN)
-            cache.delete_many(cache.keys(f"*{pattern}*"))
+            bump_cache_version(*namespaces)
             return result
         return wrapper
     return decorator
@@ -76,11 +174,13 @@ class CacheMixin:
     """
     cache_timeout = 300
     cache_key_prefix = ''
+    # Models whose changes invalidate the cached data
+    cache_models = ()
     
     def get_cache_key(self, request, *args, **kwargs):
         """Generate cache key for the request"""
         key_data = f"{self.cache_key_prefix}_{request.user.id}_{request.get_full_path()}"
-        return hashlib.md5(key_data.encode()).hexdigest()
+        return versioned_cache_key(key_data, self.cache_models)
     
     def get_cached_data(self, request, *args, **kwargs):
         """Get data from cache"""
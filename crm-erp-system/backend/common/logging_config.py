@@ -1,18 +1,23 @@
+import atexit
 import logging
 import logging.config
+import logging.handlers
+import queue
 import structlog
 from django.conf import settings
+from .metrics import request_route
 import os
 
+# Loggers whose records are written by a background thread instead of the request thread
+ASYNC_LOGGERS = ('performance', 'security', 'crm_erp')
 
-def configure_logging():
-    """Configure structured logging for the application"""
-    
-    # Create logs directory if it doesn't exist
-    logs_dir = os.path.join(settings.BASE_DIR, 'logs')
-    os.makedirs(logs_dir, exist_ok=True)
-    
-    # Configure structlog
+# Records waiting per logger before new ones are dropped, and records written per batch
+LOG_QUEUE_SIZE = 10000
+LOG_BATCH_SIZE = 500
+
+
+def configure_structlog():
+    """Route structlog through the standard library loggers (and so through LOGGING's handlers)"""
     structlog.configure(
         processors=[
             structlog.stdlib.filter_by_level,
@@ -30,6 +35,16 @@ def configure_logging():
         wrapper_class=structlog.stdlib.BoundLogger,
         cache_logger_on_first_use=True,
     )
+
+
+def configure_logging():
+    """Configure structured logging for the application"""
+    
+    # Create logs directory if it doesn't exist
+    logs_dir = os.path.join(settings.BASE_DIR, 'logs')
+    os.makedirs(logs_dir, exist_ok=True)
+    
+    configure_structlog()
     
     # Django logging configuration
     LOGGING = {
@@ -125,6 +140,128 @@ def configure_logging():
     return LOGGING
 
 
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler on a bounded queue that drops (and counts) records instead of blocking when full"""
+    
+    def __init__(self, log_queue, logger_name):
+        super().__init__(log_queue)
+        self.logger_name = logger_name
+        self.dropped = 0
+    
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            from .metrics import LOG_RECORDS_DROPPED
+            LOG_RECORDS_DROPPED.inc(logger=self.logger_name)
+
+
+class BatchingQueueListener(logging.handlers.QueueListener):
+    """
+    QueueListener that drains the queue in batches: each handler is locked
+    once per batch rather than once per record, and flushed at the end.
+    """
+    
+    def __init__(self, log_queue, *handlers, batch_size=LOG_BATCH_SIZE):
+        super().__init__(log_queue, *handlers, respect_handler_level=True)
+        self.batch_size = batch_size
+        self.processed = 0
+    
+    def _monitor(self):
+        while True:
+            batch = [self.dequeue(True)]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.dequeue(False))
+                except queue.Empty:
+                    break
+            
+            stop = self._sentinel in batch
+            records = [self.prepare(record) for record in batch if record is not self._sentinel]
+            self.handle_batch(records)
+            for _ in batch:
+                self.queue.task_done()
+            if stop:
+                break
+    
+    def handle_batch(self, records):
+        for handler in self.handlers:
+            handler.acquire()
+            try:
+                for record in records:
+                    if record.levelno >= handler.level and handler.filter(record):
+                        try:
+                            handler.emit(record)
+                        except Exception:
+                            handler.handleError(record)
+            finally:
+                handler.release()
+            handler.flush()
+        self.processed += len(records)
+
+
+_listeners = {}
+
+
+def install_async_logging(logger_names=ASYNC_LOGGERS, queue_size=LOG_QUEUE_SIZE):
+    """
+    Move the handlers of the given loggers behind a bounded queue written by
+    a background thread, so logging never blocks (or waits on I/O in) the
+    calling thread. Returns {logger name: queue handler}.
+    """
+    queue_handlers = {}
+    for name in logger_names:
+        logger = logging.getLogger(name)
+        handlers = [handler for handler in logger.handlers if not isinstance(handler, DroppingQueueHandler)]
+        if not handlers or name in _listeners:
+            continue
+        
+        log_queue = queue.Queue(maxsize=queue_size)
+        queue_handler = DroppingQueueHandler(log_queue, name)
+        listener = BatchingQueueListener(log_queue, *handlers)
+        for handler in handlers:
+            logger.removeHandler(handler)
+        logger.addHandler(queue_handler)
+        listener.start()
+        
+        _listeners[name] = (listener, queue_handler)
+        queue_handlers[name] = queue_handler
+    return queue_handlers
+
+
+def stop_async_logging():
+    """Write out what is still queued and stop the background threads"""
+    while _listeners:
+        _, (listener, _) = _listeners.popitem()
+        listener.stop()
+
+
+def async_logging_stats():
+    return {
+        name: {
+            'queued': queue_handler.queue.qsize(),
+            'dropped': queue_handler.dropped,
+            'processed': listener.processed,
+        }
+        for name, (listener, queue_handler) in _listeners.items()
+    }
+
+
+def setup_logging(logging_settings):
+    """
+    LOGGING_CONFIG entry point: applies settings.LOGGING, puts structlog on
+    top of it and makes the application loggers asynchronous.
+    """
+    if logging_settings:
+        logging.config.dictConfig(logging_settings)
+    configure_structlog()
+    install_async_logging()
+
+
+atexit.register(stop_async_logging)
+
+
 # Logger instances
 security_logger = structlog.get_logger('security')
 performance_logger = structlog.get_logger('performance')
@@ -169,22 +306,40 @@ class SecurityLogger:
         )
 
 
+def endpoint_name(request, route=None):
+    """Method plus resolved URL route (e.g. "GET api/v1/products/<pk>/"), so log lines group per endpoint, not per URL"""
+    return f"{request.method} {route or request_route(request)}"
+
+
 class PerformanceLogger:
     """Performance monitoring logger"""
     
     @staticmethod
-    def log_api_request(request, response, duration, query_count=None):
+    def log_api_request(request, response, duration, query_count=None, db_time=None, route=None):
+        user = getattr(request, 'user', None)
         performance_logger.info(
             "api_request",
             method=request.method,
+            endpoint=endpoint_name(request, route),
             path=request.path,
             status_code=response.status_code,
             duration_ms=duration * 1000,
             query_count=query_count,
-            user_id=request.user.id if request.user.is_authenticated else None,
+            db_time_ms=db_time * 1000 if db_time is not None else None,
+            user_id=user.id if user is not None and user.is_authenticated else None,
             ip_address=request.META.get('REMOTE_ADDR')
         )
     
+    @staticmethod
+    def log_repeated_queries(request, repeated, query_count):
+        performance_logger.warning(
+            "repeated_queries",
+            endpoint=endpoint_name(request),
+            path=request.path,
+            query_count=query_count,
+            repeated=[{'count': count, 'sql': sql} for count, sql in repeated]
+        )
+    
     @staticmethod
     def log_slow_query(query, duration, params=None):
         performance_logger.warning(
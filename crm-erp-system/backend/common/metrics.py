@@ -0,0 +1,296 @@
+from bisect import bisect_left
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+import glob
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# Seconds between writes of this process's metrics to the multiprocess directory
+FLUSH_INTERVAL = 5
+
+
+def escape_label_value(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class Metric:
+    """Base of the registry's metrics; values are kept per tuple of label values"""
+
+    type = None
+
+    def __init__(self, name, documentation, labelnames=(), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.lock = threading.Lock()
+        self.values = {}
+        (registry or metrics_registry).register(self)
+
+    def label_key(self, labels):
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def snapshot(self):
+        with self.lock:
+            values = [[list(key), value if not isinstance(value, list) else list(value)] for key, value in self.values.items()]
+        return {'type': self.type, 'help': self.documentation, 'labelnames': list(self.labelnames), 'values': values}
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self.label_key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+        metrics_registry.maybe_flush()
+
+
+class Histogram(Metric):
+    """Bucketed observations; each value is [count per bucket..., +Inf count, sum]"""
+
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS, registry=None):
+        self.buckets = tuple(buckets)
+        super().__init__(name, documentation, labelnames, registry)
+
+    def observe(self, value, **labels):
+        key = self.label_key(labels)
+        with self.lock:
+            entry = self.values.get(key)
+            if entry is None:
+                entry = self.values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            entry[bisect_left(self.buckets, value)] += 1
+            entry[-1] += value
+        metrics_registry.maybe_flush()
+
+    def snapshot(self):
+        data = super().snapshot()
+        data['buckets'] = list(self.buckets)
+        return data
+
+
+class FileMetricsStore:
+    """
+    One JSON file per worker process in a shared directory.
+
+    Each process atomically replaces its own file (write then rename), and
+    the exporter sums the files of all processes, so any worker can serve
+    the totals of the whole deployment. Files are named by PID, so the
+    directory must not be shared between hosts; the files of workers that
+    have exited are removed when a process opens the store, and their
+    counts then drop out of the totals (a counter reset to Prometheus).
+    """
+
+    FILE_PATTERN = 'metrics_*.json*'
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.remove_dead()
+
+    @staticmethod
+    def pid_alive(pid):
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            # Exists but belongs to another user
+            return True
+        return True
+
+    def remove_dead(self):
+        """Delete the files (and leftover temp files) of processes that no longer run; returns how many"""
+        removed = 0
+        for path in glob.glob(os.path.join(self.directory, self.FILE_PATTERN)):
+            pid = os.path.basename(path)[len('metrics_'):].split('.')[0]
+            if not pid.isdigit() or self.pid_alive(int(pid)):
+                continue
+            try:
+                os.remove(path)
+                removed += 1
+            except FileNotFoundError:
+                continue
+        return removed
+
+    def path(self):
+        return os.path.join(self.directory, f'metrics_{os.getpid()}.json')
+
+    def write(self, snapshot):
+        path = self.path()
+        temp_path = f'{path}.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump(snapshot, f)
+        os.replace(temp_path, path)
+
+    def read_all(self):
+        snapshots = []
+        for path in glob.glob(os.path.join(self.directory, 'metrics_*.json')):
+            try:
+                with open(path) as f:
+                    snapshots.append(json.load(f))
+            except (OSError, ValueError):
+                # A file being replaced or from a crashed writer; skip it this scrape
+                continue
+        return snapshots
+
+
+class MetricsRegistry:
+    """
+    In-process metrics, rendered in the Prometheus text format.
+
+    With settings.METRICS_MULTIPROC_DIR set, every process also writes its
+    metrics to that directory at most every FLUSH_INTERVAL seconds and the
+    rendered output is the sum over all processes.
+    """
+
+    def __init__(self):
+        self.metrics = {}
+        self.lock = threading.Lock()
+        self.last_flush = 0
+        self._store = None
+
+    def register(self, metric):
+        with self.lock:
+            if metric.name in self.metrics:
+                raise ValueError(f'Metric already registered: {metric.name}')
+            self.metrics[metric.name] = metric
+
+    @property
+    def store(self):
+        directory = getattr(settings, 'METRICS_MULTIPROC_DIR', None)
+        if not directory:
+            return None
+        if self._store is None or self._store.directory != directory:
+            self._store = FileMetricsStore(directory)
+        return self._store
+
+    def snapshot(self):
+        return {name: metric.snapshot() for name, metric in list(self.metrics.items())}
+
+    def flush(self):
+        store = self.store
+        if store is not None:
+            store.write(self.snapshot())
+        self.last_flush = time.monotonic()
+
+    def maybe_flush(self):
+        if time.monotonic() - self.last_flush < FLUSH_INTERVAL:
+            return
+        try:
+            self.flush()
+        except OSError as e:
+            logger.warning(f"Writing metrics failed: {e}")
+
+    @staticmethod
+    def merge(snapshots):
+        merged = {}
+        for snapshot in snapshots:
+            for name, data in snapshot.items():
+                target = merged.setdefault(name, {**data, 'values': {}})
+                for labels, value in data['values']:
+                    key = tuple(labels)
+                    current = target['values'].get(key)
+                    if current is None:
+                        target['values'][key] = value
+                    elif isinstance(value, list):
+                        target['values'][key] = [a + b for a, b in zip(current, value)]
+                    else:
+                        target['values'][key] = current + value
+        return merged
+
+    def collect(self):
+        store = self.store
+        if store is None:
+            return self.merge([self.snapshot()])
+        self.flush()
+        return self.merge(store.read_all())
+
+    @staticmethod
+    def format_labels(labelnames, values, extra=None):
+        pairs = list(zip(labelnames, values)) + (extra or [])
+        if not pairs:
+            return ''
+        return '{' + ','.join(f'{name}="{escape_label_value(value)}"' for name, value in pairs) + '}'
+
+    def render(self):
+        lines = []
+        for name, data in sorted(self.collect().items()):
+            lines.append(f'# HELP {name} {data["help"]}')
+            lines.append(f'# TYPE {name} {data["type"]}')
+            labelnames = data['labelnames']
+            for labels, value in sorted(data['values'].items()):
+                if data['type'] == 'histogram':
+                    cumulative = 0
+                    for bound, count in zip(data['buckets'] + ['+Inf'], value[:-1]):
+                        cumulative += count
+                        label_text = self.format_labels(labelnames, labels, [('le', bound)])
+                        lines.append(f'{name}_bucket{label_text} {cumulative}')
+                    label_text = self.format_labels(labelnames, labels)
+                    lines.append(f'{name}_sum{label_text} {value[-1]}')
+                    lines.append(f'{name}_count{label_text} {cumulative}')
+                else:
+                    lines.append(f'{name}{self.format_labels(labelnames, labels)} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+metrics_registry = MetricsRegistry()
+
+
+HTTP_REQUESTS = Counter(
+    'http_requests_total', 'HTTP requests by route and status', ['method', 'route', 'status']
+)
+HTTP_REQUEST_DURATION = Histogram(
+    'http_request_duration_seconds', 'HTTP request latency by route', ['method', 'route']
+)
+HTTP_REQUEST_QUERIES = Histogram(
+    'http_request_db_queries', 'Database queries per HTTP request', ['method', 'route'],
+    buckets=(0, 1, 2, 5, 10, 20, 50, 100)
+)
+HTTP_REQUEST_DB_TIME = Histogram(
+    'http_request_db_time_seconds', 'Database time per HTTP request', ['method', 'route']
+)
+
+LOG_RECORDS_DROPPED = Counter(
+    'log_records_dropped_total', 'Log records dropped because the logging queue was full', ['logger']
+)
+
+DASHBOARD_UPDATES = Counter(
+    'dashboard_updates_total', 'Dashboard updates by outcome (received, merged, dropped, sent)', ['outcome']
+)
+
+SECURITY_PATTERN_MATCHES = Counter(
+    'security_pattern_matches_total', 'Requests matching a suspicious-pattern rule', ['rule']
+)
+
+
+def request_route(request):
+    """Resolved URL route of the request (e.g. "api/v1/products/<pk>/"), so metrics are per endpoint, not per URL"""
+    match = getattr(request, 'resolver_match', None)
+    return match.route if match is not None else 'unresolved'
+
+
+def record_request(request, response, duration, query_count, db_time, route=None):
+    """Feed the HTTP metrics; called by PerformanceMonitoringMiddleware for every request"""
+    route = route or request_route(request)
+    HTTP_REQUESTS.inc(method=request.method, route=route, status=response.status_code)
+    HTTP_REQUEST_DURATION.observe(duration, method=request.method, route=route)
+    HTTP_REQUEST_QUERIES.observe(query_count, method=request.method, route=route)
+    HTTP_REQUEST_DB_TIME.observe(db_time, method=request.method, route=route)
+
+
+def metrics_view(request):
+    """Prometheus text exposition; only for METRICS_ALLOWED_IPS or staff users"""
+    allowed_ips = getattr(settings, 'METRICS_ALLOWED_IPS', ['127.0.0.1'])
+    user = getattr(request, 'user', None)
+    if request.META.get('REMOTE_ADDR') not in allowed_ips and not (user is not None and user.is_staff):
+        return HttpResponseForbidden()
+    return HttpResponse(metrics_registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -1,9 +1,31 @@
 import time
 import logging
-from django.db import connection
+from django.conf import settings
 from django.utils.deprecation import MiddlewareMixin
+from .db_instrumentation import QueryStats
 from .logging_config import PerformanceLogger, SecurityLogger
-from .rate_limiting import RateLimiter
+from .metrics import SECURITY_PATTERN_MATCHES, record_request, request_route
+from .rate_limiting import RateLimiter, rate_limit_exceeded_response
+from .security_scanner import get_scanner
+
+
+def start_query_stats(request, owner):
+    """Install per-request query counting unless another middleware already did; returns the stats"""
+    stats = getattr(request, '_query_stats', None)
+    if stats is None:
+        stats = QueryStats(getattr(settings, 'QUERY_REPEAT_THRESHOLD', 10))
+        stats.install()
+        request._query_stats = stats
+        request._query_stats_owner = owner
+    return stats
+
+
+def finish_query_stats(request, owner):
+    """Stats of the request; the middleware that installed them removes the wrapper"""
+    stats = getattr(request, '_query_stats', None)
+    if stats is not None and getattr(request, '_query_stats_owner', None) is owner:
+        stats.uninstall()
+    return stats
 
 
 class PerformanceMonitoringMiddleware(MiddlewareMixin):
@@ -11,27 +33,31 @@ class PerformanceMonitoringMiddleware(MiddlewareMixin):
     
     def process_request(self, request):
         request._start_time = time.time()
-        request._query_count_start = len(connection.queries)
+        start_query_stats(request, self)
         return None
     
     def process_response(self, request, response):
-        if hasattr(request, '_start_time'):
+        stats = finish_query_stats(request, self)
+        if hasattr(request, '_start_time') and stats is not None:
             duration = time.time() - request._start_time
-            query_count = len(connection.queries) - getattr(request, '_query_count_start', 0)
+            query_count = stats.count
             
-            # Log API performance
-            PerformanceLogger.log_api_request(request, response, duration, query_count)
+            # Log API performance; the histograms live in the metrics registry
+            route = request_route(request)
+            PerformanceLogger.log_api_request(request, response, duration, query_count, stats.duration, route)
+            record_request(request, response, duration, query_count, stats.duration, route)
             
             # Add performance headers
             response['X-Response-Time'] = f"{duration:.3f}s"
             response['X-Query-Count'] = str(query_count)
+            response['X-DB-Time'] = f"{stats.duration:.3f}s"
             
             # Log slow requests
             if duration > 1.0:  # More than 1 second
                 PerformanceLogger.log_slow_query(
                     f"{request.method} {request.path}",
                     duration,
-                    {"query_count": query_count}
+                    {"query_count": query_count, "db_time_ms": stats.duration * 1000}
                 )
         
         return response
@@ -72,26 +98,10 @@ class RateLimitingMiddleware(MiddlewareMixin):
         else:
             return None
         
-        allowed, current_count = limiter.is_allowed(request)
+        result = limiter.check(request)
         
-        if not allowed:
-            from django.http import JsonResponse
-            remaining = limiter.get_remaining_requests(request)
-            reset_time = int(time.time()) + limiter.window
-            
-            response = JsonResponse({
-                'error': 'Rate limit exceeded',
-                'limit': limiter.requests,
-                'current': current_count,
-                'remaining': remaining,
-                'reset_time': reset_time
-            }, status=429)
-            
-            response['X-RateLimit-Limit'] = limiter.requests
-            response['X-RateLimit-Remaining'] = remaining
-            response['X-RateLimit-Reset'] = reset_time
-            
-            return response
+        if not result.allowed:
+            return rate_limit_exceeded_response(result)
         
         return None
 
@@ -100,21 +110,27 @@ class QueryCountMiddleware(MiddlewareMixin):
     """Middleware to monitor database query count"""
     
     def process_request(self, request):
-        request._query_count_start = len(connection.queries)
+        start_query_stats(request, self)
         return None
     
     def process_response(self, request, response):
-        if hasattr(request, '_query_count_start'):
-            query_count = len(connection.queries) - request._query_count_start
+        stats = finish_query_stats(request, self)
+        if stats is not None:
+            query_count = stats.count
             response['X-Query-Count'] = str(query_count)
             
             # Log excessive queries
             if query_count > 20:  # More than 20 queries
                 PerformanceLogger.log_slow_query(
                     f"Excessive queries: {request.method} {request.path}",
-                    0,
+                    stats.duration,
                     {"query_count": query_count}
                 )
+            
+            # The same statement over and over usually means an N+1 loop
+            repeated = stats.repeated_queries()
+            if repeated:
+                PerformanceLogger.log_repeated_queries(request, repeated, query_count)
         
         return response
 
@@ -123,23 +139,17 @@ class SecurityEventMiddleware(MiddlewareMixin):
     """Middleware to log security events"""
     
     def process_request(self, request):
-        # Log suspicious patterns
-        suspicious_patterns = [
-            '..',  # Path traversal
-            'script',  # XSS attempts
-            'union',  # SQL injection
-            'select',  # SQL injection
-            'drop',  # SQL injection
-        ]
+        # Log suspicious patterns (one pass over path, query and optionally body)
+        matched = get_scanner().scan(request, scan_body=getattr(settings, 'SECURITY_SCAN_BODY', False))
         
-        for pattern in suspicious_patterns:
-            if pattern in request.path.lower() or pattern in str(request.GET).lower():
-                SecurityLogger.log_suspicious_activity(
-                    request.user if hasattr(request, 'user') else None,
-                    'suspicious_pattern',
-                    request.META.get('REMOTE_ADDR'),
-                    {'pattern': pattern, 'path': request.path}
-                )
-                break
+        if matched:
+            for rule in matched:
+                SECURITY_PATTERN_MATCHES.inc(rule=rule)
+            SecurityLogger.log_suspicious_activity(
+                request.user if hasattr(request, 'user') else None,
+                'suspicious_pattern',
+                request.META.get('REMOTE_ADDR'),
+                {'pattern': matched[0], 'rules': matched, 'path': request.path}
+            )
         
-        return None
\ No newline at end of file
+        return None
@@ -2,15 +2,135 @@ from django.core.cache import cache
 from django.http import JsonResponse
 from django.utils.decorators import method_decorator
 from functools import wraps
+from collections import namedtuple
+import logging
+import math
+import threading
 import time
 import hashlib
 
+logger = logging.getLogger(__name__)
+
+RateLimitResult = namedtuple('RateLimitResult', ['allowed', 'limit', 'remaining', 'reset_after', 'retry_after'])
+
+
+# GCRA (generic cell rate algorithm): one stored number per key, the
+# "theoretical arrival time" (TAT) at which the key would be empty again.
+# Each request pushes TAT forward by window / limit; a request is refused
+# when that would put TAT more than one window ahead of now. This limits
+# to `limit` requests per sliding `window` in O(1) time and memory.
+GCRA_SCRIPT = """
+local limit = tonumber(ARGV[1])
+local window = tonumber(ARGV[2])
+local peek = ARGV[3] == '1'
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local interval = window / limit
+
+local tat = tonumber(redis.call('GET', KEYS[1])) or now
+if tat < now then
+    tat = now
+end
+
+if peek then
+    return {1, tostring(tat - now), '0'}
+end
+
+local new_tat = tat + interval
+if new_tat - now > window then
+    return {0, tostring(tat - now), tostring(new_tat - window - now)}
+end
+
+redis.call('SET', KEYS[1], tostring(new_tat), 'PX', math.ceil((new_tat - now) * 1000))
+return {1, tostring(new_tat - now), '0'}
+"""
+
+
+def gcra_result(allowed, limit, window, backlog, retry_after):
+    """Build a RateLimitResult from the seconds of backlog left on the key"""
+    interval = window / limit
+    remaining = max(0, int(math.floor((window - backlog) / interval + 1e-9)))
+    return RateLimitResult(bool(allowed), limit, remaining, backlog, retry_after)
+
+
+class LocalRateLimitBackend:
+    """In-process GCRA limiter, used when the cache is not Redis or Redis is unavailable"""
+
+    MAX_KEYS = 10000
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.tats = {}
+
+    def hit(self, key, limit, window, peek=False):
+        now = time.monotonic()
+        interval = window / limit
+        with self.lock:
+            tat = max(self.tats.get(key, now), now)
+            if peek:
+                return gcra_result(True, limit, window, tat - now, 0)
+
+            new_tat = tat + interval
+            if new_tat - now > window:
+                return gcra_result(False, limit, window, tat - now, new_tat - window - now)
+
+            self.tats[key] = new_tat
+            if len(self.tats) > self.MAX_KEYS:
+                # Keys whose backlog has drained carry no state
+                self.tats = {k: v for k, v in self.tats.items() if v > now}
+            return gcra_result(True, limit, window, new_tat - now, 0)
+
+
+class RedisRateLimitBackend:
+    """GCRA limiter evaluated atomically in Redis by a Lua script (one round trip per check)"""
+
+    def __init__(self, client):
+        self.script = client.register_script(GCRA_SCRIPT)
+
+    def hit(self, key, limit, window, peek=False):
+        allowed, backlog, retry_after = self.script(
+            keys=[cache.make_key(key)], args=[limit, window, '1' if peek else '0']
+        )
+        return gcra_result(allowed, limit, window, float(backlog), float(retry_after))
+
+
+# Seconds to stay on the local limiter after Redis failed
+REDIS_RETRY_AFTER = 30
+
+local_backend = LocalRateLimitBackend()
+_redis_backend = None
+_redis_unavailable_until = 0
+
+
+def mark_redis_unavailable(error):
+    global _redis_unavailable_until
+    _redis_unavailable_until = time.monotonic() + REDIS_RETRY_AFTER
+    logger.warning(f"Redis rate limiter failed, using local limiter for {REDIS_RETRY_AFTER}s: {error}")
+
+
+def get_backend():
+    """Redis backend when the default cache is Redis, otherwise the in-process one"""
+    global _redis_backend
+    if time.monotonic() < _redis_unavailable_until:
+        return local_backend
+    if _redis_backend is None:
+        get_client = getattr(getattr(cache, '_cache', None), 'get_client', None)
+        if get_client is None:
+            return local_backend
+        try:
+            _redis_backend = RedisRateLimitBackend(get_client(write=True))
+        except Exception as e:
+            mark_redis_unavailable(e)
+            return local_backend
+    return _redis_backend
+
 
 class RateLimiter:
-    def __init__(self, requests=100, window=3600, key_func=None):
+    def __init__(self, requests=100, window=3600, key_func=None, backend=None):
         self.requests = requests
         self.window = window
         self.key_func = key_func or self.default_key_func
+        self.backend = backend
     
     def default_key_func(self, request):
         """Default key function based on IP and user"""
@@ -27,38 +147,47 @@ class RateLimiter:
             ip = request.META.get('REMOTE_ADDR')
         return ip
     
+    def check(self, request, peek=False):
+        """Count the request (unless peek) and return allowed, remaining and reset in one call"""
+        key = f"{self.key_func(request)}_{self.requests}_{self.window}"
+        backend = self.backend or get_backend()
+        try:
+            return backend.hit(key, self.requests, self.window, peek=peek)
+        except Exception as e:
+            if backend is local_backend:
+                raise
+            mark_redis_unavailable(e)
+            return local_backend.hit(key, self.requests, self.window, peek=peek)
+    
     def is_allowed(self, request):
         """Check if request is allowed"""
-        key = self.key_func(request)
-        current_time = int(time.time())
-        window_start = current_time - self.window
-        
-        # Get current requests in window
-        requests = cache.get(key, [])
-        
-        # Remove old requests outside window
-        requests = [req_time for req_time in requests if req_time > window_start]
-        
-        # Check if under limit
-        if len(requests) >= self.requests:
-            return False, len(requests)
-        
-        # Add current request
-        requests.append(current_time)
-        cache.set(key, requests, self.window)
-        
-        return True, len(requests)
+        result = self.check(request)
+        return result.allowed, result.limit - result.remaining
     
     def get_remaining_requests(self, request):
         """Get remaining requests in current window"""
-        key = self.key_func(request)
-        current_time = int(time.time())
-        window_start = current_time - self.window
-        
-        requests = cache.get(key, [])
-        requests = [req_time for req_time in requests if req_time > window_start]
-        
-        return max(0, self.requests - len(requests))
+        return self.check(request, peek=True).remaining
+
+
+def add_rate_limit_headers(response, result):
+    response['X-RateLimit-Limit'] = result.limit
+    response['X-RateLimit-Remaining'] = result.remaining
+    response['X-RateLimit-Reset'] = int(time.time() + math.ceil(result.reset_after))
+    return response
+
+
+def rate_limit_exceeded_response(result):
+    """429 response for a refused request"""
+    response = JsonResponse({
+        'error': 'Rate limit exceeded',
+        'limit': result.limit,
+        'current': result.limit - result.remaining,
+        'remaining': result.remaining,
+        'reset_time': int(time.time() + math.ceil(result.reset_after)),
+        'retry_after': math.ceil(result.retry_after),
+    }, status=429)
+    response['Retry-After'] = math.ceil(result.retry_after)
+    return add_rate_limit_headers(response, result)
 
 
 def rate_limit(requests=100, window=3600, key_func=None):
@@ -68,36 +197,14 @@ def rate_limit(requests=100, window=3600, key_func=None):
     def decorator(view_func):
         @wraps(view_func)
         def wrapper(request, *args, **kwargs):
-            allowed, current_count = limiter.is_allowed(request)
+            result = limiter.check(request)
             
-            if not allowed:
-                remaining = limiter.get_remaining_requests(request)
-                reset_time = int(time.time()) + limiter.window
-                
-                response = JsonResponse({
-                    'error': 'Rate limit exceeded',
-                    'limit': limiter.requests,
-                    'current': current_count,
-                    'remaining': remaining,
-                    'reset_time': reset_time
-                }, status=429)
-                
-                response['X-RateLimit-Limit'] = limiter.requests
-                response['X-RateLimit-Remaining'] = remaining
-                response['X-RateLimit-Reset'] = reset_time
-                
-                return response
+            if not result.allowed:
+                return rate_limit_exceeded_response(result)
             
             # Add rate limit headers to successful response
             response = view_func(request, *args, **kwargs)
-            remaining = limiter.get_remaining_requests(request)
-            reset_time = int(time.time()) + limiter.window
-            
-            response['X-RateLimit-Limit'] = limiter.requests
-            response['X-RateLimit-Remaining'] = remaining
-            response['X-RateLimit-Reset'] = reset_time
-            
-            return response
+            return add_rate_limit_headers(response, result)
         
         return wrapper
     return decorator
@@ -107,41 +214,19 @@ def rate_limit_class(requests=100, window=3600, key_func=None):
     """Rate limiting decorator for class-based views"""
     def decorator(cls):
         original_dispatch = cls.dispatch
+        limiter = RateLimiter(requests, window, key_func)
         
         def dispatch(self, request, *args, **kwargs):
-            limiter = RateLimiter(requests, window, key_func)
-            allowed, current_count = limiter.is_allowed(request)
+            result = limiter.check(request)
             
-            if not allowed:
-                remaining = limiter.get_remaining_requests(request)
-                reset_time = int(time.time()) + limiter.window
-                
-                response = JsonResponse({
-                    'error': 'Rate limit exceeded',
-                    'limit': limiter.requests,
-                    'current': current_count,
-                    'remaining': remaining,
-                    'reset_time': reset_time
-                }, status=429)
-                
-                response['X-RateLimit-Limit'] = limiter.requests
-                response['X-RateLimit-Remaining'] = remaining
-                response['X-RateLimit-Reset'] = reset_time
-                
-                return response
+            if not result.allowed:
+                return rate_limit_exceeded_response(result)
             
             # Call original dispatch
             response = original_dispatch(self, request, *args, **kwargs)
             
             # Add rate limit headers
-            remaining = limiter.get_remaining_requests(request)
-            reset_time = int(time.time()) + limiter.window
-            
-            response['X-RateLimit-Limit'] = limiter.requests
-            response['X-RateLimit-Remaining'] = remaining
-            response['X-RateLimit-Reset'] = reset_time
-            
-            return response
+            return add_rate_limit_headers(response, result)
         
         cls.dispatch = dispatch
         return cls
@@ -0,0 +1,94 @@
+from django.conf import settings
+from urllib.parse import unquote_plus
+import re
+
+# Rule name -> (regular expression, literal triggers). Word boundaries and
+# keyword pairs keep ordinary words such as "selected" or "dropdown" from
+# matching. A rule's regex only runs when one of its lower-case triggers
+# occurs in the text; a rule given as a bare pattern is always run.
+DEFAULT_RULES = {
+    'path_traversal': (r'(?:\.\.[/\\])|(?:[/\\]\.\.(?:[/\\?#\s]|$))', ('..',)),
+    'xss_script': (r'<\s*/?\s*script\b|javascript\s*:|\bon(?:error|load|mouseover)\s*=', ('script', 'onerror', 'onload', 'onmouseover')),
+    'sql_union': (r'\bunion\b(?:\s|/\*.*?\*/)+(?:all\s+)?select\b', ('union',)),
+    'sql_select': (r'\bselect\b.{1,100}?\bfrom\b', ('select',)),
+    'sql_drop': (r'\bdrop\s+(?:table|database|schema)\b', ('drop',)),
+    'sql_tautology': (r"'\s*or\s+'?\w+'?\s*=\s*'?\w+|\bor\s+1\s*=\s*1\b", ("'", 'or 1')),
+    'sql_comment': (r"'\s*(?:--|#|/\*)", ("'",)),
+}
+
+# Request bodies larger than this are only scanned up to this many bytes
+MAX_BODY_BYTES = 64 * 1024
+
+BODY_CONTENT_TYPES = ('application/x-www-form-urlencoded', 'application/json', 'text/plain')
+
+
+class SecurityScanner:
+    """
+    Suspicious-pattern scanner with the rule set compiled once.
+
+    A request's path, decoded query string and (optionally) body are joined
+    and lower-cased once; a pass over the rules' literal triggers picks the
+    candidate rules, and only their precompiled expressions run. The common,
+    clean request therefore costs a few substring checks and no regex.
+    """
+
+    def __init__(self, rules=None):
+        self.rules = dict(rules or DEFAULT_RULES)
+        invalid = [name for name in self.rules if not name.isidentifier()]
+        if invalid:
+            raise ValueError(f'Rule names must be identifiers: {invalid}')
+
+        self.patterns = {}
+        self.always = []
+        triggers = {}
+        for name, rule in self.rules.items():
+            pattern, rule_triggers = (rule, ()) if isinstance(rule, str) else rule
+            self.patterns[name] = re.compile(pattern, re.IGNORECASE | re.DOTALL)
+            if not rule_triggers:
+                self.always.append(name)
+            for trigger in rule_triggers:
+                triggers.setdefault(trigger.lower(), []).append(name)
+        self.triggers = tuple(triggers.items())
+        self.order = {name: index for index, name in enumerate(self.rules)}
+
+    def scan_text(self, text):
+        """Names of the rules matching text, in rule order"""
+        lowered = text.lower()
+        candidates = set(self.always)
+        for trigger, names in self.triggers:
+            if trigger in lowered:
+                candidates.update(names)
+        if not candidates:
+            return []
+        return [
+            name for name in sorted(candidates, key=self.order.get)
+            if self.patterns[name].search(text)
+        ]
+
+    @staticmethod
+    def request_text(request, scan_body=False):
+        parts = [request.path]
+        query_string = request.META.get('QUERY_STRING')
+        if query_string:
+            parts.append(unquote_plus(query_string))
+        if scan_body and request.method in ('POST', 'PUT', 'PATCH'):
+            content_type = request.META.get('CONTENT_TYPE', '')
+            if content_type.startswith(BODY_CONTENT_TYPES):
+                body = request.body[:MAX_BODY_BYTES].decode('utf-8', errors='ignore')
+                parts.append(unquote_plus(body) if content_type.startswith(BODY_CONTENT_TYPES[0]) else body)
+        return '\n'.join(parts)
+
+    def scan(self, request, scan_body=False):
+        return self.scan_text(self.request_text(request, scan_body))
+
+
+_scanner = None
+
+
+def get_scanner():
+    """Scanner for settings.SECURITY_SCAN_RULES (default rules when unset), compiled on first use"""
+    global _scanner
+    rules = getattr(settings, 'SECURITY_SCAN_RULES', None) or DEFAULT_RULES
+    if _scanner is None or _scanner.rules != rules:
+        _scanner = SecurityScanner(rules)
+    return _scanner
@@ -0,0 +1,106 @@
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet
+from django.db.models import Count, Q, Sum
+from django.utils import timezone
+from datetime import timedelta
+from common.decorators import get_cache_versions
+import hashlib
+
+# Default lifetime of cached stats for dashboard endpoints (seconds)
+STATS_CACHE_TIMEOUT = 30
+
+
+class StatsBuilder:
+    """
+    Declarative stats over a queryset, computed with a single aggregate query.
+
+    Every declared count, sum and choice breakdown becomes one
+    conditional aggregate (COUNT/SUM ... FILTER (WHERE ...)), so a stats
+    endpoint costs one round trip however many breakdowns it reports.
+
+        stats = StatsBuilder(queryset, cache_timeout=STATS_CACHE_TIMEOUT)
+        stats.count('total_invoices')
+        stats.sum('total_amount', 'total_amount')
+        stats.breakdown('status_stats', 'status', Invoice.STATUS_CHOICES)
+        data = stats.build()
+
+    With cache_timeout the result is cached under a key derived from the
+    queryset's SQL (i.e. its filters) and the declared aggregates, stamped
+    with the cache generation of models so that a change to any of them
+    (see invalidate_on_change) is visible before the timeout.
+    """
+
+    def __init__(self, queryset, cache_timeout=None, cache_prefix='stats', models=()):
+        self.queryset = queryset
+        self.cache_timeout = cache_timeout
+        self.cache_prefix = cache_prefix
+        self.models = models
+        self.aggregates = {}
+        self.outputs = []
+
+    def _add(self, aggregate):
+        alias = f'stat_{len(self.aggregates)}'
+        self.aggregates[alias] = aggregate
+        return alias
+
+    def count(self, name, condition=None):
+        """Number of rows, optionally only those matching a Q condition"""
+        self.outputs.append((name, self._add(Count('pk', filter=condition)), 0))
+        return self
+
+    def sum(self, name, field, condition=None, default=0):
+        """Sum of a field or expression, optionally restricted to a Q condition"""
+        self.outputs.append((name, self._add(Sum(field, filter=condition)), default))
+        return self
+
+    def breakdown(self, name, field, choices):
+        """Row count per choice value of a field, e.g. {'draft': 3, 'paid': 5}"""
+        items = [
+            (value, self._add(Count('pk', filter=Q(**{field: value}))))
+            for value, _ in choices
+        ]
+        self.outputs.append((name, items, None))
+        return self
+
+    def now(self):
+        """
+        Current time floored to the cache lifetime, for time-relative
+        conditions; a raw timezone.now() would put a new timestamp into the
+        cache key of every request
+        """
+        now = timezone.now()
+        if not self.cache_timeout:
+            return now
+        return now - timedelta(seconds=now.timestamp() % self.cache_timeout)
+
+    def cache_key(self):
+        try:
+            sql = str(self.queryset.query)
+        except EmptyResultSet:
+            return None
+        key_data = f"{sql}|{sorted((alias, repr(aggregate)) for alias, aggregate in self.aggregates.items())}"
+        versions = get_cache_versions(self.models)
+        if versions:
+            key_data = f"{key_data}|v{'.'.join(str(version) for version in versions)}"
+        return f"{self.cache_prefix}_{hashlib.md5(key_data.encode()).hexdigest()}"
+
+    def build(self):
+        cache_key = self.cache_key() if self.cache_timeout else None
+        if cache_key:
+            cached = cache.get(cache_key)
+            if cached is not None:
+                return cached
+
+        values = self.queryset.order_by().aggregate(**self.aggregates) if self.aggregates else {}
+
+        result = {}
+        for name, target, default in self.outputs:
+            if isinstance(target, list):
+                result[name] = {key: values[alias] or 0 for key, alias in target}
+            else:
+                value = values[target]
+                result[name] = default if value is None else value
+
+        if cache_key:
+            cache.set(cache_key, result, self.cache_timeout)
+        return result
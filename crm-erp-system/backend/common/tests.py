@@ -0,0 +1,176 @@
+import json
+import os
+import pytest
+import tempfile
+from datetime import datetime
+from decimal import Decimal
+from unittest import mock
+from django.core.cache import cache
+from django.db.models import F, Q
+from django.test import RequestFactory, SimpleTestCase, TestCase
+from django.utils import timezone
+from products.models import Product, ProductCategory
+from common.decorators import bump_cache_version, bump_cache_version_on_commit, cache_method, get_cache_versions
+from common.metrics import FileMetricsStore
+from common.security_scanner import SecurityScanner
+from common.stats import StatsBuilder
+
+
+@pytest.mark.unit
+class StatsBuilderTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        Product.objects.create(product_code="P-1", name="الف", status='active', sale_price=Decimal("10"))
+        Product.objects.create(product_code="P-2", name="ب", status='active', sale_price=Decimal("5"), min_stock=3)
+        Product.objects.create(product_code="P-3", name="ج", status='inactive')
+
+    def build(self, queryset, **kwargs):
+        stats = StatsBuilder(queryset, **kwargs)
+        stats.count('total')
+        stats.count('low_stock', Q(current_stock__lte=F('min_stock')))
+        stats.sum('total_price', 'sale_price')
+        stats.breakdown('status_stats', 'status', Product.STATUS_CHOICES)
+        return stats.build()
+
+    def test_single_query(self):
+        """Test counts, sums and breakdowns come from one aggregate query"""
+        with self.assertNumQueries(1):
+            data = self.build(Product.objects.all())
+
+        self.assertEqual(data['total'], 3)
+        self.assertEqual(data['low_stock'], 3)
+        self.assertEqual(data['total_price'], Decimal("15"))
+        self.assertEqual(data['status_stats']['active'], 2)
+        self.assertEqual(data['status_stats']['inactive'], 1)
+
+    def test_cache_is_keyed_on_filters(self):
+        """Test cached results are reused only for the same filters"""
+        self.build(Product.objects.all(), cache_timeout=30)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.build(Product.objects.all(), cache_timeout=30)['total'], 3)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.build(Product.objects.filter(status='active'), cache_timeout=30)['total'], 2)
+
+    def test_now_keeps_cache_key_stable(self):
+        """Test a time-relative condition built from stats.now() reuses the cache within its lifetime"""
+        def recent():
+            stats = StatsBuilder(Product.objects.all(), cache_timeout=30)
+            stats.count('recent', Q(created_at__lt=stats.now()))
+            return stats
+
+        with mock.patch('common.stats.timezone.now', return_value=timezone.make_aware(datetime(2025, 1, 1, 12, 0, 1))):
+            first = recent().cache_key()
+        with mock.patch('common.stats.timezone.now', return_value=timezone.make_aware(datetime(2025, 1, 1, 12, 0, 29))):
+            self.assertEqual(recent().cache_key(), first)
+        with mock.patch('common.stats.timezone.now', return_value=timezone.make_aware(datetime(2025, 1, 1, 12, 0, 31))):
+            self.assertNotEqual(recent().cache_key(), first)
+
+
+@pytest.mark.unit
+class VersionedCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.calls = 0
+
+        @cache_method(timeout=60, key_prefix='active_products', models=(Product,))
+        def active_count():
+            self.calls += 1
+            return Product.objects.filter(status='active').count()
+
+        self.active_count = active_count
+
+    def test_result_is_cached_until_model_changes(self):
+        """Test saving or deleting a product starts a new cache generation"""
+        self.assertEqual(self.active_count(), 0)
+        self.assertEqual(self.active_count(), 0)
+        self.assertEqual(self.calls, 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            product = Product.objects.create(product_code="P-1", name="الف", status='active')
+        self.assertEqual(self.active_count(), 1)
+        self.assertEqual(self.calls, 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            product.delete()
+        self.assertEqual(self.active_count(), 0)
+        self.assertEqual(self.calls, 3)
+
+    def test_invalidation_waits_for_commit(self):
+        """Test the generation is bumped only once the saving transaction commits"""
+        version = get_cache_versions([Product])[0]
+        with self.captureOnCommitCallbacks() as callbacks:
+            Product.objects.create(product_code="P-1", name="الف")
+            self.assertEqual(get_cache_versions([Product])[0], version)
+
+        for callback in callbacks:
+            callback()
+        self.assertGreater(get_cache_versions([Product])[0], version)
+
+    def test_cache_outage_does_not_fail_save(self):
+        """Test an unreachable cache is logged instead of failing the save"""
+        with mock.patch('common.decorators.cache.incr', side_effect=ConnectionError), \
+                self.assertLogs('common.decorators', level='WARNING'):
+            with self.captureOnCommitCallbacks(execute=True):
+                Product.objects.create(product_code="P-1", name="الف")
+
+        self.assertTrue(Product.objects.filter(product_code="P-1").exists())
+
+    def test_bump_increments_version(self):
+        """Test invalidation is a counter increment and other namespaces keep their version"""
+        product_version, category_version = get_cache_versions([Product, ProductCategory])
+        bump_cache_version(Product)
+        self.assertEqual(get_cache_versions([Product, ProductCategory]), [product_version + 1, category_version])
+
+    def test_bump_without_counter_creates_it(self):
+        """Test bumping a namespace that was never read does not fail"""
+        bump_cache_version('reports')
+        self.assertIsNotNone(cache.get('cache_version:reports'))
+
+    def test_stats_are_invalidated_by_model_changes(self):
+        """Test cached stats stamped with a model are recomputed once it changes"""
+        def total():
+            stats = StatsBuilder(Product.objects.all(), cache_timeout=30, models=(Product,))
+            stats.count('total')
+            return stats.build()['total']
+
+        self.assertEqual(total(), 0)
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.create(product_code="P-1", name="الف")
+        self.assertEqual(total(), 1)
+
+    def test_bump_on_commit_for_bulk_writes(self):
+        """Test writes that skip the signals can bump after their transaction commits"""
+        version = get_cache_versions([Product])[0]
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.filter(status='active').update(status='inactive')
+            bump_cache_version_on_commit(Product)
+            self.assertEqual(get_cache_versions([Product])[0], version)
+        self.assertGreater(get_cache_versions([Product])[0], version)
+
+
+@pytest.mark.unit
+class SecurityScannerTest(SimpleTestCase):
+    def setUp(self):
+        self.scanner = SecurityScanner()
+
+    def test_path_traversal_at_segment_end(self):
+        """Test a trailing '/..' is caught whether or not a query string follows"""
+        factory = RequestFactory()
+        self.assertIn('path_traversal', self.scanner.scan(factory.get('/files/..')))
+        self.assertIn('path_traversal', self.scanner.scan(factory.get('/files/..', {'page': 2})))
+        self.assertEqual(self.scanner.scan(factory.get('/files/a..b', {'page': 2})), [])
+
+
+@pytest.mark.unit
+class FileMetricsStoreTest(SimpleTestCase):
+    def test_files_of_dead_workers_are_removed(self):
+        """Test opening the store drops the files of exited processes and keeps live ones"""
+        with tempfile.TemporaryDirectory() as directory:
+            dead_pid = 2 ** 22 + 1
+            for name in [f'metrics_{dead_pid}.json', f'metrics_{dead_pid}.json.tmp', f'metrics_{os.getpid()}.json']:
+                with open(os.path.join(directory, name), 'w') as f:
+                    json.dump({}, f)
+
+            FileMetricsStore(directory)
+
+            self.assertEqual(os.listdir(directory), [f'metrics_{os.getpid()}.json'])
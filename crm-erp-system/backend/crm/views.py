@@ -2,8 +2,9 @@ from rest_framework import viewsets, filters, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from django_filters.rest_framework import DjangoFilterBackend
-from django.db.models import Q, F, Sum, Count
+from django.db.models import Q, F, Count
 from django.utils import timezone
+from common.stats import STATS_CACHE_TIMEOUT, StatsBuilder
 from .models import SalesProcess, ProcessStage, ProcessActivity, Lead, Task
 from .serializers import (
     SalesProcessSerializer, SalesProcessListSerializer, ProcessStageSerializer,
@@ -51,25 +52,14 @@ class SalesProcessViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['get'])
     def stats(self, request):
         """آمار کلی فرایندهای فروش"""
-        total_processes = self.get_queryset().count()
-        total_value = self.get_queryset().aggregate(total=Sum('estimated_value'))['total'] or 0
-        weighted_value = self.get_queryset().aggregate(total=Sum('weighted_value'))['total'] or 0
-        
-        type_stats = {}
-        for process_type, _ in SalesProcess.PROCESS_TYPES:
-            type_stats[process_type] = self.get_queryset().filter(process_type=process_type).count()
-        
-        priority_stats = {}
-        for priority, _ in SalesProcess.PRIORITY_LEVELS:
-            priority_stats[priority] = self.get_queryset().filter(priority=priority).count()
-        
-        return Response({
-            'total_processes': total_processes,
-            'total_value': total_value,
-            'weighted_value': weighted_value,
-            'type_stats': type_stats,
-            'priority_stats': priority_stats,
-        })
+        stats = StatsBuilder(self.get_queryset(), cache_timeout=STATS_CACHE_TIMEOUT)
+        stats.count('total_processes')
+        stats.sum('total_value', 'estimated_value')
+        stats.sum('weighted_value', F('estimated_value') * F('probability') / 100)
+        stats.breakdown('type_stats', 'process_type', SalesProcess.PROCESS_TYPES)
+        stats.breakdown('priority_stats', 'priority', SalesProcess.PRIORITY_LEVELS)
+        
+        return Response(stats.build())
     
     @action(detail=True, methods=['post'])
     def add_stage(self, request, pk=None):
@@ -203,25 +193,14 @@ class LeadViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['get'])
     def stats(self, request):
         """آمار کلی سرنخ‌ها"""
-        total_leads = self.get_queryset().count()
-        total_value = self.get_queryset().aggregate(total=Sum('estimated_value'))['total'] or 0
-        converted_leads = self.get_queryset().filter(status='converted').count()
-        
-        source_stats = {}
-        for source, _ in Lead.LEAD_SOURCES:
-            source_stats[source] = self.get_queryset().filter(source=source).count()
-        
-        status_stats = {}
-        for status, _ in Lead.STATUS_CHOICES:
-            status_stats[status] = self.get_queryset().filter(status=status).count()
-        
-        return Response({
-            'total_leads': total_leads,
-            'total_value': total_value,
-            'converted_leads': converted_leads,
-            'source_stats': source_stats,
-            'status_stats': status_stats,
-        })
+        stats = StatsBuilder(self.get_queryset(), cache_timeout=STATS_CACHE_TIMEOUT)
+        stats.count('total_leads')
+        stats.sum('total_value', 'estimated_value')
+        stats.count('converted_leads', Q(status='converted'))
+        stats.breakdown('source_stats', 'source', Lead.LEAD_SOURCES)
+        stats.breakdown('status_stats', 'status', Lead.STATUS_CHOICES)
+        
+        return Response(stats.build())
     
     @action(detail=True, methods=['post'])
     def convert_to_customer(self, request, pk=None):
@@ -300,30 +279,15 @@ class TaskViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['get'])
     def stats(self, request):
         """آمار کلی وظایف"""
-        total_tasks = self.get_queryset().count()
-        completed_tasks = self.get_queryset().filter(status='completed').count()
-        pending_tasks = self.get_queryset().filter(status='pending').count()
-        overdue_tasks = self.get_queryset().filter(
-            due_date__lt=timezone.now(),
-            status__in=['pending', 'in_progress']
-        ).count()
-        
-        priority_stats = {}
-        for priority, _ in Task.PRIORITY_LEVELS:
-            priority_stats[priority] = self.get_queryset().filter(priority=priority).count()
-        
-        status_stats = {}
-        for status, _ in Task.STATUS_CHOICES:
-            status_stats[status] = self.get_queryset().filter(status=status).count()
-        
-        return Response({
-            'total_tasks': total_tasks,
-            'completed_tasks': completed_tasks,
-            'pending_tasks': pending_tasks,
-            'overdue_tasks': overdue_tasks,
-            'priority_stats': priority_stats,
-            'status_stats': status_stats,
-        })
+        stats = StatsBuilder(self.get_queryset(), cache_timeout=STATS_CACHE_TIMEOUT)
+        stats.count('total_tasks')
+        stats.count('completed_tasks', Q(status='completed'))
+        stats.count('pending_tasks', Q(status='pending'))
+        stats.count('overdue_tasks', Q(due_date__lt=stats.now(), status__in=['pending', 'in_progress']))
+        stats.breakdown('priority_stats', 'priority', Task.PRIORITY_LEVELS)
+        stats.breakdown('status_stats', 'status', Task.STATUS_CHOICES)
+        
+        return Response(stats.build())
     
     @action(detail=True, methods=['post'])
     def complete(self, request, pk=None):
@@ -55,6 +55,7 @@ INSTALLED_APPS = [
     'reports',
     'accounting',
     'tax_system',
+    'notifications',
 ]
 
 MIDDLEWARE = [
@@ -236,6 +237,9 @@ SECURE_HSTS_INCLUDE_SUBDOMAINS = True
 SECURE_HSTS_PRELOAD = True
 
 # Logging Configuration
+# setup_logging applies LOGGING, routes structlog through it and writes the
+# performance/security/crm_erp loggers from a background thread
+LOGGING_CONFIG = 'common.logging_config.setup_logging'
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
@@ -288,6 +292,11 @@ LOGGING = {
             'level': 'INFO',
             'propagate': False,
         },
+        'crm_erp': {
+            'handlers': ['console', 'file'],
+            'level': 'INFO',
+            'propagate': False,
+        },
     },
 }
 
@@ -297,3 +306,13 @@ MEDIA_ROOT = BASE_DIR / 'media'
 
 # Static files
 STATIC_ROOT = BASE_DIR / 'staticfiles'
+
+# Metrics (/metrics, Prometheus text format)
+# With several worker processes, point this at a directory shared by them so
+# every scrape returns the totals of all workers.
+METRICS_MULTIPROC_DIR = config('METRICS_MULTIPROC_DIR', default='')
+METRICS_ALLOWED_IPS = config('METRICS_ALLOWED_IPS', default='127.0.0.1').split(',')
+
+# Notifications: read notifications older than this are moved to the archive
+# table by `manage.py archive_notifications` (run daily)
+NOTIFICATION_RETENTION_DAYS = config('NOTIFICATION_RETENTION_DAYS', default=90, cast=int)
@@ -2,6 +2,7 @@ from django.contrib import admin
 from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
+from common.metrics import metrics_view
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -15,6 +16,8 @@ urlpatterns = [
     path('api/v1/accounting/', include('accounting.urls')),
     path('api/v1/tax/', include('tax_system.urls')),
     path('api/v1/reports/', include('reports.urls')),
+    path('api/v1/notifications/', include('notifications.urls')),
+    path('metrics', metrics_view, name='metrics'),
 ]
 
 if settings.DEBUG:
@@ -0,0 +1,6 @@
+from common.decorators import invalidate_on_change
+from .models import Customer, CustomerCategory, CustomerCategoryMembership
+
+invalidate_on_change(Customer)
+invalidate_on_change(CustomerCategory)
+invalidate_on_change(CustomerCategoryMembership, Customer)
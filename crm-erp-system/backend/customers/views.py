@@ -2,8 +2,8 @@ from rest_framework import viewsets, filters, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from django_filters.rest_framework import DjangoFilterBackend
-from django.db.models import Q, Prefetch, Count, Sum
-from django.core.cache import cache
+from django.db.models import Q, Prefetch, Sum
+from common.stats import StatsBuilder
 from .models import Customer, CustomerCategory, CustomerCategoryMembership
 from .serializers import CustomerSerializer, CustomerCategorySerializer, CustomerCategoryMembershipSerializer
 
@@ -35,24 +35,13 @@ class CustomerViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['get'])
     def stats(self, request):
         """آمار کلی مشتریان با کش"""
-        cache_key = f"customer_stats_{request.user.id}"
-        cached_stats = cache.get(cache_key)
+        stats = StatsBuilder(self.get_queryset(), cache_timeout=300, models=(Customer,))
+        stats.count('total_customers')
+        stats.count('active_customers', Q(status='active'))
+        stats.count('individual_customers', Q(customer_type='individual'))
+        stats.count('legal_customers', Q(customer_type='legal'))
         
-        if cached_stats:
-            return Response(cached_stats)
-        
-        # Optimized single query for all stats
-        stats = self.get_queryset().aggregate(
-            total_customers=Count('id'),
-            active_customers=Count('id', filter=Q(status='active')),
-            individual_customers=Count('id', filter=Q(customer_type='individual')),
-            legal_customers=Count('id', filter=Q(customer_type='legal'))
-        )
-        
-        # Cache for 5 minutes
-        cache.set(cache_key, stats, 300)
-        
-        return Response(stats)
+        return Response(stats.build())
     
     @action(detail=True, methods=['post'])
     def add_tags(self, request, pk=None):
@@ -0,0 +1,142 @@
+import random
+import threading
+import time
+from decimal import Decimal
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.db.models import Case, DecimalField, F, Sum, Value, When
+from products.models import Product
+from inventory.models import InventoryItem, StockMovement, Warehouse
+from inventory.services import InventoryError, InventoryMovementService, MovementLine
+
+BENCH_PREFIX = 'BENCH-STOCK'
+REFERENCE_TYPE = 'benchmark'
+
+
+class Command(BaseCommand):
+    help = (
+        'Hammer the inventory movement service from concurrent workers and verify '
+        'that no update was lost (requires a database with row locking, e.g. PostgreSQL)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=8, help='Number of concurrent threads')
+        parser.add_argument('--movements', type=int, default=500, help='Batches submitted per worker')
+        parser.add_argument('--lines', type=int, default=3, help='Movement lines per batch')
+        parser.add_argument('--products', type=int, default=5, help='Number of hot inventory items')
+        parser.add_argument('--initial-quantity', type=int, default=1000)
+        parser.add_argument('--keep', action='store_true', help='Keep the benchmark data afterwards')
+
+    def setup_data(self, products, initial_quantity):
+        warehouse = Warehouse.objects.create(name='Benchmark', code=f'{BENCH_PREFIX}-WH', address='-')
+        product_ids = []
+        for index in range(products):
+            product = Product.objects.create(
+                product_code=f'{BENCH_PREFIX}-{index}', name=f'Benchmark {index}', cost_price=Decimal('10')
+            )
+            product_ids.append(product.pk)
+        InventoryItem.objects.bulk_create([
+            InventoryItem(product_id=product_id, warehouse=warehouse, quantity=initial_quantity)
+            for product_id in product_ids
+        ])
+        return warehouse, product_ids
+
+    def cleanup(self):
+        Product.objects.filter(product_code__startswith=BENCH_PREFIX).delete()
+        Warehouse.objects.filter(code__startswith=BENCH_PREFIX).delete()
+
+    def worker(self, warehouse_id, product_ids, batches, lines_per_batch, stats, lock):
+        service = InventoryMovementService(reference_type=REFERENCE_TYPE)
+        applied = rejected = 0
+        try:
+            for _ in range(batches):
+                lines = [
+                    MovementLine(
+                        random.choice(['in', 'out', 'out', 'reserve', 'unreserve']),
+                        random.choice(product_ids),
+                        warehouse_id,
+                        random.randint(1, 5),
+                    )
+                    for _ in range(lines_per_batch)
+                ]
+                try:
+                    applied += len(service.apply(lines))
+                except InventoryError:
+                    rejected += 1
+        finally:
+            connections.close_all()
+        with lock:
+            stats['applied'] += applied
+            stats['rejected'] += rejected
+
+    def verify(self, warehouse_id, initial_quantity):
+        """Compare every item against initial quantity + the sum of its recorded movements"""
+        signed = Case(
+            When(movement_type='in', then=F('quantity')),
+            When(movement_type='out', then=-F('quantity')),
+            default=Value(0),
+            output_field=DecimalField(max_digits=12, decimal_places=2),
+        )
+        reserved = Case(
+            When(movement_type='reserve', then=F('quantity')),
+            When(movement_type='unreserve', then=-F('quantity')),
+            default=Value(0),
+            output_field=DecimalField(max_digits=12, decimal_places=2),
+        )
+        expected = {
+            row['product_id']: row
+            for row in StockMovement.objects.filter(
+                warehouse_id=warehouse_id, reference_type=REFERENCE_TYPE
+            ).values('product_id').annotate(quantity=Sum(signed), reserved=Sum(reserved)).order_by()
+        }
+
+        mismatches = []
+        for item in InventoryItem.objects.filter(warehouse_id=warehouse_id):
+            row = expected.get(item.product_id, {'quantity': 0, 'reserved': 0})
+            expected_quantity = initial_quantity + (row['quantity'] or 0)
+            expected_reserved = row['reserved'] or 0
+            if item.quantity != expected_quantity or item.reserved_quantity != expected_reserved:
+                mismatches.append((item.product_id, item.quantity, expected_quantity))
+            if item.quantity < 0 or item.reserved_quantity > item.quantity:
+                mismatches.append((item.product_id, item.quantity, 'invalid'))
+        return mismatches
+
+    def handle(self, *args, **options):
+        if connection.vendor == 'sqlite':
+            raise CommandError('SQLite has no row locking; run the benchmark against PostgreSQL')
+
+        self.cleanup()
+        warehouse, product_ids = self.setup_data(options['products'], options['initial_quantity'])
+        stats = {'applied': 0, 'rejected': 0}
+        lock = threading.Lock()
+
+        threads = [
+            threading.Thread(
+                target=self.worker,
+                args=(warehouse.pk, product_ids, options['movements'], options['lines'], stats, lock),
+            )
+            for _ in range(options['workers'])
+        ]
+        started = time.monotonic()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        duration = time.monotonic() - started
+
+        mismatches = self.verify(warehouse.pk, options['initial_quantity'])
+        rate = stats['applied'] / duration if duration else 0
+        self.stdout.write(
+            f"{options['workers']} workers applied {stats['applied']} movements "
+            f"({stats['rejected']} batches rejected for insufficient stock) in {duration:.2f}s "
+            f"- {rate:.1f} movements/sec"
+        )
+
+        if not options['keep']:
+            self.cleanup()
+
+        if mismatches:
+            for product_id, actual, expected in mismatches:
+                self.stdout.write(self.style.ERROR(f'Product {product_id}: quantity {actual}, expected {expected}'))
+            raise CommandError(f'{len(mismatches)} inventory items lost updates')
+        self.stdout.write(self.style.SUCCESS('No lost updates'))
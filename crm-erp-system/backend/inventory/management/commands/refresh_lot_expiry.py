@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from inventory.services import LotExpiryService
+
+
+class Command(BaseCommand):
+    help = 'Recompute the lot expiry buckets of every warehouse (run daily, after midnight)'
+
+    def handle(self, *args, **options):
+        count = LotExpiryService.refresh()
+        self.stdout.write(self.style.SUCCESS(f'Refreshed lot expiry summary of {count} warehouses'))
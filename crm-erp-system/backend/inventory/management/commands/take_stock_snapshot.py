@@ -0,0 +1,32 @@
+from datetime import date, timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from inventory.valuation import StockValuationService
+
+
+class Command(BaseCommand):
+    help = 'Store the stock quantity/cost snapshot of every product and warehouse at the end of a day'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', help='Snapshot date (YYYY-MM-DD), defaults to yesterday')
+        parser.add_argument(
+            '--period',
+            choices=['daily', 'monthly'],
+            help='Snapshot period; defaults to monthly on the last day of a month, otherwise daily',
+        )
+
+    def handle(self, *args, **options):
+        if options['date']:
+            try:
+                snapshot_date = date.fromisoformat(options['date'])
+            except ValueError:
+                raise CommandError(f"Invalid date: {options['date']}")
+        else:
+            snapshot_date = timezone.localdate() - timedelta(days=1)
+
+        period = options['period']
+        if not period:
+            period = 'monthly' if (snapshot_date + timedelta(days=1)).day == 1 else 'daily'
+
+        rows = StockValuationService.take_snapshot(snapshot_date, period=period)
+        self.stdout.write(self.style.SUCCESS(f'Stored {rows} {period} snapshot rows for {snapshot_date}'))
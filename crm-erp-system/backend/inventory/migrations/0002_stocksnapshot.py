@@ -0,0 +1,36 @@
+# Generated by Django 5.2.6 on 2026-10-16 22:43
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0001_initial'),
+        ('products', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('snapshot_date', models.DateField(verbose_name='تاریخ')),
+                ('period', models.CharField(choices=[('daily', 'روزانه'), ('monthly', 'ماهانه')], default='daily', max_length=10, verbose_name='دوره')),
+                ('quantity', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='مقدار')),
+                ('average_cost', models.DecimalField(decimal_places=4, default=0, max_digits=14, verbose_name='میانگین موزون بهای واحد')),
+                ('fifo_layers', models.JSONField(blank=True, default=list, verbose_name='لایه\u200cهای FIFO')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='تاریخ ایجاد')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_snapshots', to='products.product', verbose_name='محصول')),
+                ('warehouse', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_snapshots', to='inventory.warehouse', verbose_name='انبار')),
+            ],
+            options={
+                'verbose_name': 'عکس موجودی',
+                'verbose_name_plural': 'عکس\u200cهای موجودی',
+                'ordering': ['-snapshot_date'],
+                'indexes': [models.Index(fields=['snapshot_date', 'warehouse'], name='inventory_s_snapsho_5622e5_idx')],
+                'unique_together': {('product', 'warehouse', 'snapshot_date')},
+            },
+        ),
+    ]
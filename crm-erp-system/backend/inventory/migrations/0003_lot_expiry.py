@@ -0,0 +1,47 @@
+# Generated by Django 5.2.6 on 2026-10-16 22:45
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0002_stocksnapshot'),
+        ('products', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LotExpirySummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('as_of', models.DateField(verbose_name='محاسبه برای تاریخ')),
+                ('total_lots', models.PositiveIntegerField(default=0, verbose_name='تعداد کل لات\u200cها')),
+                ('expired_lots', models.PositiveIntegerField(default=0, verbose_name='لات\u200cهای منقضی')),
+                ('expired_quantity', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='مقدار منقضی')),
+                ('expiring_7_lots', models.PositiveIntegerField(default=0, verbose_name='انقضا تا ۷ روز')),
+                ('expiring_7_quantity', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='مقدار انقضا تا ۷ روز')),
+                ('expiring_30_lots', models.PositiveIntegerField(default=0, verbose_name='انقضا ۷ تا ۳۰ روز')),
+                ('expiring_30_quantity', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='مقدار انقضا ۷ تا ۳۰ روز')),
+                ('expiring_90_lots', models.PositiveIntegerField(default=0, verbose_name='انقضا ۳۰ تا ۹۰ روز')),
+                ('expiring_90_quantity', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='مقدار انقضا ۳۰ تا ۹۰ روز')),
+                ('refreshed_at', models.DateTimeField(auto_now=True, verbose_name='آخرین بروزرسانی')),
+            ],
+            options={
+                'verbose_name': 'خلاصه انقضای لات',
+                'verbose_name_plural': 'خلاصه انقضای لات\u200cها',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='lotnumber',
+            index=models.Index(fields=['product', 'warehouse', 'expiry_date'], name='inventory_l_product_b8d5cf_idx'),
+        ),
+        migrations.AddField(
+            model_name='lotexpirysummary',
+            name='warehouse',
+            field=models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='lot_expiry_summary', to='inventory.warehouse', verbose_name='انبار'),
+        ),
+    ]
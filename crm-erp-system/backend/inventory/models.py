@@ -153,6 +153,7 @@ class LotNumber(models.Model):
             models.Index(fields=['lot_number']),
             models.Index(fields=['product']),
             models.Index(fields=['expiry_date']),
+            models.Index(fields=['product', 'warehouse', 'expiry_date']),
         ]
     
     def __str__(self):
@@ -174,6 +175,35 @@ class LotNumber(models.Model):
         return None
 
 
+class LotExpirySummary(models.Model):
+    """خلاصه انقضای لات‌های موجود هر انبار - برای داشبورد، به صورت افزایشی بروزرسانی می‌شود"""
+    
+    warehouse = models.OneToOneField(
+        Warehouse, 
+        on_delete=models.CASCADE, 
+        related_name='lot_expiry_summary',
+        verbose_name='انبار'
+    )
+    as_of = models.DateField(verbose_name='محاسبه برای تاریخ')
+    total_lots = models.PositiveIntegerField(default=0, verbose_name='تعداد کل لات‌ها')
+    expired_lots = models.PositiveIntegerField(default=0, verbose_name='لات‌های منقضی')
+    expired_quantity = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name='مقدار منقضی')
+    expiring_7_lots = models.PositiveIntegerField(default=0, verbose_name='انقضا تا ۷ روز')
+    expiring_7_quantity = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name='مقدار انقضا تا ۷ روز')
+    expiring_30_lots = models.PositiveIntegerField(default=0, verbose_name='انقضا ۷ تا ۳۰ روز')
+    expiring_30_quantity = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name='مقدار انقضا ۷ تا ۳۰ روز')
+    expiring_90_lots = models.PositiveIntegerField(default=0, verbose_name='انقضا ۳۰ تا ۹۰ روز')
+    expiring_90_quantity = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name='مقدار انقضا ۳۰ تا ۹۰ روز')
+    refreshed_at = models.DateTimeField(auto_now=True, verbose_name='آخرین بروزرسانی')
+    
+    class Meta:
+        verbose_name = 'خلاصه انقضای لات'
+        verbose_name_plural = 'خلاصه انقضای لات‌ها'
+    
+    def __str__(self):
+        return f"{self.warehouse_id} - {self.as_of}"
+
+
 class StockMovement(models.Model):
     """حرکت موجودی"""
     
@@ -404,4 +434,55 @@ class StockAdjustmentItem(models.Model):
     def save(self, *args, **kwargs):
         """محاسبه تفاوت"""
         self.difference = self.actual_quantity - self.current_quantity
-        super().save(*args, **kwargs)
\ No newline at end of file
+        super().save(*args, **kwargs)
+
+
+class StockSnapshot(models.Model):
+    """عکس لحظه‌ای موجودی و ارزش هر محصول در هر انبار در پایان یک روز"""
+    
+    PERIOD_TYPES = [
+        ('daily', 'روزانه'),
+        ('monthly', 'ماهانه'),
+    ]
+    
+    product = models.ForeignKey(
+        Product, 
+        on_delete=models.CASCADE, 
+        related_name='stock_snapshots',
+        verbose_name='محصول'
+    )
+    warehouse = models.ForeignKey(
+        Warehouse, 
+        on_delete=models.CASCADE, 
+        related_name='stock_snapshots',
+        verbose_name='انبار'
+    )
+    snapshot_date = models.DateField(verbose_name='تاریخ')
+    period = models.CharField(
+        max_length=10, 
+        choices=PERIOD_TYPES, 
+        default='daily',
+        verbose_name='دوره'
+    )
+    quantity = models.DecimalField(max_digits=12, decimal_places=2, default=0, verbose_name='مقدار')
+    average_cost = models.DecimalField(
+        max_digits=14, 
+        decimal_places=4, 
+        default=0,
+        verbose_name='میانگین موزون بهای واحد'
+    )
+    # لایه‌های باقیمانده FIFO به صورت [[مقدار، بهای واحد], ...]
+    fifo_layers = models.JSONField(default=list, blank=True, verbose_name='لایه‌های FIFO')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='تاریخ ایجاد')
+    
+    class Meta:
+        verbose_name = 'عکس موجودی'
+        verbose_name_plural = 'عکس‌های موجودی'
+        unique_together = ['product', 'warehouse', 'snapshot_date']
+        ordering = ['-snapshot_date']
+        indexes = [
+            models.Index(fields=['snapshot_date', 'warehouse']),
+        ]
+    
+    def __str__(self):
+        return f"{self.product_id} - {self.warehouse_id} - {self.snapshot_date}"
@@ -0,0 +1,519 @@
+from collections import defaultdict
+from decimal import Decimal, InvalidOperation
+from functools import reduce
+import operator
+import threading
+from datetime import timedelta
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Count, F, Q, Sum
+from django.utils import timezone
+from common.decorators import bump_cache_version_on_commit
+from products.models import Product
+from .models import (
+    InventoryItem, LotExpirySummary, LotNumber, StockAdjustment, StockAdjustmentItem, StockMovement, Warehouse
+)
+import logging
+
+logger = logging.getLogger(__name__)
+
+ZERO = Decimal('0')
+
+
+class InventoryError(Exception):
+    """خطای حرکت موجودی (موجودی ناکافی، ورودی نامعتبر و ...)"""
+
+
+class MovementLine:
+    """One requested stock movement; quantity is the target quantity for adjustments"""
+
+    MOVEMENT_TYPES = {'in', 'out', 'transfer', 'adjustment', 'reserve', 'unreserve'}
+
+    def __init__(self, movement_type, product_id, warehouse_id, quantity, destination_warehouse_id=None,
+                 lot_number_id=None, unit_cost=None, notes=''):
+        if movement_type not in self.MOVEMENT_TYPES:
+            raise InventoryError(f'نوع حرکت نامعتبر است: {movement_type}')
+        try:
+            quantity = Decimal(str(quantity))
+        except (InvalidOperation, TypeError, ValueError):
+            raise InventoryError('مقدار موجودی باید عدد باشد')
+        if quantity < 0 or (quantity == 0 and movement_type != 'adjustment'):
+            raise InventoryError('مقدار باید بزرگتر از صفر باشد')
+        if movement_type == 'transfer':
+            if not destination_warehouse_id:
+                raise InventoryError('انبار مقصد برای انتقال الزامی است')
+            if str(destination_warehouse_id) == str(warehouse_id):
+                raise InventoryError('انبار مبدا و مقصد نمی‌توانند یکسان باشند')
+
+        try:
+            self.product_id = int(product_id)
+            self.warehouse_id = int(warehouse_id)
+            self.destination_warehouse_id = int(destination_warehouse_id) if destination_warehouse_id else None
+            self.unit_cost = Decimal(str(unit_cost)) if unit_cost is not None else None
+            self.lot_number_id = int(lot_number_id) if lot_number_id else None
+        except (InvalidOperation, TypeError, ValueError):
+            raise InventoryError('محصول، انبار، لات یا هزینه واحد نامعتبر است')
+
+        self.movement_type = movement_type
+        self.quantity = quantity
+        self.notes = notes or ''
+
+    @classmethod
+    def from_dict(cls, data):
+        if not isinstance(data, dict):
+            raise InventoryError('هر قلم باید یک شیء باشد')
+        return cls(
+            movement_type=data.get('movement_type'),
+            product_id=data.get('product_id'),
+            warehouse_id=data.get('warehouse_id'),
+            quantity=data.get('quantity'),
+            destination_warehouse_id=data.get('destination_warehouse_id'),
+            lot_number_id=data.get('lot_number_id'),
+            unit_cost=data.get('unit_cost'),
+            notes=data.get('notes', ''),
+        )
+
+
+class InventoryMovementService:
+    """
+    Applies stock movements atomically.
+
+    All inventory rows touched by a batch are locked in primary-key order
+    (so concurrent batches cannot deadlock), validated against the locked
+    values, changed with F() updates and recorded as StockMovement rows in
+    the same transaction. A batch either applies completely or not at all.
+    """
+
+    def __init__(self, user=None, reference_type=None, reference_id=None):
+        self.user = user
+        self.reference_type = reference_type
+        self.reference_id = reference_id
+
+    def move(self, movement_type, product_id, warehouse_id, quantity, **kwargs):
+        """Apply a single movement; see apply() for the batch version"""
+        return self.apply([MovementLine(movement_type, product_id, warehouse_id, quantity, **kwargs)])[0]
+
+    @staticmethod
+    def _lock_items(keys, create_missing):
+        """Lock the inventory rows for the (product_id, warehouse_id) keys; returns key -> item"""
+        if create_missing:
+            InventoryItem.objects.bulk_create(
+                [InventoryItem(product_id=product_id, warehouse_id=warehouse_id) for product_id, warehouse_id in create_missing],
+                ignore_conflicts=True,
+            )
+        condition = reduce(operator.or_, (Q(product_id=p, warehouse_id=w) for p, w in keys))
+        items = InventoryItem.objects.select_for_update().filter(condition).order_by('pk')
+        return {(item.product_id, item.warehouse_id): item for item in items}
+
+    def apply(self, lines):
+        """
+        Apply a list of MovementLine objects (e.g. all lines of an invoice) in
+        one transaction and return the created StockMovement rows.
+
+        Raises InventoryError, leaving stock untouched, if any line would make
+        the on-hand quantity negative or reserve more than is available.
+        """
+        if not lines:
+            return []
+
+        keys = set()
+        incoming = set()
+        for line in lines:
+            keys.add((line.product_id, line.warehouse_id))
+            if line.movement_type in ('in', 'adjustment'):
+                incoming.add((line.product_id, line.warehouse_id))
+            if line.movement_type == 'transfer':
+                keys.add((line.product_id, line.destination_warehouse_id))
+                incoming.add((line.product_id, line.destination_warehouse_id))
+
+        costs = dict(Product.objects.filter(
+            pk__in={line.product_id for line in lines if line.unit_cost is None}
+        ).values_list('id', 'cost_price'))
+
+        now = timezone.now()
+        with transaction.atomic():
+            items = self._lock_items(keys, incoming)
+
+            # Deltas per item: [quantity, reserved_quantity]
+            deltas = defaultdict(lambda: [ZERO, ZERO])
+            movements = []
+            for line in lines:
+                key = (line.product_id, line.warehouse_id)
+                if key not in items:
+                    raise InventoryError('آیتم موجودی برای این محصول در انبار یافت نشد')
+
+                quantity = line.quantity
+                if line.movement_type == 'in':
+                    deltas[key][0] += quantity
+                elif line.movement_type == 'out':
+                    deltas[key][0] -= quantity
+                elif line.movement_type == 'transfer':
+                    deltas[key][0] -= quantity
+                    deltas[(line.product_id, line.destination_warehouse_id)][0] += quantity
+                elif line.movement_type == 'reserve':
+                    deltas[key][1] += quantity
+                elif line.movement_type == 'unreserve':
+                    deltas[key][1] -= quantity
+                else:  # adjustment: quantity is the counted target
+                    current = items[key].quantity + deltas[key][0]
+                    quantity = line.quantity - current
+                    deltas[key][0] += quantity
+
+                unit_cost = line.unit_cost if line.unit_cost is not None else costs.get(line.product_id, ZERO)
+                movements.append(StockMovement(
+                    movement_type=line.movement_type,
+                    product_id=line.product_id,
+                    warehouse_id=line.warehouse_id,
+                    destination_warehouse_id=line.destination_warehouse_id,
+                    lot_number_id=line.lot_number_id,
+                    quantity=quantity,
+                    unit_cost=unit_cost,
+                    total_cost=abs(quantity) * unit_cost,
+                    reference_type=self.reference_type,
+                    reference_id=self.reference_id,
+                    notes=line.notes,
+                    movement_date=now,
+                    created_by=self.user,
+                ))
+
+            for key, (quantity_delta, reserved_delta) in deltas.items():
+                item = items[key]
+                new_quantity = item.quantity + quantity_delta
+                new_reserved = item.reserved_quantity + reserved_delta
+                if new_quantity < 0:
+                    raise InventoryError('موجودی نمی‌تواند منفی باشد')
+                if new_reserved < 0:
+                    raise InventoryError('مقدار لغو رزرو بیشتر از مقدار رزرو شده است')
+                if new_reserved > new_quantity:
+                    raise InventoryError('موجودی قابل رزرو کافی نیست')
+
+            for key, (quantity_delta, reserved_delta) in deltas.items():
+                if not quantity_delta and not reserved_delta:
+                    continue
+                InventoryItem.objects.filter(pk=items[key].pk).update(
+                    quantity=F('quantity') + quantity_delta,
+                    reserved_quantity=F('reserved_quantity') + reserved_delta,
+                    last_updated=now,
+                )
+
+            StockMovement.objects.bulk_create(movements)
+            bump_cache_version_on_commit(InventoryItem, StockMovement)
+
+        logger.info(f"Applied {len(movements)} stock movements on {len(deltas)} inventory items")
+        return movements
+
+
+class StockAdjustmentApprovalService:
+    """
+    Set-based approval of a stock adjustment.
+
+    Affected inventory rows are read (and locked) with one query, quantities
+    are written with bulk_update and movements with bulk_create, all inside
+    one transaction. Progress is published to the cache so large physical
+    counts can be approved in the background and polled.
+
+    Background approval runs on a daemon thread of the web process, not a
+    durable queue: a worker restart loses the job. The adjustment then
+    stays 'pending' (the transaction never committed) and its queued or
+    running progress entry expires after ACTIVE_PROGRESS_TIMEOUT, after
+    which the approval can simply be started again.
+    """
+
+    PROGRESS_KEY = 'stock_adjustment_progress_{}'
+    PROGRESS_TIMEOUT = 60 * 60 * 24
+    # Queued/running entries are refreshed on every chunk; a lost job stops blocking retries after this
+    ACTIVE_PROGRESS_TIMEOUT = 60 * 15
+
+    # Counts with at least this many lines are approved in the background by default
+    BACKGROUND_THRESHOLD = 5000
+
+    def __init__(self, adjustment_id, user=None, chunk_size=2000):
+        self.adjustment_id = adjustment_id
+        self.user = user
+        self.chunk_size = chunk_size
+        # Whether the last progress written by this instance was queued/running
+        self.active = False
+
+    @classmethod
+    def get_progress(cls, adjustment_id):
+        return cache.get(cls.PROGRESS_KEY.format(adjustment_id))
+
+    def set_progress(self, status, processed=0, total=0, **extra):
+        active = self.active = status in ('queued', 'running')
+        cache.set(
+            self.PROGRESS_KEY.format(self.adjustment_id),
+            {'status': status, 'processed': processed, 'total': total, **extra},
+            self.ACTIVE_PROGRESS_TIMEOUT if active else self.PROGRESS_TIMEOUT,
+        )
+
+    def approve(self):
+        """Approve the adjustment and apply its counted quantities; returns a summary"""
+        try:
+            return self._approve()
+        except Exception as e:
+            # A 'running' entry left behind would make every retry a 409 until it expired
+            if self.active:
+                self.set_progress('failed', error=str(e))
+            raise
+
+    def _approve(self):
+        with transaction.atomic():
+            adjustment = StockAdjustment.objects.select_for_update().get(pk=self.adjustment_id)
+            if adjustment.status != 'pending':
+                raise InventoryError('فقط تعدیل‌های در انتظار تأیید قابل تأیید هستند')
+
+            lines = list(adjustment.items.values_list(
+                'product_id', 'lot_number_id', 'actual_quantity', 'difference', 'unit_cost'
+            ))
+            # Lot-level lines of the same product are summed into the product's counted quantity
+            counted = defaultdict(lambda: ZERO)
+            for product_id, _, actual_quantity, _, _ in lines:
+                if actual_quantity < 0:
+                    raise InventoryError('مقدار واقعی نمی‌تواند منفی باشد')
+                counted[product_id] += actual_quantity
+
+            total = len(counted) + len(lines)
+            self.set_progress('running', 0, total)
+
+            product_ids = StockAdjustmentItem.objects.filter(adjustment_id=adjustment.pk).values('product_id')
+            items = InventoryItem.objects.select_for_update().filter(
+                warehouse_id=adjustment.warehouse_id, product_id__in=product_ids
+            ).order_by('pk')
+            items_by_product = {item.product_id: item for item in items}
+
+            missing = [product_id for product_id in counted if product_id not in items_by_product]
+            if missing:
+                InventoryItem.objects.bulk_create(
+                    [InventoryItem(product_id=product_id, warehouse_id=adjustment.warehouse_id) for product_id in missing],
+                    batch_size=self.chunk_size,
+                    ignore_conflicts=True,
+                )
+                items_by_product = {item.product_id: item for item in items.all()}
+
+            now = timezone.now()
+            changed = []
+            # Movements record the change against the locked quantity, not the difference stored at count time
+            deltas = {}
+            for product_id, quantity in counted.items():
+                item = items_by_product[product_id]
+                deltas[product_id] = quantity - item.quantity
+                item.quantity = quantity
+                item.last_updated = now
+                changed.append(item)
+
+            processed = 0
+            for start in range(0, len(changed), self.chunk_size):
+                chunk = changed[start:start + self.chunk_size]
+                InventoryItem.objects.bulk_update(chunk, ['quantity', 'last_updated'])
+                processed += len(chunk)
+                self.set_progress('running', processed, total)
+
+            # A product's delta goes to its last line; earlier lot lines of the product keep their own difference
+            movement_lines = []
+            remaining = dict(deltas)
+            last_line = {product_id: index for index, (product_id, *_) in enumerate(lines)}
+            for index, (product_id, lot_number_id, _, difference, unit_cost) in enumerate(lines):
+                delta = remaining[product_id] if last_line[product_id] == index else difference
+                remaining[product_id] -= delta
+                movement_lines.append((product_id, lot_number_id, delta, unit_cost))
+
+            notes = f'تعدیل موجودی - {adjustment.reference_number}'
+            for start in range(0, len(movement_lines), self.chunk_size):
+                chunk = movement_lines[start:start + self.chunk_size]
+                StockMovement.objects.bulk_create([
+                    StockMovement(
+                        movement_type='adjustment',
+                        product_id=product_id,
+                        warehouse_id=adjustment.warehouse_id,
+                        lot_number_id=lot_number_id,
+                        quantity=delta,
+                        unit_cost=unit_cost,
+                        total_cost=abs(delta) * unit_cost,
+                        reference_type='StockAdjustment',
+                        reference_id=adjustment.pk,
+                        notes=notes,
+                        movement_date=now,
+                        created_by=self.user,
+                    )
+                    for product_id, lot_number_id, delta, unit_cost in chunk
+                ])
+                processed += len(chunk)
+                self.set_progress('running', processed, total)
+
+            adjustment.status = 'approved'
+            adjustment.approved_by = self.user
+            adjustment.approved_at = now
+            adjustment.save(update_fields=['status', 'approved_by', 'approved_at'])
+            bump_cache_version_on_commit(InventoryItem, StockMovement)
+
+        result = {'items_updated': len(changed), 'movements_created': len(lines)}
+        self.set_progress('completed', total, total, **result)
+        logger.info(f"Approved stock adjustment {self.adjustment_id}: {result}")
+        return result
+
+    def _run_in_background(self):
+        try:
+            self.approve()
+        except Exception:
+            # approve() has already recorded the failure in the progress entry
+            logger.exception(f"Background approval of stock adjustment {self.adjustment_id} failed")
+        finally:
+            connection.close()
+
+    def approve_in_background(self):
+        """Start the approval on a daemon thread (not durable, see the class docstring); poll get_progress()"""
+        self.set_progress('queued')
+        thread = threading.Thread(target=self._run_in_background, daemon=True)
+        thread.start()
+        return thread
+
+
+class LotExpiryService:
+    """Maintains the per-warehouse lot expiry buckets (LotExpirySummary)"""
+
+    @staticmethod
+    def bucket_aggregates(today):
+        """
+        Conditional aggregates for the disjoint buckets expired / <7d / 7-30d / 30-90d.
+        Like the buckets, total_lots only counts lots that still hold stock.
+        """
+        in_stock = Q(quantity__gt=0)
+        buckets = {
+            'expired': Q(expiry_date__lt=today),
+            'expiring_7': Q(expiry_date__gte=today, expiry_date__lt=today + timedelta(days=7)),
+            'expiring_30': Q(expiry_date__gte=today + timedelta(days=7), expiry_date__lt=today + timedelta(days=30)),
+            'expiring_90': Q(expiry_date__gte=today + timedelta(days=30), expiry_date__lt=today + timedelta(days=90)),
+        }
+        aggregates = {'total_lots': Count('id', filter=in_stock)}
+        for name, condition in buckets.items():
+            aggregates[f'{name}_lots'] = Count('id', filter=in_stock & condition)
+            aggregates[f'{name}_quantity'] = Sum('quantity', filter=in_stock & condition)
+        return aggregates
+
+    @classmethod
+    def refresh(cls, warehouse_ids=None):
+        """
+        Recompute the buckets of the given warehouses (all when None) with one
+        grouped query and upsert the summary rows.
+        """
+        today = timezone.localdate()
+        warehouses = Warehouse.objects.all()
+        lots = LotNumber.objects.all()
+        if warehouse_ids is not None:
+            warehouses = warehouses.filter(pk__in=set(warehouse_ids))
+            lots = lots.filter(warehouse_id__in=set(warehouse_ids))
+        warehouse_ids = set(warehouses.values_list('id', flat=True))
+        totals = {
+            row.pop('warehouse_id'): row
+            for row in lots.values('warehouse_id').annotate(**cls.bucket_aggregates(today)).order_by()
+        }
+
+        with transaction.atomic():
+            existing = {
+                summary.warehouse_id: summary
+                for summary in LotExpirySummary.objects.select_for_update().filter(warehouse_id__in=warehouse_ids)
+            }
+            now = timezone.now()
+            to_create, to_update = [], []
+            for warehouse_id in warehouse_ids:
+                values = {key: value or 0 for key, value in totals.get(warehouse_id, {}).items()}
+                summary = existing.get(warehouse_id) or LotExpirySummary(warehouse_id=warehouse_id)
+                summary.as_of = today
+                summary.refreshed_at = now
+                for field in cls.bucket_aggregates(today):
+                    setattr(summary, field, values.get(field, 0))
+                (to_update if summary.pk else to_create).append(summary)
+
+            LotExpirySummary.objects.bulk_create(to_create)
+            LotExpirySummary.objects.bulk_update(
+                to_update, ['as_of', 'refreshed_at', *cls.bucket_aggregates(today)]
+            )
+        return len(warehouse_ids)
+
+    @classmethod
+    def refresh_on_commit(cls, warehouse_ids):
+        warehouse_ids = set(warehouse_ids)
+        transaction.on_commit(lambda: cls.refresh(warehouse_ids))
+
+    @classmethod
+    def summaries(cls, warehouse_id=None):
+        """Current summary rows; recomputed first when they were built on an earlier day"""
+        queryset = LotExpirySummary.objects.select_related('warehouse').order_by('warehouse_id')
+        if warehouse_id:
+            queryset = queryset.filter(warehouse_id=warehouse_id)
+        summaries = list(queryset)
+        if not summaries or any(summary.as_of < timezone.localdate() for summary in summaries):
+            cls.refresh([warehouse_id] if warehouse_id else None)
+            summaries = list(queryset.all())
+        return summaries
+
+
+class LotAllocationService:
+    """First-expired-first-out allocation of outbound quantities to lots"""
+
+    def __init__(self, user=None, reference_type=None, reference_id=None):
+        self.user = user
+        self.reference_type = reference_type
+        self.reference_id = reference_id
+
+    def allocate(self, product_id, warehouse_id, quantity, allow_expired=False, notes=''):
+        """
+        Take `quantity` out of the product's lots in a warehouse, earliest
+        expiry first (lots without expiry last), and record one 'out'
+        movement per lot used. Lots are read and locked with one ordered
+        query; returns the list of allocations.
+        """
+        try:
+            product_id, warehouse_id = int(product_id), int(warehouse_id)
+        except (TypeError, ValueError):
+            raise InventoryError('شناسه محصول و انبار باید عدد صحیح باشند')
+        try:
+            quantity = Decimal(str(quantity))
+        except (InvalidOperation, TypeError, ValueError):
+            raise InventoryError('مقدار موجودی باید عدد باشد')
+        if quantity <= 0:
+            raise InventoryError('مقدار باید بزرگتر از صفر باشد')
+
+        today = timezone.localdate()
+        with transaction.atomic():
+            lots = LotNumber.objects.select_for_update().filter(
+                product_id=product_id, warehouse_id=warehouse_id, quantity__gt=0
+            )
+            if not allow_expired:
+                lots = lots.exclude(expiry_date__lt=today)
+            lots = lots.order_by(F('expiry_date').asc(nulls_last=True), 'production_date', 'pk')
+
+            allocations = []
+            used_lots = []
+            remaining = quantity
+            for lot in lots:
+                if remaining <= 0:
+                    break
+                taken = min(lot.quantity, remaining)
+                lot.quantity -= taken
+                remaining -= taken
+                used_lots.append(lot)
+                allocations.append({
+                    'lot_id': lot.pk,
+                    'lot_number': lot.lot_number,
+                    'expiry_date': lot.expiry_date,
+                    'quantity': taken,
+                })
+
+            if remaining > 0:
+                raise InventoryError('موجودی لات‌های معتبر برای این مقدار کافی نیست')
+
+            LotNumber.objects.bulk_update(used_lots, ['quantity'])
+            bump_cache_version_on_commit(LotNumber)
+            InventoryMovementService(
+                user=self.user, reference_type=self.reference_type, reference_id=self.reference_id
+            ).apply([
+                MovementLine(
+                    'out', product_id, warehouse_id, allocation['quantity'],
+                    lot_number_id=allocation['lot_id'], notes=notes,
+                )
+                for allocation in allocations
+            ])
+            LotExpiryService.refresh_on_commit([warehouse_id])
+
+        return allocations
@@ -0,0 +1,20 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from common.decorators import invalidate_on_change
+from .models import Warehouse, InventoryItem, LotNumber, StockMovement, StockAdjustment, StockAdjustmentItem
+from .services import LotExpiryService
+
+invalidate_on_change(Warehouse)
+invalidate_on_change(InventoryItem)
+invalidate_on_change(LotNumber)
+# Movements and adjustments change stock levels
+invalidate_on_change(StockMovement, InventoryItem)
+invalidate_on_change(StockAdjustment, InventoryItem)
+invalidate_on_change(StockAdjustmentItem, StockAdjustment, InventoryItem)
+
+
+@receiver(post_save, sender=LotNumber)
+@receiver(post_delete, sender=LotNumber)
+def refresh_lot_expiry_summary(sender, instance, **kwargs):
+    """Recompute the expiry buckets of the lot's warehouse after the change commits"""
+    LotExpiryService.refresh_on_commit([instance.warehouse_id])
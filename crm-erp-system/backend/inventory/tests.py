@@ -1,3 +1,278 @@
+import pytest
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from unittest import mock
+from django.db import DatabaseError
+from common.decorators import get_cache_versions
+from django.contrib.auth import get_user_model
+from django.utils import timezone
 from django.test import TestCase
+from rest_framework.test import APIClient
+from products.models import Product
+from .models import InventoryItem, LotExpirySummary, LotNumber, StockAdjustment, StockAdjustmentItem, StockMovement, StockSnapshot, Warehouse
+from .services import (
+    InventoryError, InventoryMovementService, LotAllocationService, LotExpiryService, MovementLine,
+    StockAdjustmentApprovalService
+)
+from .valuation import StockValuationService
 
-# Create your tests here.
+
+@pytest.mark.unit
+class InventoryMovementServiceTest(TestCase):
+    def setUp(self):
+        self.main = Warehouse.objects.create(name="انبار مرکزی", code="WH1", address="تهران")
+        self.branch = Warehouse.objects.create(name="انبار شعبه", code="WH2", address="کرج")
+        self.product = Product.objects.create(product_code="P-1", name="محصول", cost_price=Decimal("10"))
+        self.item = InventoryItem.objects.create(product=self.product, warehouse=self.main, quantity=Decimal("20"))
+        self.service = InventoryMovementService(reference_type='Invoice', reference_id=7)
+
+    def line(self, movement_type, quantity, **kwargs):
+        return MovementLine(movement_type, self.product.pk, self.main.pk, quantity, **kwargs)
+
+    def test_batch_applies_all_lines(self):
+        """Test a multi-line batch updates stock and records each movement"""
+        movements = self.service.apply([
+            self.line('in', "5"),
+            self.line('out', "8"),
+            self.line('reserve', "3"),
+            self.line('transfer', "4", destination_warehouse_id=self.branch.pk),
+        ])
+
+        self.item.refresh_from_db()
+        self.assertEqual(self.item.quantity, Decimal("13"))
+        self.assertEqual(self.item.reserved_quantity, Decimal("3"))
+        self.assertEqual(InventoryItem.objects.get(warehouse=self.branch).quantity, Decimal("4"))
+        self.assertEqual(len(movements), 4)
+        self.assertEqual(StockMovement.objects.filter(reference_type='Invoice', reference_id=7).count(), 4)
+        self.assertEqual(StockMovement.objects.get(movement_type='out').total_cost, Decimal("80"))
+
+    def test_failing_line_rolls_back_batch(self):
+        """Test insufficient stock rejects the whole batch"""
+        with self.assertRaises(InventoryError):
+            self.service.apply([self.line('in', "5"), self.line('out', "30")])
+
+        self.item.refresh_from_db()
+        self.assertEqual(self.item.quantity, Decimal("20"))
+        self.assertFalse(StockMovement.objects.exists())
+
+    def test_cannot_reserve_more_than_on_hand(self):
+        """Test reservations are limited to on-hand stock"""
+        with self.assertRaises(InventoryError):
+            self.service.move('reserve', self.product.pk, self.main.pk, "21")
+
+    def test_adjustment_sets_counted_quantity(self):
+        """Test adjustment records the signed difference to the counted quantity"""
+        movement = self.service.move('adjustment', self.product.pk, self.main.pk, "15")
+
+        self.item.refresh_from_db()
+        self.assertEqual(self.item.quantity, Decimal("15"))
+        self.assertEqual(movement.quantity, Decimal("-5"))
+
+    def test_batch_invalidates_cached_stock(self):
+        """Test the F() updates and bulk_create of a batch bump the inventory cache generations on commit"""
+        versions = get_cache_versions([InventoryItem, StockMovement])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.service.apply([self.line('in', "5")])
+
+        for before, after in zip(versions, get_cache_versions([InventoryItem, StockMovement])):
+            self.assertGreater(after, before)
+
+    def test_bulk_rejects_malformed_payload(self):
+        """Test a non-object line or a non-numeric reference or lot id is a 400, not a server error"""
+        client = APIClient()
+        client.force_authenticate(get_user_model().objects.create_user(username="storekeeper", password="pass"))
+        line = {'movement_type': 'in', 'product_id': self.product.pk, 'warehouse_id': self.main.pk, 'quantity': "1"}
+
+        for payload in [
+            {'lines': ["in"]},
+            {'lines': [line], 'reference_id': "abc"},
+            {'lines': [dict(line, lot_number_id="abc")]},
+        ]:
+            response = client.post('/api/v1/inventory/stock-movements/bulk/', payload, format='json')
+            self.assertEqual(response.status_code, 400)
+
+        self.assertFalse(StockMovement.objects.exists())
+
+
+@pytest.mark.unit
+class StockAdjustmentApprovalServiceTest(TestCase):
+    def setUp(self):
+        self.warehouse = Warehouse.objects.create(name="انبار مرکزی", code="WH1", address="تهران")
+        self.products = [
+            Product.objects.create(product_code=f"P-{index}", name=f"محصول {index}") for index in range(3)
+        ]
+        InventoryItem.objects.create(product=self.products[0], warehouse=self.warehouse, quantity=Decimal("10"))
+        InventoryItem.objects.create(product=self.products[1], warehouse=self.warehouse, quantity=Decimal("5"))
+        self.adjustment = StockAdjustment.objects.create(
+            warehouse=self.warehouse, adjustment_type='physical_count', reference_number="ADJ-1", status='pending'
+        )
+        for product, current, actual in zip(self.products, ["10", "5", "0"], ["8", "7", "4"]):
+            StockAdjustmentItem.objects.create(
+                adjustment=self.adjustment, product=product, current_quantity=Decimal(current),
+                actual_quantity=Decimal(actual), unit_cost=Decimal("2"),
+            )
+
+    def test_approve_applies_counts_in_bulk(self):
+        """Test approval sets counted quantities and records movements with a fixed number of queries"""
+        with self.assertNumQueries(12):
+            result = StockAdjustmentApprovalService(self.adjustment.pk, chunk_size=2).approve()
+
+        self.assertEqual(result, {'items_updated': 3, 'movements_created': 3})
+        quantities = dict(
+            InventoryItem.objects.filter(warehouse=self.warehouse).values_list('product_id', 'quantity')
+        )
+        self.assertEqual(quantities, {
+            self.products[0].pk: Decimal("8"), self.products[1].pk: Decimal("7"), self.products[2].pk: Decimal("4"),
+        })
+        self.assertEqual(
+            sorted(StockMovement.objects.values_list('quantity', flat=True)), [Decimal("-2"), Decimal("2"), Decimal("4")]
+        )
+        self.adjustment.refresh_from_db()
+        self.assertEqual(self.adjustment.status, 'approved')
+        self.assertEqual(StockAdjustmentApprovalService.get_progress(self.adjustment.pk)['status'], 'completed')
+
+    def test_movements_use_locked_quantity(self):
+        """Test stock that moved after the count is reflected in the adjustment movement and its cost"""
+        InventoryItem.objects.filter(product=self.products[0]).update(quantity=Decimal("11"))
+
+        StockAdjustmentApprovalService(self.adjustment.pk).approve()
+
+        movement = StockMovement.objects.get(product=self.products[0])
+        self.assertEqual(movement.quantity, Decimal("-3"))
+        self.assertEqual(movement.total_cost, Decimal("6"))
+
+    def test_approve_twice_is_rejected(self):
+        """Test an approved adjustment cannot be applied again"""
+        StockAdjustmentApprovalService(self.adjustment.pk).approve()
+
+        with self.assertRaises(InventoryError):
+            StockAdjustmentApprovalService(self.adjustment.pk).approve()
+        self.assertEqual(StockMovement.objects.count(), 3)
+
+    def test_failed_approval_does_not_stay_running(self):
+        """Test an error after approval started marks the progress failed so it can be retried"""
+        with mock.patch.object(StockMovement.objects, 'bulk_create', side_effect=DatabaseError("boom")):
+            with self.assertRaises(DatabaseError):
+                StockAdjustmentApprovalService(self.adjustment.pk).approve()
+
+        progress = StockAdjustmentApprovalService.get_progress(self.adjustment.pk)
+        self.assertEqual(progress['status'], 'failed')
+        self.assertIn('error', progress)
+
+
+@pytest.mark.unit
+class StockValuationServiceTest(TestCase):
+    def setUp(self):
+        self.warehouse = Warehouse.objects.create(name="انبار مرکزی", code="WH1", address="تهران")
+        self.product = Product.objects.create(product_code="P-1", name="محصول")
+
+    def move(self, day, movement_type, quantity, unit_cost="0"):
+        StockMovement.objects.create(
+            movement_type=movement_type, product=self.product, warehouse=self.warehouse,
+            quantity=Decimal(quantity), unit_cost=Decimal(unit_cost),
+            movement_date=timezone.make_aware(datetime(2025, 3, day, 12)),
+        )
+
+    def setup_history(self):
+        self.move(1, 'in', "10", "100")
+        self.move(2, 'in', "10", "200")
+        self.move(3, 'out', "15")
+        self.move(5, 'in', "5", "300")
+
+    def test_point_in_time_valuation_methods(self):
+        """Test weighted average and FIFO values at a past date"""
+        self.setup_history()
+
+        average = StockValuationService.valuation(date(2025, 3, 3))
+        fifo = StockValuationService.valuation(date(2025, 3, 3), method='fifo')
+
+        self.assertEqual(average['lines'][0]['quantity'], Decimal("5"))
+        self.assertEqual(average['total_value'], Decimal("750.00"))
+        self.assertEqual(fifo['total_value'], Decimal("1000.00"))
+
+    def test_snapshot_plus_delta_matches_full_replay(self):
+        """Test valuation from a snapshot equals replaying every movement"""
+        self.setup_history()
+        expected = StockValuationService.valuation(date(2025, 3, 5), method='fifo')
+
+        StockValuationService.take_snapshot(date(2025, 3, 2))
+        self.assertEqual(StockSnapshot.objects.count(), 1)
+
+        self.assertEqual(StockValuationService.valuation(date(2025, 3, 5), method='fifo'), expected)
+        self.assertEqual(
+            StockValuationService.valuation(date(2025, 3, 2))['total_value'], Decimal("3000.00")
+        )
+
+
+@pytest.mark.unit
+class LotAllocationServiceTest(TestCase):
+    def setUp(self):
+        self.warehouse = Warehouse.objects.create(name="انبار مرکزی", code="WH1", address="تهران")
+        self.product = Product.objects.create(product_code="P-1", name="دارو")
+        InventoryItem.objects.create(product=self.product, warehouse=self.warehouse, quantity=Decimal("30"))
+        today = timezone.localdate()
+        self.lots = {
+            name: LotNumber.objects.create(
+                lot_number=name, product=self.product, warehouse=self.warehouse, quantity=Decimal("10"),
+                production_date=today - timedelta(days=100),
+                expiry_date=today + timedelta(days=days) if days is not None else None,
+            )
+            for name, days in [("L-LATE", 60), ("L-NONE", None), ("L-SOON", 5), ("L-OLD", -1)]
+        }
+
+    def test_allocates_first_expiring_lots(self):
+        """Test quantities are split across lots in expiry order, skipping expired lots"""
+        allocations = LotAllocationService().allocate(self.product.pk, self.warehouse.pk, "15")
+
+        self.assertEqual([(a['lot_number'], a['quantity']) for a in allocations], [("L-SOON", 10), ("L-LATE", 5)])
+        self.assertEqual(LotNumber.objects.get(lot_number="L-LATE").quantity, Decimal("5"))
+        self.assertEqual(StockMovement.objects.filter(movement_type='out', lot_number__isnull=False).count(), 2)
+        self.assertEqual(InventoryItem.objects.get().quantity, Decimal("15"))
+
+    def test_insufficient_lots_rolls_back(self):
+        """Test allocation fails as a whole when valid lots do not cover the quantity"""
+        with self.assertRaises(InventoryError):
+            LotAllocationService().allocate(self.product.pk, self.warehouse.pk, "31")
+
+        self.assertEqual(LotNumber.objects.get(lot_number="L-SOON").quantity, Decimal("10"))
+        self.assertFalse(StockMovement.objects.exists())
+
+    def test_invalid_ids_are_rejected(self):
+        """Test a non-numeric product id is an InventoryError (400), not a server error"""
+        with self.assertRaises(InventoryError):
+            LotAllocationService().allocate("abc", self.warehouse.pk, "1")
+
+    def test_expiry_summary_buckets(self):
+        """Test the expiry buckets are refreshed after lot changes commit"""
+        with self.captureOnCommitCallbacks(execute=True):
+            self.lots["L-SOON"].quantity = Decimal("4")
+            self.lots["L-SOON"].save()
+
+        summary = LotExpirySummary.objects.get(warehouse=self.warehouse)
+        self.assertEqual(summary.total_lots, 4)
+        self.assertEqual(summary.expired_lots, 1)
+        self.assertEqual(summary.expiring_7_quantity, Decimal("4"))
+        self.assertEqual(summary.expiring_30_lots, 0)
+        self.assertEqual(summary.expiring_90_lots, 1)
+        self.assertEqual(len(LotExpiryService.summaries()), 1)
+
+    def test_total_lots_counts_only_lots_in_stock(self):
+        """Test empty lots are left out of the total just like the buckets"""
+        LotNumber.objects.filter(lot_number="L-OLD").update(quantity=0)
+        LotExpiryService.refresh()
+
+        summary = LotExpirySummary.objects.get(warehouse=self.warehouse)
+        self.assertEqual(summary.total_lots, 3)
+        self.assertEqual(summary.expired_lots, 0)
+
+    def test_stats_rejects_invalid_warehouse_id(self):
+        """Test a non-numeric warehouse_id is a 400 and a valid one filters the summaries"""
+        LotExpiryService.refresh()
+        client = APIClient()
+        client.force_authenticate(get_user_model().objects.create_user(username="storekeeper", password="pass"))
+
+        response = client.get('/api/v1/inventory/lot-numbers/stats/', {'warehouse_id': 'abc'})
+        self.assertEqual(response.status_code, 400)
+
+        response = client.get('/api/v1/inventory/lot-numbers/stats/', {'warehouse_id': self.warehouse.pk})
+        self.assertEqual(response.status_code, 200)
@@ -0,0 +1,197 @@
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+from django.db import transaction
+from django.db.models import Max, Q
+from django.utils import timezone
+from .models import StockMovement, StockSnapshot
+import logging
+
+logger = logging.getLogger(__name__)
+
+ZERO = Decimal('0')
+COST_PLACES = Decimal('0.0001')
+VALUE_PLACES = Decimal('0.01')
+
+VALUATION_METHODS = ('weighted_average', 'fifo')
+
+
+class StockPosition:
+    """Running quantity and cost of one product in one warehouse"""
+
+    def __init__(self, quantity=ZERO, average_cost=ZERO, fifo_layers=None):
+        self.quantity = Decimal(quantity)
+        self.average_cost = Decimal(average_cost)
+        self.fifo_layers = [[Decimal(qty), Decimal(cost)] for qty, cost in (fifo_layers or [])]
+
+    @classmethod
+    def from_snapshot(cls, snapshot):
+        return cls(snapshot.quantity, snapshot.average_cost, snapshot.fifo_layers)
+
+    def receive(self, quantity, unit_cost):
+        total = self.quantity + quantity
+        if total > 0 and self.quantity > 0:
+            self.average_cost = (self.quantity * self.average_cost + quantity * unit_cost) / total
+        else:
+            self.average_cost = unit_cost
+        self.quantity = total
+        self.fifo_layers.append([quantity, unit_cost])
+
+    def issue(self, quantity):
+        self.quantity -= quantity
+        remaining = quantity
+        while remaining > 0 and self.fifo_layers:
+            layer = self.fifo_layers[0]
+            if layer[0] <= remaining:
+                remaining -= layer[0]
+                self.fifo_layers.pop(0)
+            else:
+                layer[0] -= remaining
+                remaining = ZERO
+
+    def apply(self, quantity, unit_cost):
+        """Apply a signed quantity change: positive receives at unit_cost, negative issues"""
+        if quantity > 0:
+            self.receive(quantity, unit_cost)
+        elif quantity < 0:
+            self.issue(-quantity)
+
+    def value(self, method='weighted_average'):
+        if method == 'fifo':
+            return sum((qty * cost for qty, cost in self.fifo_layers), ZERO).quantize(VALUE_PLACES)
+        return (self.quantity * self.average_cost).quantize(VALUE_PLACES)
+
+    def unit_cost(self, method='weighted_average'):
+        if method == 'fifo':
+            return (self.value('fifo') / self.quantity).quantize(COST_PLACES) if self.quantity > 0 else ZERO
+        return self.average_cost.quantize(COST_PLACES)
+
+    @property
+    def is_empty(self):
+        return self.quantity == 0 and not self.fifo_layers
+
+    def serialized_layers(self):
+        return [[str(qty), str(cost)] for qty, cost in self.fifo_layers]
+
+
+class StockValuationService:
+    """
+    Point-in-time stock quantity and value.
+
+    Every snapshot date holds the complete stock state (items with no stock
+    are omitted), so the position at any date is the latest snapshot on or
+    before it plus a replay of the movements recorded after that snapshot.
+    """
+
+    @staticmethod
+    def day_end(day):
+        """Start of the following day in the current time zone, i.e. the exclusive end of `day`"""
+        return timezone.make_aware(datetime.combine(day + timedelta(days=1), time.min))
+
+    @staticmethod
+    def movement_effects(movement):
+        """(warehouse_id, signed quantity) pairs a movement applies to"""
+        quantity = movement['quantity']
+        movement_type = movement['movement_type']
+        if movement_type == 'in':
+            return [(movement['warehouse_id'], quantity)]
+        if movement_type == 'out':
+            return [(movement['warehouse_id'], -quantity)]
+        if movement_type == 'adjustment':
+            return [(movement['warehouse_id'], quantity)]
+        if movement_type == 'transfer':
+            return [(movement['warehouse_id'], -quantity), (movement['destination_warehouse_id'], quantity)]
+        return []  # reserve / unreserve do not change on-hand stock
+
+    @classmethod
+    def positions_at(cls, as_of, warehouse_id=None, product_ids=None):
+        """
+        Stock positions at the end of `as_of` (a date) as a dict keyed by
+        (product_id, warehouse_id). Costs three queries: the nearest snapshot
+        date, its rows and the movements recorded after it.
+        """
+        snapshot_date = StockSnapshot.objects.filter(snapshot_date__lte=as_of).aggregate(
+            latest=Max('snapshot_date')
+        )['latest']
+
+        positions = {}
+        if snapshot_date:
+            snapshots = StockSnapshot.objects.filter(snapshot_date=snapshot_date)
+            if warehouse_id:
+                snapshots = snapshots.filter(warehouse_id=warehouse_id)
+            if product_ids is not None:
+                snapshots = snapshots.filter(product_id__in=product_ids)
+            for snapshot in snapshots:
+                positions[(snapshot.product_id, snapshot.warehouse_id)] = StockPosition.from_snapshot(snapshot)
+
+        movements = StockMovement.objects.filter(movement_date__lt=cls.day_end(as_of)).exclude(
+            movement_type__in=['reserve', 'unreserve']
+        )
+        if snapshot_date:
+            movements = movements.filter(movement_date__gte=cls.day_end(snapshot_date))
+        if warehouse_id:
+            movements = movements.filter(Q(warehouse_id=warehouse_id) | Q(destination_warehouse_id=warehouse_id))
+        if product_ids is not None:
+            movements = movements.filter(product_id__in=product_ids)
+
+        for movement in movements.order_by('movement_date', 'pk').values(
+            'product_id', 'warehouse_id', 'destination_warehouse_id', 'movement_type', 'quantity', 'unit_cost'
+        ).iterator(chunk_size=5000):
+            for target_warehouse_id, quantity in cls.movement_effects(movement):
+                if warehouse_id and target_warehouse_id != warehouse_id:
+                    continue
+                key = (movement['product_id'], target_warehouse_id)
+                position = positions.get(key)
+                if position is None:
+                    position = positions[key] = StockPosition()
+                position.apply(quantity, movement['unit_cost'])
+
+        return positions
+
+    @classmethod
+    def valuation(cls, as_of, method='weighted_average', warehouse_id=None, product_ids=None):
+        """Quantity and value per product/warehouse at the end of `as_of`, plus the total value"""
+        if method not in VALUATION_METHODS:
+            raise ValueError(f'Unknown valuation method: {method}')
+
+        positions = cls.positions_at(as_of, warehouse_id=warehouse_id, product_ids=product_ids)
+        lines = []
+        total_value = ZERO
+        for (product_id, line_warehouse_id), position in sorted(positions.items()):
+            if position.is_empty:
+                continue
+            value = position.value(method)
+            total_value += value
+            lines.append({
+                'product_id': product_id,
+                'warehouse_id': line_warehouse_id,
+                'quantity': position.quantity,
+                'unit_cost': position.unit_cost(method),
+                'value': value,
+            })
+
+        return {'as_of': as_of, 'method': method, 'total_value': total_value, 'lines': lines}
+
+    @classmethod
+    def take_snapshot(cls, snapshot_date, period='daily'):
+        """Store the complete stock state at the end of `snapshot_date`; returns the number of rows"""
+        with transaction.atomic():
+            # Recompute from the previous snapshot when the date is taken again
+            StockSnapshot.objects.filter(snapshot_date=snapshot_date).delete()
+            positions = cls.positions_at(snapshot_date)
+            rows = [
+                StockSnapshot(
+                    product_id=product_id,
+                    warehouse_id=warehouse_id,
+                    snapshot_date=snapshot_date,
+                    period=period,
+                    quantity=position.quantity,
+                    average_cost=position.average_cost.quantize(COST_PLACES),
+                    fifo_layers=position.serialized_layers(),
+                )
+                for (product_id, warehouse_id), position in positions.items()
+                if not position.is_empty
+            ]
+            StockSnapshot.objects.bulk_create(rows, batch_size=1000)
+
+        logger.info(f"Stored {len(rows)} stock snapshot rows for {snapshot_date}")
+        return len(rows)
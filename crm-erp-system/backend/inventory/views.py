@@ -2,8 +2,10 @@ from rest_framework import viewsets, filters, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from django_filters.rest_framework import DjangoFilterBackend
-from django.db.models import Q, F, Sum
+from django.db.models import Q, F
 from django.utils import timezone
+from datetime import date
+from common.stats import STATS_CACHE_TIMEOUT, StatsBuilder
 from .models import (
     Warehouse, InventoryItem, LotNumber, StockMovement, 
     StockAdjustment, StockAdjustmentItem
@@ -12,6 +14,11 @@ from .serializers import (
     WarehouseSerializer, InventoryItemSerializer, LotNumberSerializer,
     StockMovementSerializer, StockAdjustmentSerializer, StockAdjustmentItemSerializer
 )
+from .services import (
+    InventoryError, InventoryMovementService, LotAllocationService, LotExpiryService, MovementLine,
+    StockAdjustmentApprovalService
+)
+from .valuation import VALUATION_METHODS, StockValuationService
 
 
 class WarehouseViewSet(viewsets.ModelViewSet):
@@ -56,71 +63,73 @@ class InventoryItemViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['get'])
     def stats(self, request):
         """آمار کلی موجودی"""
-        total_items = self.get_queryset().count()
-        low_stock_items = self.get_queryset().filter(quantity__lte=F('min_quantity')).count()
-        out_of_stock_items = self.get_queryset().filter(quantity__lte=0).count()
-        total_value = self.get_queryset().aggregate(
-            total=Sum(F('quantity') * F('product__cost_price'))
-        )['total'] or 0
+        stats = StatsBuilder(self.get_queryset(), cache_timeout=STATS_CACHE_TIMEOUT, models=(InventoryItem,))
+        stats.count('total_items')
+        stats.count('low_stock_items', Q(quantity__lte=F('min_quantity')))
+        stats.count('out_of_stock_items', Q(quantity__lte=0))
+        stats.sum('total_value', F('quantity') * F('product__cost_price'))
         
-        return Response({
-            'total_items': total_items,
-            'low_stock_items': low_stock_items,
-            'out_of_stock_items': out_of_stock_items,
-            'total_value': total_value,
-        })
+        return Response(stats.build())
+    
+    @action(detail=False, methods=['get'])
+    def valuation(self, request):
+        """موجودی و ارزش کالا در پایان یک تاریخ (از نزدیک‌ترین عکس موجودی و حرکت‌های بعد از آن)"""
+        as_of = request.query_params.get('as_of')
+        method = request.query_params.get('method', 'weighted_average')
+        
+        try:
+            as_of = date.fromisoformat(as_of) if as_of else timezone.localdate()
+        except ValueError:
+            return Response({'error': 'تاریخ نامعتبر است (YYYY-MM-DD)'}, status=status.HTTP_400_BAD_REQUEST)
+        if method not in VALUATION_METHODS:
+            return Response({'error': 'روش ارزش‌گذاری نامعتبر است'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        try:
+            warehouse_id = request.query_params.get('warehouse_id')
+            warehouse_id = int(warehouse_id) if warehouse_id else None
+            product_id = request.query_params.get('product_id')
+            product_ids = [int(product_id)] if product_id else None
+        except ValueError:
+            return Response({'error': 'شناسه انبار یا محصول نامعتبر است'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        result = StockValuationService.valuation(
+            as_of, method=method, warehouse_id=warehouse_id, product_ids=product_ids
+        )
+        return Response(result)
     
     @action(detail=True, methods=['post'])
     def adjust_stock(self, request, pk=None):
-        """تعدیل موجودی"""
+        """تعدیل موجودی - ورود، خروج، انتقال، رزرو، لغو رزرو یا تعدیل به مقدار شمارش‌شده"""
         item = self.get_object()
         quantity = request.data.get('quantity')
         movement_type = request.data.get('movement_type', 'adjustment')
-        notes = request.data.get('notes', '')
         
         if quantity is None:
             return Response({'error': 'مقدار موجودی الزامی است'}, 
                           status=status.HTTP_400_BAD_REQUEST)
         
+        old_quantity = item.quantity
         try:
-            quantity = float(quantity)
-            old_quantity = item.quantity
-            
-            if movement_type == 'in':
-                item.quantity += quantity
-            elif movement_type == 'out':
-                item.quantity -= quantity
-            else:  # adjustment
-                item.quantity = quantity
-            
-            if item.quantity < 0:
-                return Response({'error': 'موجودی نمی‌تواند منفی باشد'}, 
-                              status=status.HTTP_400_BAD_REQUEST)
-            
-            item.save()
-            
-            # ثبت حرکت موجودی
-            StockMovement.objects.create(
-                movement_type=movement_type,
-                product=item.product,
-                warehouse=item.warehouse,
-                quantity=abs(quantity),
-                unit_cost=item.product.cost_price,
-                total_cost=abs(quantity) * item.product.cost_price,
-                notes=notes,
-                created_by=request.user
+            InventoryMovementService(user=request.user).move(
+                movement_type,
+                item.product_id,
+                item.warehouse_id,
+                quantity,
+                destination_warehouse_id=request.data.get('destination_warehouse_id'),
+                lot_number_id=request.data.get('lot_number_id'),
+                notes=request.data.get('notes', ''),
             )
-            
-            return Response({
-                'message': 'موجودی با موفقیت بروزرسانی شد',
-                'old_quantity': old_quantity,
-                'new_quantity': item.quantity,
-                'difference': item.quantity - old_quantity
-            })
+        except InventoryError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
         
-        except ValueError:
-            return Response({'error': 'مقدار موجودی باید عدد باشد'}, 
-                          status=status.HTTP_400_BAD_REQUEST)
+        item.refresh_from_db(fields=['quantity', 'reserved_quantity', 'last_updated'])
+        return Response({
+            'message': 'موجودی با موفقیت بروزرسانی شد',
+            'old_quantity': old_quantity,
+            'new_quantity': item.quantity,
+            'reserved_quantity': item.reserved_quantity,
+            'difference': item.quantity - old_quantity
+        })
 
 
 class LotNumberViewSet(viewsets.ModelViewSet):
@@ -156,18 +165,74 @@ class LotNumberViewSet(viewsets.ModelViewSet):
     
     @action(detail=False, methods=['get'])
     def stats(self, request):
-        """آمار شماره لات‌ها"""
-        total_lots = self.get_queryset().count()
-        expired_lots = self.get_queryset().filter(expiry_date__lt=timezone.now().date()).count()
-        expiring_soon = self.get_queryset().filter(
-            expiry_date__lte=timezone.now().date() + timezone.timedelta(days=30)
-        ).count()
+        """
+        آمار شماره لات‌ها - از جدول خلاصه انقضای هر انبار
+        
+        خلاصه‌ها برای هر انبار از پیش محاسبه شده‌اند، پس فیلترهای لیست لات‌ها اینجا
+        اعمال نمی‌شوند و تنها فیلتر پذیرفته شده warehouse_id است.
+        """
+        warehouse_id = request.query_params.get('warehouse_id')
+        if warehouse_id and not warehouse_id.isdigit():
+            return Response({'error': 'شناسه انبار باید عدد صحیح باشد'}, 
+                          status=status.HTTP_400_BAD_REQUEST)
+        summaries = LotExpiryService.summaries(warehouse_id)
+        
+        by_warehouse = [
+            {
+                'warehouse_id': summary.warehouse_id,
+                'warehouse_name': summary.warehouse.name,
+                'total_lots': summary.total_lots,
+                'expired': {'lots': summary.expired_lots, 'quantity': summary.expired_quantity},
+                'expiring_7_days': {'lots': summary.expiring_7_lots, 'quantity': summary.expiring_7_quantity},
+                'expiring_30_days': {'lots': summary.expiring_30_lots, 'quantity': summary.expiring_30_quantity},
+                'expiring_90_days': {'lots': summary.expiring_90_lots, 'quantity': summary.expiring_90_quantity},
+                'refreshed_at': summary.refreshed_at,
+            }
+            for summary in summaries
+        ]
         
         return Response({
-            'total_lots': total_lots,
-            'expired_lots': expired_lots,
-            'expiring_soon': expiring_soon,
+            'total_lots': sum(summary.total_lots for summary in summaries),
+            'expired_lots': sum(summary.expired_lots for summary in summaries),
+            'expiring_soon': sum(
+                summary.expired_lots + summary.expiring_7_lots + summary.expiring_30_lots for summary in summaries
+            ),
+            'by_warehouse': by_warehouse,
         })
+    
+    @action(detail=False, methods=['post'])
+    def allocate(self, request):
+        """برداشت از لات‌ها به ترتیب نزدیک‌ترین تاریخ انقضا (FEFO)"""
+        product_id = request.data.get('product_id')
+        warehouse_id = request.data.get('warehouse_id')
+        quantity = request.data.get('quantity')
+        
+        if not product_id or not warehouse_id or quantity is None:
+            return Response({'error': 'محصول، انبار و مقدار الزامی هستند'}, 
+                          status=status.HTTP_400_BAD_REQUEST)
+        
+        reference_id = request.data.get('reference_id')
+        if reference_id is not None and not str(reference_id).isdigit():
+            return Response({'error': 'شناسه مرجع باید عدد صحیح باشد'}, 
+                          status=status.HTTP_400_BAD_REQUEST)
+        
+        service = LotAllocationService(
+            user=request.user,
+            reference_type=request.data.get('reference_type'),
+            reference_id=reference_id,
+        )
+        try:
+            allocations = service.allocate(
+                product_id,
+                warehouse_id,
+                quantity,
+                allow_expired=request.data.get('allow_expired') in (True, 'true'),
+                notes=request.data.get('notes', ''),
+            )
+        except InventoryError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        return Response({'message': 'برداشت از لات‌ها با موفقیت ثبت شد', 'allocations': allocations})
 
 
 class StockMovementViewSet(viewsets.ModelViewSet):
@@ -192,6 +257,33 @@ class StockMovementViewSet(viewsets.ModelViewSet):
             queryset = queryset.filter(movement_date__lte=date_to)
         
         return queryset
+    
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        """ثبت گروهی حرکت‌ها (مثلاً همه اقلام یک فاکتور) در یک تراکنش"""
+        lines = request.data.get('lines', [])
+        if not isinstance(lines, list) or not lines:
+            return Response({'error': 'لیست اقلام الزامی است'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        reference_id = request.data.get('reference_id')
+        if reference_id is not None and not str(reference_id).isdigit():
+            return Response({'error': 'شناسه مرجع باید عدد صحیح باشد'}, 
+                          status=status.HTTP_400_BAD_REQUEST)
+        
+        service = InventoryMovementService(
+            user=request.user,
+            reference_type=request.data.get('reference_type'),
+            reference_id=reference_id,
+        )
+        try:
+            movements = service.apply([MovementLine.from_dict(line) for line in lines])
+        except InventoryError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        return Response({
+            'message': 'حرکت‌های موجودی با موفقیت ثبت شدند',
+            'movements_count': len(movements),
+        }, status=status.HTTP_201_CREATED)
 
 
 class StockAdjustmentViewSet(viewsets.ModelViewSet):
@@ -205,43 +297,45 @@ class StockAdjustmentViewSet(viewsets.ModelViewSet):
     
     @action(detail=True, methods=['post'])
     def approve(self, request, pk=None):
-        """تأیید تعدیل موجودی"""
+        """تأیید تعدیل موجودی - برای شمارش‌های بزرگ در پس‌زمینه"""
         adjustment = self.get_object()
         
         if adjustment.status != 'pending':
             return Response({'error': 'فقط تعدیل‌های در انتظار تأیید قابل تأیید هستند'}, 
                           status=status.HTTP_400_BAD_REQUEST)
         
-        adjustment.status = 'approved'
-        adjustment.approved_by = request.user
-        adjustment.approved_at = timezone.now()
-        adjustment.save()
+        progress = StockAdjustmentApprovalService.get_progress(adjustment.id)
+        if progress and progress['status'] in ('queued', 'running'):
+            return Response({'error': 'تأیید این تعدیل در حال انجام است', 'progress': progress},
+                          status=status.HTTP_409_CONFLICT)
         
-        # اعمال تعدیل‌ها
-        for item in adjustment.items.all():
-            inventory_item = InventoryItem.objects.get(
-                product=item.product,
-                warehouse=adjustment.warehouse
-            )
-            inventory_item.quantity = item.actual_quantity
-            inventory_item.save()
-            
-            # ثبت حرکت موجودی
-            StockMovement.objects.create(
-                movement_type='adjustment',
-                product=item.product,
-                warehouse=adjustment.warehouse,
-                lot_number=item.lot_number,
-                quantity=item.difference,
-                unit_cost=item.unit_cost,
-                total_cost=abs(item.difference) * item.unit_cost,
-                reference_type='StockAdjustment',
-                reference_id=adjustment.id,
-                notes=f'تعدیل موجودی - {adjustment.reference_number}',
-                created_by=request.user
-            )
+        service = StockAdjustmentApprovalService(adjustment.id, user=request.user)
         
-        return Response({'message': 'تعدیل موجودی با موفقیت تأیید شد'})
+        background = request.data.get('background')
+        if background is None:
+            background = adjustment.items.count() >= service.BACKGROUND_THRESHOLD
+        if background in (True, 'true'):
+            service.approve_in_background()
+            return Response({
+                'message': 'تأیید تعدیل در پس‌زمینه آغاز شد',
+                'progress': service.get_progress(adjustment.id),
+            }, status=status.HTTP_202_ACCEPTED)
+        
+        try:
+            result = service.approve()
+        except InventoryError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        return Response({'message': 'تعدیل موجودی با موفقیت تأیید شد', **result})
+    
+    @action(detail=True, methods=['get'])
+    def approval_progress(self, request, pk=None):
+        """پیشرفت تأیید تعدیل در پس‌زمینه"""
+        adjustment = self.get_object()
+        progress = StockAdjustmentApprovalService.get_progress(adjustment.id)
+        if progress is None:
+            return Response({'status': adjustment.status})
+        return Response(progress)
     
     @action(detail=True, methods=['post'])
     def reject(self, request, pk=None):
@@ -0,0 +1,9 @@
+from common.decorators import invalidate_on_change
+from .models import Invoice, InvoiceItem, Quotation, QuotationItem, Payment
+
+invalidate_on_change(Invoice)
+# Item and payment changes alter the parent's totals and status
+invalidate_on_change(InvoiceItem, Invoice)
+invalidate_on_change(Payment, Invoice)
+invalidate_on_change(Quotation)
+invalidate_on_change(QuotationItem, Quotation)
@@ -2,8 +2,9 @@ from rest_framework import viewsets, filters, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from django_filters.rest_framework import DjangoFilterBackend
-from django.db.models import Q, F, Sum
+from django.db.models import Q, F
 from django.utils import timezone
+from common.stats import STATS_CACHE_TIMEOUT, StatsBuilder
 from .models import Invoice, InvoiceItem, Quotation, QuotationItem, Payment
 from .serializers import (
     InvoiceSerializer, InvoiceListSerializer, InvoiceItemSerializer,
@@ -51,22 +52,15 @@ class InvoiceViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['get'])
     def stats(self, request):
         """آمار کلی فاکتورها"""
-        total_invoices = self.get_queryset().count()
-        total_amount = self.get_queryset().aggregate(total=Sum('total_amount'))['total'] or 0
-        paid_amount = self.get_queryset().aggregate(total=Sum('paid_amount'))['total'] or 0
-        pending_amount = total_amount - paid_amount
+        stats = StatsBuilder(self.get_queryset(), cache_timeout=STATS_CACHE_TIMEOUT, models=(Invoice,))
+        stats.count('total_invoices')
+        stats.sum('total_amount', 'total_amount')
+        stats.sum('paid_amount', 'paid_amount')
+        stats.breakdown('status_stats', 'status', Invoice.STATUS_CHOICES)
         
-        status_stats = {}
-        for status, _ in Invoice.STATUS_CHOICES:
-            status_stats[status] = self.get_queryset().filter(status=status).count()
-        
-        return Response({
-            'total_invoices': total_invoices,
-            'total_amount': total_amount,
-            'paid_amount': paid_amount,
-            'pending_amount': pending_amount,
-            'status_stats': status_stats,
-        })
+        data = stats.build()
+        data['pending_amount'] = data['total_amount'] - data['paid_amount']
+        return Response(data)
     
     @action(detail=True, methods=['post'])
     def approve(self, request, pk=None):
@@ -167,20 +161,13 @@ class QuotationViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['get'])
     def stats(self, request):
         """آمار کلی پیش‌فاکتورها"""
-        total_quotations = self.get_queryset().count()
-        total_amount = self.get_quotations().aggregate(total=Sum('total_amount'))['total'] or 0
-        expired_quotations = self.get_queryset().filter(valid_until__lt=timezone.now().date()).count()
-        
-        status_stats = {}
-        for status, _ in Quotation.STATUS_CHOICES:
-            status_stats[status] = self.get_queryset().filter(status=status).count()
+        stats = StatsBuilder(self.get_queryset(), cache_timeout=STATS_CACHE_TIMEOUT, models=(Quotation,))
+        stats.count('total_quotations')
+        stats.sum('total_amount', 'total_amount')
+        stats.count('expired_quotations', Q(valid_until__lt=timezone.now().date()))
+        stats.breakdown('status_stats', 'status', Quotation.STATUS_CHOICES)
         
-        return Response({
-            'total_quotations': total_quotations,
-            'total_amount': total_amount,
-            'expired_quotations': expired_quotations,
-            'status_stats': status_stats,
-        })
+        return Response(stats.build())
     
     @action(detail=True, methods=['post'])
     def convert_to_invoice(self, request, pk=None):
@@ -270,15 +257,9 @@ class PaymentViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['get'])
     def stats(self, request):
         """آمار کلی پرداخت‌ها"""
-        total_payments = self.get_queryset().count()
-        total_amount = self.get_queryset().aggregate(total=Sum('amount'))['total'] or 0
+        stats = StatsBuilder(self.get_queryset(), cache_timeout=STATS_CACHE_TIMEOUT, models=(Payment,))
+        stats.count('total_payments')
+        stats.sum('total_amount', 'amount')
+        stats.breakdown('method_stats', 'payment_method', Payment.PAYMENT_METHODS)
         
-        method_stats = {}
-        for method, _ in Payment.PAYMENT_METHODS:
-            method_stats[method] = self.get_queryset().filter(payment_method=method).count()
-        
-        return Response({
-            'total_payments': total_payments,
-            'total_amount': total_amount,
-            'method_stats': method_stats,
-        })
\ No newline at end of file
+        return Response(stats.build())
@@ -1,9 +1,15 @@
+import asyncio
 import json
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
 from django.contrib.auth.models import User
+from django.utils import timezone
 from .models import Notification
 from .serializers import NotificationSerializer
+from common.metrics import DASHBOARD_UPDATES
+from .services import (
+    STAFF_DASHBOARD_GROUP, STAFF_NOTIFICATION_GROUP, DashboardDelta, NotificationHistory, UnreadCounter
+)
 
 
 class NotificationConsumer(AsyncWebsocketConsumer):
@@ -15,28 +21,30 @@ class NotificationConsumer(AsyncWebsocketConsumer):
         
         self.room_name = f"user_{self.user.id}"
         self.room_group_name = f"notifications_{self.room_name}"
+        self.groups_joined = [self.room_group_name]
+        if self.user.is_staff:
+            # Staff-wide notifications arrive once on the shared group
+            self.groups_joined.append(STAFF_NOTIFICATION_GROUP)
         
         # Join room group
-        await self.channel_layer.group_add(
-            self.room_group_name,
-            self.channel_name
-        )
+        for group_name in self.groups_joined:
+            await self.channel_layer.group_add(
+                group_name,
+                self.channel_name
+            )
         
         await self.accept()
         
         # Send unread notifications count
-        unread_count = await self.get_unread_count()
-        await self.send(text_data=json.dumps({
-            'type': 'unread_count',
-            'count': unread_count
-        }))
+        await self.send_unread_count(await self.get_unread_count())
     
     async def disconnect(self, close_code):
         # Leave room group
-        await self.channel_layer.group_discard(
-            self.room_group_name,
-            self.channel_name
-        )
+        for group_name in getattr(self, 'groups_joined', []):
+            await self.channel_layer.group_discard(
+                group_name,
+                self.channel_name
+            )
     
     # Receive message from WebSocket
     async def receive(self, text_data):
@@ -45,29 +53,55 @@ class NotificationConsumer(AsyncWebsocketConsumer):
         
         if message_type == 'mark_as_read':
             notification_id = text_data_json.get('notification_id')
-            await self.mark_notification_as_read(notification_id)
+            await self.send_unread_count(await self.mark_notification_as_read(notification_id))
         elif message_type == 'mark_all_as_read':
-            await self.mark_all_as_read()
+            await self.send_unread_count(await self.mark_all_as_read())
         elif message_type == 'get_notifications':
-            page = text_data_json.get('page', 1)
-            notifications = await self.get_notifications(page)
+            try:
+                notifications, next_cursor = await self.get_notifications(
+                    text_data_json.get('cursor'),
+                    text_data_json.get('limit'),
+                    bool(text_data_json.get('unread_only')),
+                )
+            except ValueError as e:
+                await self.send(text_data=json.dumps({
+                    'type': 'error',
+                    'message': str(e)
+                }))
+                return
             await self.send(text_data=json.dumps({
                 'type': 'notifications_list',
-                'notifications': notifications
+                'notifications': notifications,
+                'next_cursor': next_cursor
             }))
     
     # Receive message from room group
     async def notification_message(self, event):
         notification = event['notification']
         
+        # Group messages carry the row id of every recipient
+        notification_ids = event.get('notification_ids')
+        if notification_ids:
+            notification_id = notification_ids.get(str(self.user.id))
+            if notification_id is None:
+                return
+            notification = {**notification, 'id': notification_id}
+        
         # Send message to WebSocket
         await self.send(text_data=json.dumps({
             'type': 'new_notification',
             'notification': notification
         }))
         
-        # Update unread count
-        unread_count = await self.get_unread_count()
+        # Update unread count; the sender pushes the recipient's counter with the message
+        unread_count = event.get('unread_count')
+        if 'unread_counts' in event:
+            unread_count = event['unread_counts'].get(str(self.user.id))
+        if unread_count is None:
+            unread_count = await self.get_unread_count()
+        await self.send_unread_count(unread_count)
+    
+    async def send_unread_count(self, unread_count):
         await self.send(text_data=json.dumps({
             'type': 'unread_count',
             'count': unread_count
@@ -75,39 +109,35 @@ class NotificationConsumer(AsyncWebsocketConsumer):
     
     @database_sync_to_async
     def get_unread_count(self):
-        return Notification.objects.filter(
-            user=self.user,
-            is_read=False
-        ).count()
+        return UnreadCounter.get(self.user.id)
     
     @database_sync_to_async
-    def get_notifications(self, page=1):
-        notifications = Notification.objects.filter(
-            user=self.user
-        ).order_by('-created_at')[:20]
+    def get_notifications(self, cursor=None, limit=None, unread_only=False):
+        notifications, next_cursor = NotificationHistory.page(
+            self.user.id, cursor=cursor, limit=limit, unread_only=unread_only
+        )
         
         serializer = NotificationSerializer(notifications, many=True)
-        return serializer.data
+        return serializer.data, next_cursor
     
     @database_sync_to_async
     def mark_notification_as_read(self, notification_id):
-        try:
-            notification = Notification.objects.get(
-                id=notification_id,
-                user=self.user
-            )
-            notification.is_read = True
-            notification.save()
-            return True
-        except Notification.DoesNotExist:
-            return False
+        """Mark one notification as read and return the new unread count"""
+        updated = Notification.objects.filter(
+            id=notification_id,
+            user=self.user,
+            is_read=False
+        ).update(is_read=True, read_at=timezone.now())
+        return UnreadCounter.decrement(self.user.id, updated)
     
     @database_sync_to_async
     def mark_all_as_read(self):
-        Notification.objects.filter(
+        """Mark all notifications as read and return the new unread count"""
+        updated = Notification.objects.filter(
             user=self.user,
             is_read=False
-        ).update(is_read=True)
+        ).update(is_read=True, read_at=timezone.now())
+        return UnreadCounter.decrement(self.user.id, updated)
 
 
 class DashboardConsumer(AsyncWebsocketConsumer):
@@ -119,48 +149,72 @@ class DashboardConsumer(AsyncWebsocketConsumer):
         
         self.room_name = f"dashboard_{self.user.id}"
         self.room_group_name = f"dashboard_{self.room_name}"
+        self.groups_joined = [self.room_group_name]
+        if self.user.is_staff:
+            self.groups_joined.append(STAFF_DASHBOARD_GROUP)
+        
+        # Updates are merged and pushed at most once per interval
+        self.pending_delta = None
+        self.flush_task = None
         
         # Join room group
-        await self.channel_layer.group_add(
-            self.room_group_name,
-            self.channel_name
-        )
+        for group_name in self.groups_joined:
+            await self.channel_layer.group_add(
+                group_name,
+                self.channel_name
+            )
         
         await self.accept()
     
     async def disconnect(self, close_code):
+        flush_task = getattr(self, 'flush_task', None)
+        if flush_task:
+            flush_task.cancel()
+        
         # Leave room group
-        await self.channel_layer.group_discard(
-            self.room_group_name,
-            self.channel_name
-        )
+        for group_name in getattr(self, 'groups_joined', []):
+            await self.channel_layer.group_discard(
+                group_name,
+                self.channel_name
+            )
     
     # Receive message from room group
     async def dashboard_update(self, event):
-        update_type = event['type']
-        data = event['data']
-        
-        # Send update to WebSocket
-        await self.send(text_data=json.dumps({
-            'type': update_type,
-            'data': data
-        }))
+        await self.queue_update(event.get('update_type', event['type']), event['data'])
     
     # Handle different types of dashboard updates
     async def customer_update(self, event):
-        await self.send(text_data=json.dumps({
-            'type': 'customer_update',
-            'data': event['data']
-        }))
+        await self.queue_update('customer_update', event['data'])
     
     async def invoice_update(self, event):
-        await self.send(text_data=json.dumps({
-            'type': 'invoice_update',
-            'data': event['data']
-        }))
+        await self.queue_update('invoice_update', event['data'])
     
     async def product_update(self, event):
-        await self.send(text_data=json.dumps({
-            'type': 'product_update',
-            'data': event['data']
-        }))
\ No newline at end of file
+        await self.queue_update('product_update', event['data'])
+    
+    async def queue_update(self, update_type, data):
+        DASHBOARD_UPDATES.inc(outcome='received')
+        if self.pending_delta is None:
+            self.pending_delta = DashboardDelta()
+        # Only an update that joins an already pending one counts as merged; dropped ones are counted on flush
+        pending = self.pending_delta.events
+        if self.pending_delta.add(update_type, data) and pending:
+            DASHBOARD_UPDATES.inc(outcome='merged')
+        
+        if self.flush_task is None:
+            self.flush_task = asyncio.ensure_future(self.flush_later(DashboardDelta.update_interval()))
+    
+    async def flush_later(self, delay):
+        await asyncio.sleep(delay)
+        await self.flush()
+    
+    async def flush(self):
+        delta, self.pending_delta, self.flush_task = self.pending_delta, None, None
+        if delta is None:
+            return
+        
+        if delta.dropped:
+            DASHBOARD_UPDATES.inc(delta.dropped, outcome='dropped')
+        if delta.events:
+            await self.send(text_data=json.dumps(delta.as_message()))
+            DASHBOARD_UPDATES.inc(outcome='sent')
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand, CommandError
+from notifications.services import NotificationArchiver
+
+
+class Command(BaseCommand):
+    help = 'Move read notifications older than the retention period into the archive table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, help='Retention in days (default: settings.NOTIFICATION_RETENTION_DAYS)')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Notifications moved per transaction')
+
+    def handle(self, *args, **options):
+        if options['days'] is not None and options['days'] < 0:
+            raise CommandError('--days cannot be negative')
+        moved = NotificationArchiver(days=options['days'], batch_size=options['batch_size']).run()
+        self.stdout.write(self.style.SUCCESS(f'Archived {moved} notifications'))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from notifications.services import UnreadCounter
+
+
+class Command(BaseCommand):
+    help = 'Reset the cached unread notification counters from the database (run periodically, e.g. hourly)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, action='append', dest='user_ids', help='Only this user id (repeatable)')
+
+    def handle(self, *args, **options):
+        count = UnreadCounter.reconcile(options['user_ids'])
+        self.stdout.write(self.style.SUCCESS(f'Reconciled unread notification counters of {count} users'))
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.6 on 2026-10-16 23:15
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Notification',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('notification_type', models.CharField(max_length=50, verbose_name='نوع اعلان')),
+                ('title', models.CharField(max_length=200, verbose_name='عنوان')),
+                ('message', models.TextField(verbose_name='پیام')),
+                ('data', models.JSONField(blank=True, default=dict, verbose_name='داده\u200cها')),
+                ('is_read', models.BooleanField(default=False, verbose_name='خوانده شده')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='تاریخ ایجاد')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='notifications', to=settings.AUTH_USER_MODEL, verbose_name='کاربر')),
+            ],
+            options={
+                'verbose_name': 'اعلان',
+                'verbose_name_plural': 'اعلان\u200cها',
+                'ordering': ['-created_at', '-id'],
+            },
+        ),
+    ]
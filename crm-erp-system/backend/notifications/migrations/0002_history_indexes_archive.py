@@ -0,0 +1,49 @@
+# Generated by Django 5.2.6 on 2026-10-16 23:47
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notification',
+            name='read_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='زمان خواندن'),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['user', 'is_read', '-created_at', '-id'], name='notif_user_read_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['user', '-created_at', '-id'], name='notif_user_created_idx'),
+        ),
+        migrations.CreateModel(
+            name='NotificationArchive',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('original_id', models.BigIntegerField(unique=True, verbose_name='شناسه اعلان')),
+                ('notification_type', models.CharField(max_length=50, verbose_name='نوع اعلان')),
+                ('title', models.CharField(max_length=200, verbose_name='عنوان')),
+                ('message', models.TextField(verbose_name='پیام')),
+                ('data', models.JSONField(blank=True, default=dict, verbose_name='داده‌ها')),
+                ('read_at', models.DateTimeField(blank=True, null=True, verbose_name='زمان خواندن')),
+                ('created_at', models.DateTimeField(verbose_name='تاریخ ایجاد')),
+                ('archived_at', models.DateTimeField(auto_now_add=True, verbose_name='تاریخ بایگانی')),
+                ('user', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='کاربر')),
+            ],
+            options={
+                'verbose_name': 'اعلان بایگانی‌شده',
+                'verbose_name_plural': 'اعلان‌های بایگانی‌شده',
+                'indexes': [models.Index(fields=['user', 'created_at'], name='notif_archive_user_idx')],
+            },
+        ),
+    ]
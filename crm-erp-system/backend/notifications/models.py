@@ -0,0 +1,68 @@
+from django.conf import settings
+from django.db import models
+
+
+class Notification(models.Model):
+    """اعلان کاربر"""
+    
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, 
+        on_delete=models.CASCADE, 
+        related_name='notifications',
+        verbose_name='کاربر'
+    )
+    notification_type = models.CharField(max_length=50, verbose_name='نوع اعلان')
+    title = models.CharField(max_length=200, verbose_name='عنوان')
+    message = models.TextField(verbose_name='پیام')
+    data = models.JSONField(default=dict, blank=True, verbose_name='داده‌ها')
+    is_read = models.BooleanField(default=False, verbose_name='خوانده شده')
+    read_at = models.DateTimeField(blank=True, null=True, verbose_name='زمان خواندن')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='تاریخ ایجاد')
+    
+    class Meta:
+        verbose_name = 'اعلان'
+        verbose_name_plural = 'اعلان‌ها'
+        ordering = ['-created_at', '-id']
+        indexes = [
+            # تاریخچه و اعلان‌های خوانده‌نشده با صفحه‌بندی نشانگر روی (created_at, id)
+            models.Index(fields=['user', 'is_read', '-created_at', '-id'], name='notif_user_read_created_idx'),
+            models.Index(fields=['user', '-created_at', '-id'], name='notif_user_created_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.user_id} - {self.title}"
+
+
+class NotificationArchive(models.Model):
+    """
+    بایگانی فشرده اعلان‌های خوانده‌شده قدیمی
+
+    فقط برای نگهداری سوابق است؛ کلید خارجی بدون قید پایگاه داده و تنها با
+    یک ایندکس (کاربر، تاریخ) نگهداری می‌شود تا جدول سبک بماند.
+    """
+    
+    original_id = models.BigIntegerField(unique=True, verbose_name='شناسه اعلان')
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, 
+        on_delete=models.DO_NOTHING, 
+        db_constraint=False,
+        related_name='+',
+        verbose_name='کاربر'
+    )
+    notification_type = models.CharField(max_length=50, verbose_name='نوع اعلان')
+    title = models.CharField(max_length=200, verbose_name='عنوان')
+    message = models.TextField(verbose_name='پیام')
+    data = models.JSONField(default=dict, blank=True, verbose_name='داده‌ها')
+    read_at = models.DateTimeField(blank=True, null=True, verbose_name='زمان خواندن')
+    created_at = models.DateTimeField(verbose_name='تاریخ ایجاد')
+    archived_at = models.DateTimeField(auto_now_add=True, verbose_name='تاریخ بایگانی')
+    
+    class Meta:
+        verbose_name = 'اعلان بایگانی‌شده'
+        verbose_name_plural = 'اعلان‌های بایگانی‌شده'
+        indexes = [
+            models.Index(fields=['user', 'created_at'], name='notif_archive_user_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.user_id} - {self.title}"
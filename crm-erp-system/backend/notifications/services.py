@@ -0,0 +1,493 @@
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import timedelta
+from decimal import Decimal, InvalidOperation
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Count, Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from channels.layers import get_channel_layer
+from asgiref.sync import async_to_sync
+from .models import Notification, NotificationArchive
+import base64
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Channel groups every staff connection joins, so a staff-wide event is one group message
+STAFF_NOTIFICATION_GROUP = 'notifications_staff'
+STAFF_DASHBOARD_GROUP = 'dashboard_staff'
+
+# Seconds to collect events of the same type before delivering them as one notification
+DEFAULT_COALESCE_WINDOW = 2
+
+# Object ids kept in the data of a coalesced notification
+COALESCED_IDS_LIMIT = 50
+
+# Read notifications older than this many days are moved to NotificationArchive
+DEFAULT_RETENTION_DAYS = 90
+
+# Seconds a dashboard connection collects updates before pushing one merged delta
+DEFAULT_DASHBOARD_UPDATE_INTERVAL = 1
+
+
+def user_notification_group(user_id):
+    return f"notifications_user_{user_id}"
+
+
+def user_dashboard_group(user_id):
+    return f"dashboard_dashboard_{user_id}"
+
+
+class UnreadCounter:
+    """
+    Per-user unread notification counts kept in the cache (Redis).
+
+    Counters are adjusted with atomic INCR/DECR as notifications are created
+    and read, so pushing a notification does not need a COUNT(*). A missing
+    counter is filled from the database on first use and reconcile() resets
+    all counters from the database periodically to correct any drift.
+    """
+
+    KEY = 'notifications_unread_{user_id}'
+    TIMEOUT = 60 * 60 * 24
+
+    @classmethod
+    def key(cls, user_id):
+        return cls.KEY.format(user_id=user_id)
+
+    @staticmethod
+    def count_from_db(user_ids):
+        counts = dict(
+            Notification.objects.filter(user_id__in=user_ids, is_read=False)
+            .values('user_id').annotate(unread=Count('id')).values_list('user_id', 'unread')
+        )
+        return {user_id: counts.get(user_id, 0) for user_id in user_ids}
+
+    @classmethod
+    def get(cls, user_id):
+        value = cache.get(cls.key(user_id))
+        if value is None:
+            value = cls.count_from_db([user_id])[user_id]
+            cache.add(cls.key(user_id), value, cls.TIMEOUT)
+        return max(value, 0)
+
+    @classmethod
+    def change(cls, user_ids, delta):
+        """Add delta to the counters of user_ids and return the new counts"""
+        counts = {}
+        missing = []
+        for user_id in user_ids:
+            try:
+                counts[user_id] = max(cache.incr(cls.key(user_id), delta), 0)
+            except ValueError:
+                missing.append(user_id)
+        if missing:
+            # Counted after the change was written, so the delta is already included
+            fresh = cls.count_from_db(missing)
+            cache.set_many({cls.key(user_id): value for user_id, value in fresh.items()}, cls.TIMEOUT)
+            counts.update(fresh)
+        return counts
+
+    @classmethod
+    def increment(cls, user_ids, amount=1):
+        return cls.change(user_ids, amount)
+
+    @classmethod
+    def decrement(cls, user_id, amount=1):
+        if not amount:
+            return cls.get(user_id)
+        return cls.change([user_id], -amount)[user_id]
+
+    @classmethod
+    def reconcile(cls, user_ids=None):
+        """Reset counters from the database; returns the number of counters written"""
+        if user_ids is None:
+            user_ids = list(User.objects.filter(is_active=True).values_list('id', flat=True))
+        written = 0
+        for start in range(0, len(user_ids), 1000):
+            counts = cls.count_from_db(user_ids[start:start + 1000])
+            cache.set_many({cls.key(user_id): value for user_id, value in counts.items()}, cls.TIMEOUT)
+            written += len(counts)
+        return written
+
+
+class NotificationHistory:
+    """
+    Keyset pagination over a user's notifications, newest first.
+
+    Pages are ordered by (created_at, id) and continue from an opaque cursor
+    holding the last row's key, so every page is an index range scan however
+    deep the client pages (no OFFSET).
+    """
+
+    PAGE_SIZE = 20
+    MAX_PAGE_SIZE = 100
+
+    @staticmethod
+    def encode_cursor(notification):
+        key = f"{notification.created_at.isoformat()}|{notification.pk}"
+        return base64.urlsafe_b64encode(key.encode()).decode()
+
+    @staticmethod
+    def decode_cursor(cursor):
+        """(created_at, id) of a cursor; raises ValueError for a malformed one"""
+        try:
+            created_at, pk = base64.urlsafe_b64decode(cursor.encode()).decode().rsplit('|', 1)
+            created_at = parse_datetime(created_at)
+            pk = int(pk)
+        except (TypeError, ValueError, UnicodeDecodeError) as e:
+            raise ValueError(f'Invalid cursor: {cursor}') from e
+        if created_at is None:
+            raise ValueError(f'Invalid cursor: {cursor}')
+        return created_at, pk
+
+    @classmethod
+    def page(cls, user_id, cursor=None, limit=None, unread_only=False):
+        """One page of notifications and the cursor of the next page (None on the last page)"""
+        limit = min(max(int(limit or cls.PAGE_SIZE), 1), cls.MAX_PAGE_SIZE)
+
+        queryset = Notification.objects.filter(user_id=user_id)
+        if unread_only:
+            queryset = queryset.filter(is_read=False)
+        if cursor:
+            created_at, pk = cls.decode_cursor(cursor)
+            queryset = queryset.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk))
+
+        rows = list(queryset.order_by('-created_at', '-id')[:limit + 1])
+        next_cursor = cls.encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+        return rows[:limit], next_cursor
+
+
+class NotificationArchiver:
+    """
+    Moves read notifications past the retention period into NotificationArchive.
+
+    Work is done in id-ordered batches, each copied with one bulk_create and
+    removed with one DELETE in its own transaction, so the live table never
+    holds long locks and an interrupted run simply continues next time.
+    Unread notifications are never archived.
+    """
+
+    ARCHIVE_FIELDS = ('user_id', 'notification_type', 'title', 'message', 'data', 'read_at', 'created_at')
+
+    def __init__(self, days=None, batch_size=5000):
+        if days is None:
+            days = getattr(settings, 'NOTIFICATION_RETENTION_DAYS', DEFAULT_RETENTION_DAYS)
+        self.cutoff = timezone.now() - timedelta(days=days)
+        self.batch_size = batch_size
+
+    def candidates(self):
+        return Notification.objects.filter(is_read=True, created_at__lt=self.cutoff)
+
+    def archive_batch(self):
+        """Archive one batch; returns the number of notifications moved"""
+        with transaction.atomic():
+            rows = list(
+                self.candidates().order_by('id').select_for_update(skip_locked=True)
+                .values('id', *self.ARCHIVE_FIELDS)[:self.batch_size]
+            )
+            if not rows:
+                return 0
+            NotificationArchive.objects.bulk_create(
+                [
+                    NotificationArchive(original_id=row['id'], **{name: row[name] for name in self.ARCHIVE_FIELDS})
+                    for row in rows
+                ],
+                ignore_conflicts=True,
+            )
+            Notification.objects.filter(id__in=[row['id'] for row in rows]).delete()
+        return len(rows)
+
+    def run(self):
+        """Archive until nothing is left; returns the total moved"""
+        total = 0
+        while True:
+            moved = self.archive_batch()
+            total += moved
+            if moved < self.batch_size:
+                break
+        logger.info(f"Archived {total} notifications read before {self.cutoff:%Y-%m-%d}")
+        return total
+
+
+@dataclass
+class StaffEvent:
+    """
+    One model event to announce to all staff users (plus any extra users).
+
+    Events sharing a notification_type within the coalescing window are
+    delivered to staff together; summary_message is then formatted with
+    {count}. user_ids always receive this event on its own.
+    """
+    notification_type: str
+    title: str
+    message: str
+    summary_title: str
+    summary_message: str
+    object_id: int = None
+    data: dict = field(default_factory=dict)
+    dashboard_type: str = None
+    dashboard_data: dict = None
+    user_ids: tuple = ()
+
+
+class NotificationFanout:
+    """
+    Deferred, batched delivery of staff notifications.
+
+    publish() only queues the event once the surrounding transaction commits.
+    Queued events are grouped by notification type for the coalescing window
+    and then delivered with one staff query, one bulk_create and one group
+    message per channel group, instead of a row and a send per staff user.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.timers = {}
+
+    @property
+    def window(self):
+        return getattr(settings, 'NOTIFICATION_COALESCE_WINDOW', DEFAULT_COALESCE_WINDOW)
+
+    def publish(self, event):
+        transaction.on_commit(lambda: self.enqueue(event))
+
+    def enqueue(self, event):
+        window = self.window
+        if not window:
+            self.deliver([event])
+            return
+
+        key = event.notification_type
+        with self.lock:
+            self.pending.setdefault(key, []).append(event)
+            if key in self.timers:
+                return
+            timer = threading.Timer(window, self._flush_in_background, args=(key,))
+            timer.daemon = True
+            self.timers[key] = timer
+        timer.start()
+
+    def take(self, key):
+        with self.lock:
+            timer = self.timers.pop(key, None)
+            if timer:
+                timer.cancel()
+            return self.pending.pop(key, [])
+
+    def flush(self, key=None):
+        """Deliver queued events now (all types when key is None)"""
+        with self.lock:
+            keys = [key] if key is not None else list(self.pending)
+        for pending_key in keys:
+            events = self.take(pending_key)
+            if events:
+                self.deliver(events)
+
+    def _flush_in_background(self, key):
+        try:
+            events = self.take(key)
+            if events:
+                self.deliver(events)
+        except Exception:
+            logger.exception(f"Delivering '{key}' notifications failed")
+        finally:
+            connection.close()
+
+    @staticmethod
+    def merge(events):
+        """Title, message, data and dashboard payload of the notification covering all events"""
+        first = events[0]
+        if len(events) == 1:
+            return first.title, first.message, first.data, first.dashboard_data
+
+        object_ids = [event.object_id for event in events if event.object_id is not None]
+        data = {
+            'coalesced': True,
+            'count': len(events),
+            'object_ids': object_ids[:COALESCED_IDS_LIMIT],
+        }
+        dashboard_data = None
+        if first.dashboard_data is not None:
+            dashboard_data = {
+                'action': first.dashboard_data.get('action'),
+                'count': len(events),
+                'ids': object_ids[:COALESCED_IDS_LIMIT],
+            }
+            # The merged update carries the total, so KPI sums are not reduced to one event
+            entity = DashboardDelta.ENTITIES.get(first.dashboard_type)
+            amounts = [
+                DashboardDelta.amount(event.dashboard_data.get(entity))
+                for event in events
+                if event.dashboard_data is not None
+            ]
+            if any(amount is not None for amount in amounts):
+                dashboard_data['amount'] = str(sum(amount for amount in amounts if amount is not None))
+        message = first.summary_message.format(count=len(events))
+        return first.summary_title, message, data, dashboard_data
+
+    def deliver(self, events):
+        """
+        Staff get one coalesced notification for all events. The extra
+        recipients of an event (e.g. the customer's owner) only get that
+        event, unmerged: a coalesced batch mixes other users' records and
+        must not reach non-staff users.
+        """
+        from .serializers import NotificationSerializer
+
+        first = events[0]
+        title, message, data, dashboard_data = self.merge(events)
+
+        staff_ids = list(User.objects.filter(is_staff=True).values_list('id', flat=True))
+        staff = set(staff_ids)
+        personal = [
+            (event, user_id)
+            for event in events
+            for user_id in dict.fromkeys(event.user_ids)
+            if user_id is not None and user_id not in staff
+        ]
+
+        notifications = Notification.objects.bulk_create([
+            Notification(
+                user_id=user_id,
+                title=title,
+                message=message,
+                notification_type=first.notification_type,
+                data=data,
+            )
+            for user_id in staff_ids
+        ] + [
+            Notification(
+                user_id=user_id,
+                title=event.title,
+                message=event.message,
+                notification_type=event.notification_type,
+                data=event.data,
+            )
+            for event, user_id in personal
+        ])
+        if not notifications:
+            return
+        staff_notifications = notifications[:len(staff_ids)]
+        personal_notifications = notifications[len(staff_ids):]
+
+        unread_counts = UnreadCounter.increment(staff_ids) if staff_ids else {}
+        per_user = Counter(user_id for _, user_id in personal)
+        for amount in set(per_user.values()):
+            unread_counts.update(
+                UnreadCounter.increment([user_id for user_id, count in per_user.items() if count == amount], amount)
+            )
+
+        channel_layer = get_channel_layer()
+        if not channel_layer:
+            return
+        group_send = async_to_sync(channel_layer.group_send)
+
+        if staff_notifications:
+            # Identical content for every staff member; each connection picks its own row id and count
+            group_send(STAFF_NOTIFICATION_GROUP, {
+                'type': 'notification_message',
+                'notification': NotificationSerializer(staff_notifications[0]).data,
+                'notification_ids': {str(n.user_id): n.pk for n in staff_notifications},
+                'unread_counts': {str(user_id): unread_counts[user_id] for user_id in staff_ids},
+            })
+            if dashboard_data is not None:
+                group_send(STAFF_DASHBOARD_GROUP, {
+                    'type': 'dashboard_update',
+                    'update_type': first.dashboard_type,
+                    'data': dashboard_data,
+                })
+
+        for (event, user_id), notification in zip(personal, personal_notifications):
+            group_send(user_notification_group(user_id), {
+                'type': 'notification_message',
+                'notification': NotificationSerializer(notification).data,
+                'unread_count': unread_counts[user_id],
+            })
+            if event.dashboard_data is not None:
+                group_send(user_dashboard_group(user_id), {
+                    'type': 'dashboard_update',
+                    'update_type': event.dashboard_type,
+                    'data': event.dashboard_data,
+                })
+
+        logger.info(f"Delivered {len(events)} '{first.notification_type}' events to {len(notifications)} notifications")
+
+
+notification_fanout = NotificationFanout()
+
+
+class DashboardDelta:
+    """
+    Dashboard updates merged into one message.
+
+    Each update adds to per-entity KPI counters (created/updated/deleted and,
+    for invoices, the amount per action); the last RECENT_LIMIT items are
+    kept for display and older ones are dropped.
+    """
+
+    ENTITIES = {
+        'customer_update': 'customer',
+        'invoice_update': 'invoice',
+        'product_update': 'product',
+    }
+    RECENT_LIMIT = 10
+
+    def __init__(self):
+        self.kpis = {}
+        self.recent = []
+        self.events = 0
+        self.dropped = 0
+
+    @staticmethod
+    def update_interval():
+        return getattr(settings, 'DASHBOARD_UPDATE_INTERVAL', DEFAULT_DASHBOARD_UPDATE_INTERVAL)
+
+    @staticmethod
+    def amount(payload):
+        """Decimal amount of an item (or of a merged update), None when it has none"""
+        if not isinstance(payload, dict) or 'amount' not in payload:
+            return None
+        try:
+            return Decimal(str(payload['amount']))
+        except InvalidOperation:
+            return Decimal('0')
+
+    def add(self, update_type, data):
+        """Merge one update; returns False (and counts it as dropped) when it is not recognised"""
+        entity = self.ENTITIES.get(update_type)
+        if entity is None or not isinstance(data, dict):
+            self.dropped += 1
+            return False
+
+        action = data.get('action') or 'updated'
+        kpis = self.kpis.setdefault(f'{entity}s', {})
+        kpis[action] = kpis.get(action, 0) + int(data.get('count') or 1)
+
+        item = data.get(entity)
+        # A coalesced update has no item, only the total amount of the events it covers
+        amount = self.amount(item if isinstance(item, dict) else data)
+        if amount is not None:
+            kpis[f'{action}_amount'] = str(Decimal(kpis.get(f'{action}_amount', '0')) + amount)
+        if isinstance(item, dict):
+            self.recent.append({'type': update_type, 'action': action, entity: item})
+            if len(self.recent) > self.RECENT_LIMIT:
+                self.dropped += len(self.recent) - self.RECENT_LIMIT
+                del self.recent[:-self.RECENT_LIMIT]
+
+        self.events += 1
+        return True
+
+    def as_message(self):
+        return {
+            'type': 'dashboard_delta',
+            'events': self.events,
+            'kpis': self.kpis,
+            'recent': self.recent,
+        }
@@ -0,0 +1,228 @@
+import asyncio
+import pytest
+from datetime import timedelta
+from unittest import mock
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+from common.metrics import DASHBOARD_UPDATES
+from .consumers import DashboardConsumer, NotificationConsumer
+from .models import Notification, NotificationArchive
+from .services import (
+    STAFF_DASHBOARD_GROUP, STAFF_NOTIFICATION_GROUP, DashboardDelta, NotificationArchiver, NotificationFanout,
+    NotificationHistory, StaffEvent, UnreadCounter, user_notification_group
+)
+
+
+def invoice_event(invoice_id, amount):
+    return StaffEvent(
+        notification_type='invoice_created', title="فاکتور جدید", message="", summary_title="فاکتورهای جدید",
+        summary_message="{count} فاکتور جدید ایجاد شد", object_id=invoice_id, dashboard_type='invoice_update',
+        dashboard_data={'action': 'created', 'invoice': {'id': invoice_id, 'amount': amount}},
+    )
+
+
+@pytest.mark.unit
+@override_settings(NOTIFICATION_COALESCE_WINDOW=60)
+class NotificationFanoutTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.staff = [User.objects.create_user(username=f"staff{index}", is_staff=True) for index in range(2)]
+        self.owner = User.objects.create_user(username="owner")
+        self.channel_layer = mock.Mock(group_send=mock.AsyncMock())
+        patcher = mock.patch('notifications.services.get_channel_layer', return_value=self.channel_layer)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def sent_to(self, group):
+        return [call.args[1] for call in self.channel_layer.group_send.await_args_list if call.args[0] == group]
+
+    def test_events_are_coalesced_into_one_batch(self):
+        """Test queued events become one bulk insert and one message per staff group"""
+        fanout = NotificationFanout()
+        with self.captureOnCommitCallbacks(execute=True):
+            for invoice_id in range(5):
+                fanout.publish(invoice_event(invoice_id, "1"))
+        self.assertFalse(Notification.objects.exists())
+
+        with mock.patch.object(Notification.objects, 'bulk_create', wraps=Notification.objects.bulk_create) as bulk_create:
+            fanout.flush()
+
+        bulk_create.assert_called_once()
+        self.assertEqual(Notification.objects.count(), 2)
+        self.assertEqual(Notification.objects.filter(title="فاکتورهای جدید", data__count=5).count(), 2)
+        [message] = self.sent_to(STAFF_NOTIFICATION_GROUP)
+        self.assertEqual(set(message['notification_ids']), {str(user.id) for user in self.staff})
+        [update] = self.sent_to(STAFF_DASHBOARD_GROUP)
+        self.assertEqual(update['data']['count'], 5)
+
+    def test_extra_recipient_gets_only_their_event(self):
+        """Test a non-staff recipient gets its own event unmerged, not the staff batch"""
+        own = invoice_event(1, "1")
+        own.user_ids = (self.owner.id,)
+
+        NotificationFanout().deliver([own, invoice_event(2, "1")])
+
+        notification = Notification.objects.get(user=self.owner)
+        self.assertEqual(notification.title, "فاکتور جدید")
+        [message] = self.sent_to(user_notification_group(self.owner.id))
+        self.assertEqual(message['notification']['id'], notification.pk)
+        self.assertEqual(message['unread_count'], 1)
+
+
+@pytest.mark.unit
+class UnreadCounterTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="staff", password="pass")
+        self.notifications = [
+            Notification.objects.create(user=self.user, notification_type='system', title=f"اعلان {index}", message="")
+            for index in range(3)
+        ]
+        self.consumer = NotificationConsumer()
+        self.consumer.user = self.user
+
+    def test_counter_is_filled_once_and_adjusted(self):
+        """Test the first read counts in the database and later changes are cache increments"""
+        self.assertEqual(UnreadCounter.get(self.user.id), 3)
+        with self.assertNumQueries(0):
+            self.assertEqual(UnreadCounter.increment([self.user.id], 2), {self.user.id: 5})
+            self.assertEqual(UnreadCounter.get(self.user.id), 5)
+
+    def test_mark_as_read_decrements(self):
+        """Test marking one and then all notifications read brings the counter down to zero"""
+        UnreadCounter.get(self.user.id)
+
+        self.assertEqual(async_to_sync(self.consumer.mark_notification_as_read)(self.notifications[0].pk), 2)
+        # Marking it again changes nothing
+        self.assertEqual(async_to_sync(self.consumer.mark_notification_as_read)(self.notifications[0].pk), 2)
+        self.assertEqual(async_to_sync(self.consumer.mark_all_as_read)(), 0)
+        self.assertEqual(UnreadCounter.get(self.user.id), 0)
+
+    def test_reconcile_fixes_drift(self):
+        """Test reconcile resets a drifted counter from the database"""
+        cache.set(UnreadCounter.key(self.user.id), 42)
+
+        self.assertEqual(UnreadCounter.reconcile([self.user.id]), 1)
+        self.assertEqual(UnreadCounter.get(self.user.id), 3)
+
+
+@pytest.mark.unit
+class NotificationHistoryTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="staff", password="pass")
+        self.other = User.objects.create_user(username="other", password="pass")
+        self.notifications = [
+            Notification.objects.create(
+                user=self.user, notification_type='system', title=f"اعلان {index}", message="", is_read=index % 2 == 0
+            )
+            for index in range(5)
+        ]
+        Notification.objects.create(user=self.other, notification_type='system', title="دیگری", message="")
+
+    def test_pages_follow_the_cursor(self):
+        """Test pages are newest first and continue from the cursor without gaps"""
+        first, cursor = NotificationHistory.page(self.user.id, limit=2)
+        second, cursor = NotificationHistory.page(self.user.id, cursor=cursor, limit=2)
+        third, last_cursor = NotificationHistory.page(self.user.id, cursor=cursor, limit=2)
+
+        ids = [notification.pk for notification in first + second + third]
+        self.assertEqual(ids, [notification.pk for notification in reversed(self.notifications)])
+        self.assertIsNone(last_cursor)
+
+    def test_rest_endpoint_and_invalid_cursor(self):
+        """Test the history endpoint is mounted and rejects a malformed cursor"""
+        client = APIClient()
+        client.force_authenticate(self.user)
+        url = '/api/v1/notifications/notifications/'
+
+        response = client.get(url, {'limit': 2, 'unread_only': 'true'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), 2)
+        self.assertFalse(any(item['is_read'] for item in response.data['results']))
+        self.assertIsNone(response.data['next_cursor'])
+
+        response = client.get(url, {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_archiver_moves_only_old_read_notifications(self):
+        """Test read notifications past retention move to the archive in batches; unread ones stay"""
+        Notification.objects.filter(user=self.user).update(created_at=timezone.now() - timedelta(days=100))
+
+        moved = NotificationArchiver(days=90, batch_size=2).run()
+
+        self.assertEqual(moved, 3)
+        self.assertEqual(Notification.objects.filter(user=self.user).count(), 2)
+        self.assertFalse(Notification.objects.filter(user=self.user, is_read=True).exists())
+        archived = NotificationArchive.objects.get(original_id=self.notifications[0].pk)
+        self.assertEqual(archived.title, "اعلان 0")
+        self.assertEqual(archived.user_id, self.user.id)
+
+
+@pytest.mark.unit
+class DashboardDeltaTest(SimpleTestCase):
+    def test_updates_merge_into_kpis(self):
+        """Test counts and amounts add up per entity and action and unknown updates are dropped"""
+        delta = DashboardDelta()
+        delta.add('invoice_update', {'action': 'created', 'invoice': {'id': 1, 'amount': "10.5"}})
+        delta.add('invoice_update', {'action': 'created', 'invoice': {'id': 2, 'amount': "4.5"}})
+        delta.add('customer_update', {'action': 'deleted', 'customer': {'id': 3}})
+        self.assertFalse(delta.add('unknown_update', {}))
+
+        message = delta.as_message()
+        self.assertEqual(message['events'], 3)
+        self.assertEqual(message['kpis']['invoices'], {'created': 2, 'created_amount': "15.0"})
+        self.assertEqual(message['kpis']['customers'], {'deleted': 1})
+        self.assertEqual(len(message['recent']), 3)
+        self.assertEqual(delta.dropped, 1)
+
+    def test_recent_items_are_capped(self):
+        """Test only the last RECENT_LIMIT items are kept and the rest count as dropped"""
+        delta = DashboardDelta()
+        for product_id in range(DashboardDelta.RECENT_LIMIT + 3):
+            delta.add('product_update', {'action': 'created', 'product': {'id': product_id}})
+
+        self.assertEqual(delta.kpis['products']['created'], DashboardDelta.RECENT_LIMIT + 3)
+        self.assertEqual([item['product']['id'] for item in delta.recent][0], 3)
+        self.assertEqual(delta.dropped, 3)
+
+    def test_coalesced_update_keeps_total_amount(self):
+        """Test a coalesced staff update counts every event and carries the summed amount"""
+        _, _, _, dashboard_data = NotificationFanout.merge([invoice_event(1, "10"), invoice_event(2, "2.5")])
+
+        delta = DashboardDelta()
+        delta.add('invoice_update', dashboard_data)
+
+        self.assertEqual(delta.kpis['invoices'], {'created': 2, 'created_amount': "12.5"})
+
+
+@pytest.mark.unit
+@override_settings(DASHBOARD_UPDATE_INTERVAL=0.01)
+class DashboardConsumerDebounceTest(SimpleTestCase):
+    def outcome(self, name):
+        return DASHBOARD_UPDATES.values.get((name,), 0)
+
+    def test_updates_within_interval_are_sent_once(self):
+        """Test a burst of updates is pushed as one merged delta and dropped updates are not counted as merged"""
+        consumer = DashboardConsumer()
+        consumer.pending_delta = None
+        consumer.flush_task = None
+        consumer.send = mock.AsyncMock()
+        merged, dropped = self.outcome('merged'), self.outcome('dropped')
+
+        async def burst():
+            for invoice_id in range(3):
+                await consumer.invoice_update({'data': {'action': 'created', 'invoice': {'id': invoice_id}}})
+            await consumer.queue_update('unknown_update', {})
+            await asyncio.sleep(0.05)
+
+        async_to_sync(burst)()
+
+        consumer.send.assert_awaited_once()
+        self.assertIn('"events": 3', consumer.send.await_args.kwargs['text_data'])
+        self.assertEqual(self.outcome('merged') - merged, 2)
+        self.assertEqual(self.outcome('dropped') - dropped, 1)
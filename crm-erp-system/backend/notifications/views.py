@@ -0,0 +1,31 @@
+from rest_framework import viewsets, status
+from rest_framework.response import Response
+from .models import Notification
+from .serializers import NotificationSerializer
+from .services import NotificationHistory
+
+
+class NotificationViewSet(viewsets.ReadOnlyModelViewSet):
+    serializer_class = NotificationSerializer
+    
+    def get_queryset(self):
+        return Notification.objects.filter(user=self.request.user)
+    
+    def list(self, request):
+        """تاریخچه اعلان‌ها با صفحه‌بندی مبتنی بر نشانگر (cursor)"""
+        try:
+            notifications, next_cursor = NotificationHistory.page(
+                request.user.id,
+                cursor=request.query_params.get('cursor'),
+                limit=request.query_params.get('limit'),
+                unread_only=request.query_params.get('unread_only') == 'true',
+            )
+        except ValueError:
+            return Response({'error': 'نشانگر صفحه نامعتبر است'}, 
+                          status=status.HTTP_400_BAD_REQUEST)
+        
+        serializer = self.get_serializer(notifications, many=True)
+        return Response({
+            'results': serializer.data,
+            'next_cursor': next_cursor,
+        })
@@ -3,6 +3,7 @@ from rest_framework.decorators import action
 from rest_framework.response import Response
 from django_filters.rest_framework import DjangoFilterBackend
 from django.db.models import Q
+from common.stats import STATS_CACHE_TIMEOUT, StatsBuilder
 from .models import Personnel, PersonnelContact, PersonnelDocument
 from .serializers import (
     PersonnelSerializer, PersonnelListSerializer, 
@@ -45,17 +46,13 @@ class PersonnelViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['get'])
     def stats(self, request):
         """آمار کلی پرسنل"""
-        total_personnel = self.get_queryset().count()
-        primary_contacts = self.get_queryset().filter(is_primary_contact=True).count()
-        authorized_for_orders = self.get_queryset().filter(is_authorized_for_orders=True).count()
-        authorized_for_payment = self.get_queryset().filter(is_authorized_for_payment=True).count()
+        stats = StatsBuilder(self.get_queryset(), cache_timeout=STATS_CACHE_TIMEOUT)
+        stats.count('total_personnel')
+        stats.count('primary_contacts', Q(is_primary_contact=True))
+        stats.count('authorized_for_orders', Q(is_authorized_for_orders=True))
+        stats.count('authorized_for_payment', Q(is_authorized_for_payment=True))
         
-        return Response({
-            'total_personnel': total_personnel,
-            'primary_contacts': primary_contacts,
-            'authorized_for_orders': authorized_for_orders,
-            'authorized_for_payment': authorized_for_payment,
-        })
+        return Response(stats.build())
     
     @action(detail=True, methods=['post'])
     def add_contact(self, request, pk=None):
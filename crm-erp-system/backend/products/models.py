@@ -32,19 +32,23 @@ class ProductCategory(models.Model):
         ordering = ['sort_order', 'name']
     
     def __str__(self):
+        from .services import CategoryTree
+        
+        path = CategoryTree.cached_full_path(self.pk) if self.pk is not None else None
+        if path:
+            return path
         if self.parent:
             return f"{self.parent} > {self.name}"
         return self.name
     
     @property
     def full_path(self):
-        """مسیر کامل دسته"""
-        path = [self.name]
-        current = self.parent
-        while current:
-            path.insert(0, current.name)
-            current = current.parent
-        return ' > '.join(path)
+        """مسیر کامل دسته - از درخت کش‌شده، بدون کوئری برای هر جد"""
+        from .services import CategoryTree
+        
+        if self.pk is None:
+            return self.name
+        return CategoryTree.full_path(self.pk) or self.name
 
 
 class Product(models.Model):
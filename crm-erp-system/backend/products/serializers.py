@@ -3,11 +3,17 @@ from .models import Product, ProductCategory, ProductImage, ProductAttribute, Pr
 
 
 class ProductCategorySerializer(serializers.ModelSerializer):
-    full_path = serializers.ReadOnlyField()
+    full_path = serializers.SerializerMethodField()
     
     class Meta:
         model = ProductCategory
         fields = '__all__'
+    
+    def get_full_path(self, obj):
+        paths = self.context.get('category_paths')
+        if paths is not None and obj.pk in paths:
+            return paths[obj.pk]
+        return obj.full_path
 
 
 class ProductImageSerializer(serializers.ModelSerializer):
@@ -0,0 +1,129 @@
+from django.core.cache import cache
+from django.db import transaction
+from .models import ProductCategory
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class CategoryTree:
+    """
+    Product category hierarchy loaded with one query and cached as a whole.
+
+    The cached entry holds the nested tree of active categories, the full
+    path of every category and a children map used for descendant lookups.
+    It is dropped whenever a category is saved or deleted.
+    """
+
+    CACHE_KEY = 'product_category_tree'
+    CACHE_TIMEOUT = 60 * 60 * 24
+
+    NODE_FIELDS = ('id', 'name', 'parent_id', 'description', 'image', 'is_active', 'sort_order')
+
+    @classmethod
+    def build(cls):
+        """Load every category in one query and assemble tree, paths and children map in memory"""
+        rows = list(ProductCategory.objects.order_by('sort_order', 'name').values(*cls.NODE_FIELDS))
+        image_storage = ProductCategory._meta.get_field('image').storage
+
+        nodes = {}
+        children = {}
+        for row in rows:
+            row['image'] = image_storage.url(row['image']) if row['image'] else None
+            row['children'] = []
+            nodes[row['id']] = row
+            children.setdefault(row['parent_id'], []).append(row['id'])
+
+        paths = {}
+
+        def resolve_path(category_id):
+            # Iterative walk up to the first resolved ancestor; guards against cycles
+            chain = []
+            current = category_id
+            while current is not None and current not in paths and current not in chain:
+                chain.append(current)
+                current = nodes[current]['parent_id'] if current in nodes else None
+            prefix = paths.get(current)
+            for node_id in reversed(chain):
+                name = nodes[node_id]['name']
+                prefix = f"{prefix} > {name}" if prefix else name
+                paths[node_id] = prefix
+
+        for category_id in nodes:
+            resolve_path(category_id)
+
+        tree = []
+        for node in nodes.values():
+            node['full_path'] = paths[node['id']]
+            if not node['is_active']:
+                continue
+            parent = nodes.get(node['parent_id'])
+            if parent is None:
+                tree.append(node)
+            elif parent['is_active']:
+                parent['children'].append(node)
+
+        return {'tree': tree, 'paths': paths, 'children': children}
+
+    @classmethod
+    def get(cls):
+        data = cache.get(cls.CACHE_KEY)
+        if data is None:
+            data = cls.build()
+            cache.set(cls.CACHE_KEY, data, cls.CACHE_TIMEOUT)
+        return data
+
+    @classmethod
+    def invalidate(cls):
+        """
+        Drop the cached tree now and again once the current transaction
+        commits; the second delete discards a tree another request may have
+        cached from the pre-commit data in between.
+        """
+        cache.delete(cls.CACHE_KEY)
+        transaction.on_commit(lambda: cache.delete(cls.CACHE_KEY))
+
+    @classmethod
+    def tree(cls):
+        return cls.get()['tree']
+
+    @classmethod
+    def paths(cls):
+        return cls.get()['paths']
+
+    @classmethod
+    def full_path(cls, category_id):
+        return cls.paths().get(category_id)
+
+    @classmethod
+    def cached_full_path(cls, category_id):
+        """Full path from the cached tree, or None when it is not cached; never builds it"""
+        data = cache.get(cls.CACHE_KEY)
+        return data['paths'].get(category_id) if data is not None else None
+
+    @classmethod
+    def descendant_ids(cls, category_id, include_self=True):
+        """Ids of all categories below category_id, resolved from the cached children map"""
+        children = cls.get()['children']
+        result = [category_id] if include_self else []
+        stack = list(children.get(category_id, []))
+        seen = set(result)
+        while stack:
+            node_id = stack.pop()
+            if node_id in seen:
+                continue
+            seen.add(node_id)
+            result.append(node_id)
+            stack.extend(children.get(node_id, []))
+        return result
+
+    @classmethod
+    def subtree(cls, category_id):
+        """Nested subtree rooted at category_id (active categories only)"""
+        stack = list(cls.tree())
+        while stack:
+            node = stack.pop()
+            if node['id'] == category_id:
+                return node
+            stack.extend(node['children'])
+        return None
@@ -0,0 +1,18 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from common.decorators import invalidate_on_change
+from .models import ProductCategory, Product, ProductImage, ProductAttribute, ProductAttributeValue
+from .services import CategoryTree
+
+invalidate_on_change(Product)
+invalidate_on_change(ProductCategory)
+invalidate_on_change(ProductImage, Product)
+invalidate_on_change(ProductAttribute)
+invalidate_on_change(ProductAttributeValue, Product)
+
+
+@receiver(post_save, sender=ProductCategory)
+@receiver(post_delete, sender=ProductCategory)
+def invalidate_category_tree(sender, **kwargs):
+    """Drop the cached category tree when any category changes"""
+    CategoryTree.invalidate()
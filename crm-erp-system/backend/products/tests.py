@@ -1,3 +1,72 @@
+import pytest
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
 from django.test import TestCase
+from rest_framework.test import APIClient
+from .models import ProductCategory
+from .services import CategoryTree
 
-# Create your tests here.
+
+@pytest.mark.unit
+class CategoryTreeTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.root = ProductCategory.objects.create(name="الکترونیک", sort_order=1)
+        self.phones = ProductCategory.objects.create(name="موبایل", parent=self.root)
+        self.android = ProductCategory.objects.create(name="اندروید", parent=self.phones)
+        self.books = ProductCategory.objects.create(name="کتاب", sort_order=2)
+
+    def test_tree_is_built_with_one_query_and_cached(self):
+        """Test the nested tree costs one query and is then served from cache"""
+        with self.assertNumQueries(1):
+            tree = CategoryTree.tree()
+        with self.assertNumQueries(0):
+            CategoryTree.tree()
+
+        self.assertEqual([node['name'] for node in tree], ["الکترونیک", "کتاب"])
+        self.assertEqual(tree[0]['children'][0]['children'][0]['full_path'], "الکترونیک > موبایل > اندروید")
+
+    def test_full_path_and_str_use_cached_paths(self):
+        """Test full_path no longer walks the parents"""
+        CategoryTree.get()
+        category = ProductCategory.objects.get(pk=self.android.pk)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(str(category), "الکترونیک > موبایل > اندروید")
+
+    def test_str_does_not_build_tree(self):
+        """Test __str__ falls back to the parent chain instead of loading every category"""
+        category = ProductCategory.objects.select_related('parent__parent').get(pk=self.android.pk)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(str(category), "الکترونیک > موبایل > اندروید")
+        self.assertIsNone(cache.get(CategoryTree.CACHE_KEY))
+
+    def test_update_returns_new_full_path(self):
+        """Test the API response of a rename carries the path computed after the save"""
+        client = APIClient()
+        client.force_authenticate(get_user_model().objects.create_user(username="manager", password="pass"))
+        CategoryTree.get()
+
+        response = client.patch(f'/api/v1/products/categories/{self.phones.pk}/', {'name': "گوشی"}, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['full_path'], "الکترونیک > گوشی")
+
+    def test_save_and_delete_invalidate_cache(self):
+        """Test category changes are visible immediately"""
+        CategoryTree.get()
+        self.phones.name = "گوشی"
+        self.phones.save()
+        self.assertEqual(CategoryTree.full_path(self.android.pk), "الکترونیک > گوشی > اندروید")
+
+        self.phones.delete()
+        self.assertEqual(CategoryTree.descendant_ids(self.root.pk), [self.root.pk])
+
+    def test_descendant_ids(self):
+        """Test descendant lookup covers all levels"""
+        self.assertEqual(
+            set(CategoryTree.descendant_ids(self.root.pk)),
+            {self.root.pk, self.phones.pk, self.android.pk},
+        )
+        self.assertEqual(CategoryTree.descendant_ids(self.phones.pk, include_self=False), [self.android.pk])
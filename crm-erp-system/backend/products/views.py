@@ -3,11 +3,13 @@ from rest_framework.decorators import action
 from rest_framework.response import Response
 from django_filters.rest_framework import DjangoFilterBackend
 from django.db.models import Q, F
+from common.stats import STATS_CACHE_TIMEOUT, StatsBuilder
 from .models import Product, ProductCategory, ProductImage, ProductAttribute, ProductAttributeValue
 from .serializers import (
     ProductSerializer, ProductListSerializer, ProductCategorySerializer, 
     ProductImageSerializer, ProductAttributeSerializer, ProductAttributeValueSerializer
 )
+from .services import CategoryTree
 
 
 class ProductCategoryViewSet(viewsets.ModelViewSet):
@@ -19,11 +21,37 @@ class ProductCategoryViewSet(viewsets.ModelViewSet):
     ordering_fields = ['name', 'sort_order', 'created_at']
     ordering = ['sort_order', 'name']
     
+    def get_serializer_context(self):
+        # فقط برای لیست؛ در ایجاد و ویرایش مسیر پس از ذخیره از درخت تازه خوانده می‌شود
+        context = super().get_serializer_context()
+        if self.action == 'list':
+            context['category_paths'] = CategoryTree.paths()
+        return context
+    
     @action(detail=False, methods=['get'])
     def tree(self, request):
-        """درخت دسته‌بندی محصولات"""
-        categories = ProductCategory.objects.filter(is_active=True).order_by('sort_order', 'name')
-        return Response(self.serializer_class(categories, many=True).data)
+        """درخت دسته‌بندی محصولات - از کش، ساخته‌شده با یک کوئری"""
+        root_id = request.query_params.get('root_id')
+        if root_id:
+            try:
+                node = CategoryTree.subtree(int(root_id))
+            except ValueError:
+                node = None
+            if node is None:
+                return Response({'error': 'دسته یافت نشد'}, status=status.HTTP_404_NOT_FOUND)
+            return Response([node])
+        
+        return Response(CategoryTree.tree())
+    
+    @action(detail=True, methods=['get'])
+    def descendants(self, request, pk=None):
+        """شناسه دسته و همه زیردسته‌ها"""
+        category = self.get_object()
+        include_self = request.query_params.get('include_self', 'true') == 'true'
+        return Response({
+            'category_id': category.id,
+            'descendant_ids': CategoryTree.descendant_ids(category.id, include_self=include_self),
+        })
 
 
 class ProductViewSet(viewsets.ModelViewSet):
@@ -42,6 +70,15 @@ class ProductViewSet(viewsets.ModelViewSet):
     def get_queryset(self):
         queryset = super().get_queryset()
         
+        # فیلتر بر اساس دسته و همه زیردسته‌ها
+        category_tree = self.request.query_params.get('category_tree')
+        if category_tree:
+            try:
+                category_ids = CategoryTree.descendant_ids(int(category_tree))
+            except ValueError:
+                category_ids = []
+            queryset = queryset.filter(category_id__in=category_ids)
+        
         # فیلتر بر اساس تگ‌ها
         tags = self.request.query_params.get('tags')
         if tags:
@@ -71,19 +108,13 @@ class ProductViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['get'])
     def stats(self, request):
         """آمار کلی محصولات"""
-        total_products = self.get_queryset().count()
-        active_products = self.get_queryset().filter(status='active').count()
-        low_stock_products = self.get_queryset().filter(
-            current_stock__lte=F('min_stock')
-        ).count()
-        out_of_stock_products = self.get_queryset().filter(current_stock__lte=0).count()
+        stats = StatsBuilder(self.get_queryset(), cache_timeout=STATS_CACHE_TIMEOUT, models=(Product,))
+        stats.count('total_products')
+        stats.count('active_products', Q(status='active'))
+        stats.count('low_stock_products', Q(current_stock__lte=F('min_stock')))
+        stats.count('out_of_stock_products', Q(current_stock__lte=0))
         
-        return Response({
-            'total_products': total_products,
-            'active_products': active_products,
-            'low_stock_products': low_stock_products,
-            'out_of_stock_products': out_of_stock_products,
-        })
+        return Response(stats.build())
     
     @action(detail=True, methods=['post'])
     def add_tags(self, request, pk=None):
@@ -4,6 +4,7 @@ from rest_framework.response import Response
 from django_filters.rest_framework import DjangoFilterBackend
 from django.db.models import Q, F, Sum, Count
 from django.utils import timezone
+from common.stats import STATS_CACHE_TIMEOUT, StatsBuilder
 from .models import ReportTemplate, ReportExecution, ReportSchedule, Dashboard, DashboardWidget
 from .serializers import (
     ReportTemplateSerializer, ReportExecutionSerializer, ReportScheduleSerializer,
@@ -23,18 +24,12 @@ class ReportTemplateViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['get'])
     def stats(self, request):
         """آمار قالب‌های گزارش"""
-        total_templates = self.get_queryset().count()
-        active_templates = self.get_queryset().filter(status='active').count()
+        stats = StatsBuilder(self.get_queryset(), cache_timeout=STATS_CACHE_TIMEOUT)
+        stats.count('total_templates')
+        stats.count('active_templates', Q(is_active=True))
+        stats.breakdown('type_stats', 'report_type', ReportTemplate.REPORT_TYPES)
         
-        type_stats = {}
-        for report_type, _ in ReportTemplate.REPORT_TYPES:
-            type_stats[report_type] = self.get_queryset().filter(report_type=report_type).count()
-        
-        return Response({
-            'total_templates': total_templates,
-            'active_templates': active_templates,
-            'type_stats': type_stats,
-        })
+        return Response(stats.build())
     
     @action(detail=True, methods=['post'])
     def execute(self, request, pk=None):
@@ -89,17 +84,13 @@ class ReportExecutionViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['get'])
     def stats(self, request):
         """آمار اجرای گزارش‌ها"""
-        total_executions = self.get_queryset().count()
-        completed_executions = self.get_queryset().filter(status='completed').count()
-        running_executions = self.get_queryset().filter(status='running').count()
-        failed_executions = self.get_queryset().filter(status='failed').count()
+        stats = StatsBuilder(self.get_queryset(), cache_timeout=STATS_CACHE_TIMEOUT)
+        stats.count('total_executions')
+        stats.count('completed_executions', Q(status='completed'))
+        stats.count('running_executions', Q(status='running'))
+        stats.count('failed_executions', Q(status='failed'))
         
-        return Response({
-            'total_executions': total_executions,
-            'completed_executions': completed_executions,
-            'running_executions': running_executions,
-            'failed_executions': failed_executions,
-        })
+        return Response(stats.build())
 
 
 class ReportScheduleViewSet(viewsets.ModelViewSet):
@@ -114,18 +105,12 @@ class ReportScheduleViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['get'])
     def stats(self, request):
         """آمار برنامه‌های گزارش"""
-        total_schedules = self.get_queryset().count()
-        active_schedules = self.get_queryset().filter(status='active').count()
-        
-        frequency_stats = {}
-        for frequency, _ in ReportSchedule.FREQUENCY_CHOICES:
-            frequency_stats[frequency] = self.get_queryset().filter(frequency=frequency).count()
+        stats = StatsBuilder(self.get_queryset(), cache_timeout=STATS_CACHE_TIMEOUT)
+        stats.count('total_schedules')
+        stats.count('active_schedules', Q(is_active=True))
+        stats.breakdown('frequency_stats', 'frequency', ReportSchedule.FREQUENCY_CHOICES)
         
-        return Response({
-            'total_schedules': total_schedules,
-            'active_schedules': active_schedules,
-            'frequency_stats': frequency_stats,
-        })
+        return Response(stats.build())
     
     @action(detail=True, methods=['post'])
     def activate(self, request, pk=None):
@@ -179,15 +164,12 @@ class DashboardViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['get'])
     def stats(self, request):
         """آمار داشبوردها"""
-        total_dashboards = self.get_queryset().count()
-        public_dashboards = self.get_queryset().filter(is_public=True).count()
-        private_dashboards = total_dashboards - public_dashboards
+        stats = StatsBuilder(self.get_queryset(), cache_timeout=STATS_CACHE_TIMEOUT)
+        stats.count('total_dashboards')
+        stats.count('public_dashboards', Q(is_public=True))
+        stats.count('private_dashboards', Q(is_public=False))
         
-        return Response({
-            'total_dashboards': total_dashboards,
-            'public_dashboards': public_dashboards,
-            'private_dashboards': private_dashboards,
-        })
+        return Response(stats.build())
 
 
 class DashboardWidgetViewSet(viewsets.ModelViewSet):
@@ -211,13 +193,8 @@ class DashboardWidgetViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['get'])
     def stats(self, request):
         """آمار ویجت‌ها"""
-        total_widgets = self.get_queryset().count()
-        
-        type_stats = {}
-        for widget_type, _ in DashboardWidget.WIDGET_TYPES:
-            type_stats[widget_type] = self.get_queryset().filter(widget_type=widget_type).count()
+        stats = StatsBuilder(self.get_queryset(), cache_timeout=STATS_CACHE_TIMEOUT)
+        stats.count('total_widgets')
+        stats.breakdown('type_stats', 'widget_type', DashboardWidget.WIDGET_TYPES)
         
-        return Response({
-            'total_widgets': total_widgets,
-            'type_stats': type_stats,
-        })
\ No newline at end of file
+        return Response(stats.build())
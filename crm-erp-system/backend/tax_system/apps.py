@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class TaxSystemConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'tax_system'
+    
+    def ready(self):
+        from . import signals  # noqa: F401
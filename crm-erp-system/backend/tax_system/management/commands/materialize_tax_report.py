@@ -0,0 +1,28 @@
+from datetime import date, timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from tax_system.services import TaxReportService
+
+
+class Command(BaseCommand):
+    help = 'Store the per-taxpayer tax report sums of a period in TaxPeriodSummary'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--from', dest='date_from', help='Period start (YYYY-MM-DD), defaults to the start of last month')
+        parser.add_argument('--to', dest='date_to', help='Period end (YYYY-MM-DD), defaults to the end of last month')
+
+    def parse(self, value):
+        try:
+            return date.fromisoformat(value)
+        except ValueError:
+            raise CommandError(f'Invalid date: {value}')
+
+    def handle(self, *args, **options):
+        last_month_end = timezone.localdate().replace(day=1) - timedelta(days=1)
+        date_from = self.parse(options['date_from']) if options['date_from'] else last_month_end.replace(day=1)
+        date_to = self.parse(options['date_to']) if options['date_to'] else last_month_end
+        if date_from > date_to:
+            raise CommandError('Period start is after its end')
+
+        rows = TaxReportService(date_from, date_to).materialize()
+        self.stdout.write(self.style.SUCCESS(f'Stored {rows} tax summary rows for {date_from} - {date_to}'))
@@ -0,0 +1,50 @@
+# Generated by Django 5.2.6 on 2026-10-16 22:49
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tax_system', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TaxPeriodSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period_start', models.DateField(verbose_name='شروع دوره')),
+                ('period_end', models.DateField(verbose_name='پایان دوره')),
+                ('transaction_type', models.CharField(choices=[('sale', 'فروش'), ('purchase', 'خرید'), ('return', 'مرجوعی'), ('adjustment', 'تعدیل'), ('exemption', 'معافیت')], max_length=15, verbose_name='نوع تراکنش')),
+                ('transaction_count', models.PositiveIntegerField(default=0, verbose_name='تعداد تراکنش')),
+                ('gross_amount', models.DecimalField(decimal_places=2, default=0, max_digits=18, verbose_name='مبلغ ناخالص')),
+                ('tax_exempt_amount', models.DecimalField(decimal_places=2, default=0, max_digits=18, verbose_name='مبلغ معاف')),
+                ('taxable_amount', models.DecimalField(decimal_places=2, default=0, max_digits=18, verbose_name='مبلغ مشمول مالیات')),
+                ('tax_amount', models.DecimalField(decimal_places=2, default=0, max_digits=18, verbose_name='مبلغ مالیات')),
+                ('net_amount', models.DecimalField(decimal_places=2, default=0, max_digits=18, verbose_name='مبلغ خالص')),
+                ('generated_at', models.DateTimeField(auto_now_add=True, verbose_name='تاریخ تولید')),
+            ],
+            options={
+                'verbose_name': 'خلاصه مالیاتی دوره',
+                'verbose_name_plural': 'خلاصه\u200cهای مالیاتی دوره',
+                'ordering': ['period_start', 'taxpayer', 'transaction_type'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='taxtransaction',
+            index=models.Index(fields=['transaction_date', 'taxpayer', 'transaction_type'], name='tax_system__transac_14df18_idx'),
+        ),
+        migrations.AddField(
+            model_name='taxperiodsummary',
+            name='taxpayer',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='period_summaries', to='tax_system.taxpayer', verbose_name='مودی'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='taxperiodsummary',
+            unique_together={('period_start', 'period_end', 'taxpayer', 'transaction_type')},
+        ),
+    ]
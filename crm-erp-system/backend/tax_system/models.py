@@ -280,7 +280,42 @@ class TaxTransaction(models.Model):
             models.Index(fields=['transaction_type']),
             models.Index(fields=['status']),
             models.Index(fields=['transaction_date']),
+            models.Index(fields=['transaction_date', 'taxpayer', 'transaction_type']),
         ]
     
     def __str__(self):
-        return f"{self.transaction_number} - {self.taxpayer.customer.full_name}"
\ No newline at end of file
+        return f"{self.transaction_number} - {self.taxpayer.customer.full_name}"
+
+
+class TaxPeriodSummary(models.Model):
+    """جمع تراکنش‌های هر مودی به تفکیک نوع تراکنش در یک دوره مالیاتی (گزارش مادی‌شده)"""
+    
+    period_start = models.DateField(verbose_name='شروع دوره')
+    period_end = models.DateField(verbose_name='پایان دوره')
+    taxpayer = models.ForeignKey(
+        TaxPayer, 
+        on_delete=models.CASCADE, 
+        related_name='period_summaries',
+        verbose_name='مودی'
+    )
+    transaction_type = models.CharField(
+        max_length=15, 
+        choices=TaxTransaction.TRANSACTION_TYPES, 
+        verbose_name='نوع تراکنش'
+    )
+    transaction_count = models.PositiveIntegerField(default=0, verbose_name='تعداد تراکنش')
+    gross_amount = models.DecimalField(max_digits=18, decimal_places=2, default=0, verbose_name='مبلغ ناخالص')
+    tax_exempt_amount = models.DecimalField(max_digits=18, decimal_places=2, default=0, verbose_name='مبلغ معاف')
+    taxable_amount = models.DecimalField(max_digits=18, decimal_places=2, default=0, verbose_name='مبلغ مشمول مالیات')
+    tax_amount = models.DecimalField(max_digits=18, decimal_places=2, default=0, verbose_name='مبلغ مالیات')
+    net_amount = models.DecimalField(max_digits=18, decimal_places=2, default=0, verbose_name='مبلغ خالص')
+    generated_at = models.DateTimeField(auto_now_add=True, verbose_name='تاریخ تولید')
+    
+    class Meta:
+        verbose_name = 'خلاصه مالیاتی دوره'
+        verbose_name_plural = 'خلاصه‌های مالیاتی دوره'
+        unique_together = ['period_start', 'period_end', 'taxpayer', 'transaction_type']
+        ordering = ['period_start', 'taxpayer', 'transaction_type']
+    
+    def __str__(self):
+        return f"{self.taxpayer_id} - {self.transaction_type} ({self.period_start} - {self.period_end})"
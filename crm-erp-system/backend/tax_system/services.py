@@ -0,0 +1,167 @@
+from decimal import Decimal
+from django.db import transaction
+from django.db.models import Count, F, Q, Sum
+from .models import TaxPeriodSummary, TaxTransaction
+import logging
+
+logger = logging.getLogger(__name__)
+
+ZERO = Decimal('0')
+
+AMOUNT_FIELDS = ('gross_amount', 'tax_exempt_amount', 'taxable_amount', 'tax_amount', 'net_amount')
+
+TAXPAYER_FIELDS = {
+    'taxpayer_code': F('taxpayer__taxpayer_id'),
+    'economic_code': F('taxpayer__economic_code'),
+    'customer_type': F('taxpayer__customer__customer_type'),
+    'company_name': F('taxpayer__customer__company_name'),
+    'first_name': F('taxpayer__customer__first_name'),
+    'last_name': F('taxpayer__customer__last_name'),
+}
+
+
+def taxpayer_name(row):
+    """Same rule as Customer.full_name, applied to a values() row"""
+    if row['customer_type'] == 'legal' and row['company_name']:
+        return row['company_name']
+    return f"{row['first_name']} {row['last_name']}"
+
+
+class TaxReportService:
+    """
+    Tax report built from one GROUP BY taxpayer, transaction_type query.
+
+    Rows come back ordered by taxpayer so per-taxpayer results can be
+    streamed one taxpayer at a time without holding the report in memory.
+    Periods can be materialized into TaxPeriodSummary and read from there;
+    saving or deleting a transaction drops the summaries of its period
+    (see signals.py).
+    """
+
+    def __init__(self, date_from, date_to, transactions=None):
+        self.date_from = date_from
+        self.date_to = date_to
+        self.transactions = transactions if transactions is not None else TaxTransaction.objects.all()
+
+    def is_materialized(self):
+        return TaxPeriodSummary.objects.filter(period_start=self.date_from, period_end=self.date_to).exists()
+
+    def live_rows(self):
+        """Grouped sums straight from the transactions"""
+        return self.transactions.filter(
+            transaction_date__gte=self.date_from,
+            transaction_date__lte=self.date_to,
+        ).values('taxpayer_id', 'transaction_type').annotate(
+            **TAXPAYER_FIELDS,
+            transaction_count=Count('id'),
+            **{field: Sum(field) for field in AMOUNT_FIELDS},
+        ).order_by('taxpayer_id', 'transaction_type')
+
+    def materialized_rows(self):
+        return TaxPeriodSummary.objects.filter(
+            period_start=self.date_from, period_end=self.date_to
+        ).values(
+            'taxpayer_id', 'transaction_type', 'transaction_count', *AMOUNT_FIELDS, **TAXPAYER_FIELDS
+        ).order_by('taxpayer_id', 'transaction_type')
+
+    def rows(self, materialized=False):
+        return self.materialized_rows() if materialized else self.live_rows()
+
+    def iter_taxpayers(self, materialized=False):
+        """Yield one dict per taxpayer (totals plus a per-type breakdown) while consuming the grouped rows"""
+        current = None
+        for row in self.rows(materialized).iterator(chunk_size=2000):
+            if current is None or current['taxpayer_id'] != row['taxpayer_id']:
+                if current is not None:
+                    yield current
+                current = {
+                    'taxpayer_id': row['taxpayer_id'],
+                    'taxpayer_code': row['taxpayer_code'],
+                    'economic_code': row['economic_code'],
+                    'name': taxpayer_name(row),
+                    'count': 0,
+                    **{field: ZERO for field in AMOUNT_FIELDS},
+                    'by_type': {},
+                }
+            current['count'] += row['transaction_count']
+            for field in AMOUNT_FIELDS:
+                current[field] += row[field] or ZERO
+            current['by_type'][row['transaction_type']] = {
+                'count': row['transaction_count'],
+                'amount': row['gross_amount'] or ZERO,
+                'tax': row['tax_amount'] or ZERO,
+            }
+        if current is not None:
+            yield current
+
+    @staticmethod
+    def empty_summary():
+        return {
+            'summary': {'total_transactions': 0, 'total_amount': ZERO, 'total_tax': ZERO},
+            'by_type': {
+                transaction_type: {'count': 0, 'amount': ZERO, 'tax': ZERO}
+                for transaction_type, _ in TaxTransaction.TRANSACTION_TYPES
+            },
+        }
+
+    @staticmethod
+    def add_to_summary(totals, taxpayer):
+        totals['summary']['total_transactions'] += taxpayer['count']
+        totals['summary']['total_amount'] += taxpayer['gross_amount']
+        totals['summary']['total_tax'] += taxpayer['tax_amount']
+        for transaction_type, values in taxpayer['by_type'].items():
+            bucket = totals['by_type'].setdefault(transaction_type, {'count': 0, 'amount': ZERO, 'tax': ZERO})
+            bucket['count'] += values['count']
+            bucket['amount'] += values['amount']
+            bucket['tax'] += values['tax']
+
+    def build(self, materialized=False):
+        """The whole report as one dict (for regular JSON responses)"""
+        totals = self.empty_summary()
+        taxpayers = []
+        for taxpayer in self.iter_taxpayers(materialized):
+            self.add_to_summary(totals, taxpayer)
+            taxpayers.append(taxpayer)
+        return {
+            'period': {'from': self.date_from, 'to': self.date_to},
+            'materialized': materialized,
+            **totals,
+            'by_taxpayer': taxpayers,
+        }
+
+    @staticmethod
+    def invalidate(*dates):
+        """
+        Drop the stored summaries of every period containing one of the dates;
+        reports for those periods fall back to the live query until they are
+        materialized again
+        """
+        dates = {value for value in dates if value is not None}
+        if not dates:
+            return 0
+        overlapping = Q()
+        for value in dates:
+            overlapping |= Q(period_start__lte=value, period_end__gte=value)
+        deleted, _ = TaxPeriodSummary.objects.filter(overlapping).delete()
+        return deleted
+
+    def materialize(self):
+        """Store the grouped rows of the period in TaxPeriodSummary, replacing any earlier run"""
+        rows = [
+            TaxPeriodSummary(
+                period_start=self.date_from,
+                period_end=self.date_to,
+                taxpayer_id=row['taxpayer_id'],
+                transaction_type=row['transaction_type'],
+                transaction_count=row['transaction_count'],
+                **{field: row[field] or ZERO for field in AMOUNT_FIELDS},
+            )
+            for row in self.live_rows().iterator(chunk_size=2000)
+        ]
+
+        with transaction.atomic():
+            TaxPeriodSummary.objects.filter(period_start=self.date_from, period_end=self.date_to).delete()
+            TaxPeriodSummary.objects.bulk_create(rows, batch_size=1000)
+
+        logger.info(f"Materialized {len(rows)} tax summary rows for {self.date_from} - {self.date_to}")
+        return len(rows)
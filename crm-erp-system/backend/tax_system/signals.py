@@ -0,0 +1,23 @@
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+from .models import TaxTransaction
+from .services import TaxReportService
+
+
+@receiver(pre_save, sender=TaxTransaction)
+def remember_transaction_date(sender, instance, **kwargs):
+    """Keep the stored date so moving a transaction also invalidates its old period"""
+    instance._previous_transaction_date = None
+    if instance.pk:
+        instance._previous_transaction_date = (
+            TaxTransaction.objects.filter(pk=instance.pk).values_list('transaction_date', flat=True).first()
+        )
+
+
+@receiver(post_save, sender=TaxTransaction)
+@receiver(post_delete, sender=TaxTransaction)
+def invalidate_period_summaries(sender, instance, **kwargs):
+    """Drop materialized summaries that no longer match the transactions"""
+    TaxReportService.invalidate(
+        instance.transaction_date, getattr(instance, '_previous_transaction_date', None)
+    )
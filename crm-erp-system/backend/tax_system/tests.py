@@ -1,3 +1,127 @@
+import json
+import pytest
+from datetime import date
+from decimal import Decimal
+from django.contrib.auth import get_user_model
 from django.test import TestCase
+from rest_framework.test import APIClient
+from customers.models import Customer
+from .models import TaxPayer, TaxPeriodSummary, TaxTransaction
+from .services import TaxReportService
 
-# Create your tests here.
+User = get_user_model()
+
+
+@pytest.mark.unit
+class TaxReportServiceTest(TestCase):
+    def setUp(self):
+        self.first = self.create_taxpayer(1, first_name="علی", last_name="احمدی")
+        self.second = self.create_taxpayer(2, customer_type='legal', company_name="شرکت نمونه")
+        self.number = 0
+        self.add(self.first, 'sale', "100", "9")
+        self.add(self.first, 'sale', "200", "18")
+        self.add(self.first, 'purchase', "50", "4.5")
+        self.add(self.second, 'sale', "1000", "90")
+        self.add(self.second, 'sale', "999", "90", transaction_date=date(2026, 4, 1))
+        self.service = TaxReportService(date(2026, 1, 1), date(2026, 3, 31))
+
+    def create_taxpayer(self, index, **customer_fields):
+        customer = Customer.objects.create(
+            customer_code=f"C-{index}", phone_number=f"0912000000{index}", address="تهران",
+            postal_code="1234567890", city="تهران", state="تهران",
+            **{'first_name': "نام", 'last_name': "مشتری", **customer_fields}
+        )
+        return TaxPayer.objects.create(
+            taxpayer_id=f"TP-{index}", taxpayer_type='individual', customer=customer,
+            tax_office_code="101", tax_office_name="اداره مرکزی",
+            economic_code=f"EC-{index}", national_id=f"NID-{index}",
+        )
+
+    def add(self, taxpayer, transaction_type, amount, tax, transaction_date=date(2026, 2, 10)):
+        self.number += 1
+        TaxTransaction.objects.create(
+            transaction_number=f"TX-{self.number}", transaction_type=transaction_type, taxpayer=taxpayer,
+            transaction_date=transaction_date, gross_amount=Decimal(amount), taxable_amount=Decimal(amount),
+            tax_amount=Decimal(tax), net_amount=Decimal(amount) + Decimal(tax),
+        )
+
+    def test_report_uses_one_grouped_query(self):
+        """Test the whole report comes from a single GROUP BY query"""
+        with self.assertNumQueries(1):
+            report = self.service.build()
+
+        self.assertEqual(report['summary']['total_transactions'], 4)
+        self.assertEqual(report['summary']['total_amount'], Decimal("1350"))
+        self.assertEqual(report['summary']['total_tax'], Decimal("121.5"))
+        self.assertEqual(report['by_type']['sale'], {'count': 3, 'amount': Decimal("1300"), 'tax': Decimal("117")})
+        self.assertEqual(report['by_type']['return']['count'], 0)
+
+        first, second = report['by_taxpayer']
+        self.assertEqual(first['name'], "علی احمدی")
+        self.assertEqual(first['count'], 3)
+        self.assertEqual(first['by_type']['purchase']['amount'], Decimal("50"))
+        self.assertEqual(second['name'], "شرکت نمونه")
+        self.assertEqual(second['gross_amount'], Decimal("1000"))
+
+    def test_materialized_report_matches_live_report(self):
+        """Test the stored period summary gives the same report as the transactions"""
+        self.assertEqual(self.service.materialize(), 3)
+        self.assertTrue(self.service.is_materialized())
+
+        # A second run replaces the period rather than adding to it
+        self.service.materialize()
+        self.assertEqual(TaxPeriodSummary.objects.count(), 3)
+
+        live = self.service.build()
+        stored = self.service.build(materialized=True)
+        self.assertEqual(stored['by_taxpayer'], live['by_taxpayer'])
+        self.assertEqual(stored['summary'], live['summary'])
+
+    def test_streaming_exports(self):
+        """Test CSV and JSON exports stream one row per taxpayer"""
+        user = User.objects.create_user(username="accountant", password="pass")
+        client = APIClient()
+        client.force_authenticate(user)
+        params = {'date_from': '2026-01-01', 'date_to': '2026-03-31'}
+
+        response = client.get('/api/v1/tax/tax-transactions/report/', {**params, 'export': 'csv'})
+        self.assertEqual(response.status_code, 200)
+        lines = b''.join(response.streaming_content).decode().strip().splitlines()
+        self.assertEqual(len(lines), 3)
+        self.assertTrue(lines[1].startswith("TP-1,EC-1,علی احمدی,3,350"))
+
+        response = client.get('/api/v1/tax/tax-transactions/report/', {**params, 'export': 'json'})
+        data = json.loads(b''.join(response.streaming_content))
+        self.assertEqual(len(data['by_taxpayer']), 2)
+        self.assertEqual(data['summary']['total_transactions'], 4)
+        self.assertEqual(data['by_type']['sale']['count'], 3)
+
+    def test_transaction_changes_invalidate_materialized_period(self):
+        """Test saving a transaction drops the stored summary of its period"""
+        self.service.materialize()
+        outside = TaxReportService(date(2026, 4, 1), date(2026, 4, 30))
+        outside.materialize()
+
+        self.add(self.second, 'purchase', "10", "1")
+
+        self.assertFalse(self.service.is_materialized())
+        self.assertTrue(outside.is_materialized())
+
+    def test_report_rejects_invalid_dates_and_filtered_materialized(self):
+        """Test impossible dates and filters combined with materialized=true are a 400"""
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user(username="accountant", password="pass"))
+        url = '/api/v1/tax/tax-transactions/report/'
+
+        response = client.get(url, {'date_from': '2026-13-01', 'date_to': '2026-03-31'})
+        self.assertEqual(response.status_code, 400)
+
+        self.service.materialize()
+        params = {'date_from': '2026-01-01', 'date_to': '2026-03-31', 'materialized': 'true'}
+        response = client.get(url, {**params, 'min_amount': '500'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['filters'], ['min_amount'])
+
+        response = client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.data['materialized'])
@@ -2,10 +2,23 @@ from rest_framework import viewsets, filters, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from django_filters.rest_framework import DjangoFilterBackend
-from django.db.models import Q, F, Sum, Count
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q, F, Count
+from django.http import StreamingHttpResponse
 from django.utils import timezone
+from django.utils.dateparse import parse_date
+from common.stats import STATS_CACHE_TIMEOUT, StatsBuilder
 from .models import TaxPayer, TaxRate, TaxTransaction
 from .serializers import TaxPayerSerializer, TaxRateSerializer, TaxTransactionSerializer
+from .services import AMOUNT_FIELDS, TaxReportService
+import csv
+
+
+class Echo:
+    """File-like object for csv.writer that hands each written row back instead of buffering it"""
+
+    def write(self, value):
+        return value
 
 
 class TaxPayerViewSet(viewsets.ModelViewSet):
@@ -34,18 +47,12 @@ class TaxPayerViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['get'])
     def stats(self, request):
         """آمار مودیان مالیاتی"""
-        total_taxpayers = self.get_queryset().count()
-        active_taxpayers = self.get_queryset().filter(status='active').count()
-        
-        type_stats = {}
-        for taxpayer_type, _ in TaxPayer.TAXPAYER_TYPES:
-            type_stats[taxpayer_type] = self.get_queryset().filter(taxpayer_type=taxpayer_type).count()
-        
-        return Response({
-            'total_taxpayers': total_taxpayers,
-            'active_taxpayers': active_taxpayers,
-            'type_stats': type_stats,
-        })
+        stats = StatsBuilder(self.get_queryset(), cache_timeout=STATS_CACHE_TIMEOUT)
+        stats.count('total_taxpayers')
+        stats.count('active_taxpayers', Q(status='active'))
+        stats.breakdown('type_stats', 'taxpayer_type', TaxPayer.TAXPAYER_TYPES)
+        
+        return Response(stats.build())
     
     @action(detail=True, methods=['post'])
     def activate(self, request, pk=None):
@@ -109,18 +116,12 @@ class TaxRateViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['get'])
     def stats(self, request):
         """آمار نرخ‌های مالیاتی"""
-        total_rates = self.get_queryset().count()
-        active_rates = self.get_queryset().filter(status='active').count()
-        
-        type_stats = {}
-        for tax_type, _ in TaxRate.TAX_TYPES:
-            type_stats[tax_type] = self.get_queryset().filter(tax_type=tax_type).count()
-        
-        return Response({
-            'total_rates': total_rates,
-            'active_rates': active_rates,
-            'type_stats': type_stats,
-        })
+        stats = StatsBuilder(self.get_queryset(), cache_timeout=STATS_CACHE_TIMEOUT)
+        stats.count('total_rates')
+        stats.count('active_rates', Q(is_active=True))
+        stats.breakdown('type_stats', 'tax_type', TaxRate.TAX_TYPES)
+        
+        return Response(stats.build())
 
 
 class TaxTransactionViewSet(viewsets.ModelViewSet):
@@ -129,7 +130,7 @@ class TaxTransactionViewSet(viewsets.ModelViewSet):
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
     filterset_fields = ['taxpayer', 'tax_rate', 'transaction_type', 'status']
     search_fields = ['transaction_number', 'description']
-    ordering_fields = ['transaction_date', 'amount', 'tax_amount', 'created_at']
+    ordering_fields = ['transaction_date', 'gross_amount', 'tax_amount', 'created_at']
     ordering = ['-transaction_date']
     
     def get_queryset(self):
@@ -149,34 +150,23 @@ class TaxTransactionViewSet(viewsets.ModelViewSet):
         max_amount = self.request.query_params.get('max_amount')
         
         if min_amount:
-            queryset = queryset.filter(amount__gte=min_amount)
+            queryset = queryset.filter(gross_amount__gte=min_amount)
         if max_amount:
-            queryset = queryset.filter(amount__lte=max_amount)
+            queryset = queryset.filter(gross_amount__lte=max_amount)
         
         return queryset
     
     @action(detail=False, methods=['get'])
     def stats(self, request):
         """آمار تراکنش‌های مالیاتی"""
-        total_transactions = self.get_queryset().count()
-        total_amount = self.get_queryset().aggregate(total=Sum('amount'))['total'] or 0
-        total_tax = self.get_queryset().aggregate(total=Sum('tax_amount'))['total'] or 0
-        
-        type_stats = {}
-        for transaction_type, _ in TaxTransaction.TRANSACTION_TYPES:
-            type_stats[transaction_type] = self.get_queryset().filter(transaction_type=transaction_type).count()
-        
-        status_stats = {}
-        for status, _ in TaxTransaction.STATUS_CHOICES:
-            status_stats[status] = self.get_queryset().filter(status=status).count()
-        
-        return Response({
-            'total_transactions': total_transactions,
-            'total_amount': total_amount,
-            'total_tax': total_tax,
-            'type_stats': type_stats,
-            'status_stats': status_stats,
-        })
+        stats = StatsBuilder(self.get_queryset(), cache_timeout=STATS_CACHE_TIMEOUT)
+        stats.count('total_transactions')
+        stats.sum('total_amount', 'gross_amount')
+        stats.sum('total_tax', 'tax_amount')
+        stats.breakdown('type_stats', 'transaction_type', TaxTransaction.TRANSACTION_TYPES)
+        stats.breakdown('status_stats', 'status', TaxTransaction.STATUS_CHOICES)
+        
+        return Response(stats.build())
     
     @action(detail=True, methods=['post'])
     def approve(self, request, pk=None):
@@ -208,55 +198,95 @@ class TaxTransactionViewSet(viewsets.ModelViewSet):
     
     @action(detail=False, methods=['get'])
     def report(self, request):
-        """گزارش مالیاتی"""
-        date_from = request.query_params.get('date_from')
-        date_to = request.query_params.get('date_to')
+        """
+        گزارش مالیاتی
+
+        همه ارقام با یک کوئری گروه‌بندی‌شده (مودی، نوع تراکنش) محاسبه می‌شوند.
+        export=csv|json خروجی را به صورت جریانی و مودی به مودی ارسال می‌کند و
+        materialized=true در صورت وجود، از خلاصه ذخیره‌شده دوره می‌خواند (بدون فیلتر
+        دیگر؛ خلاصه شامل همه تراکنش‌های دوره است).
+        """
+        try:
+            date_from, date_to = self._parse_period(request.query_params)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        export = request.query_params.get('export')
+        if export and export not in ('csv', 'json'):
+            return Response({'error': 'نوع خروجی نامعتبر است'}, 
+                          status=status.HTTP_400_BAD_REQUEST)
         
-        if not date_from or not date_to:
-            return Response({'error': 'تاریخ شروع و پایان الزامی است'}, 
+        service = TaxReportService(date_from, date_to, transactions=self.get_queryset())
+        materialized = request.query_params.get('materialized') == 'true'
+        if materialized and self._report_filters(request):
+            # The stored summary covers all transactions of the period
+            return Response({'error': 'گزارش ذخیره‌شده با فیلتر قابل استفاده نیست',
+                             'filters': self._report_filters(request)},
                           status=status.HTTP_400_BAD_REQUEST)
+        materialized = materialized and service.is_materialized()
         
-        transactions = self.get_queryset().filter(
-            transaction_date__gte=date_from,
-            transaction_date__lte=date_to
-        )
+        if export == 'csv':
+            response = StreamingHttpResponse(self._report_csv(service, materialized), content_type='text/csv')
+            response['Content-Disposition'] = f'attachment; filename="tax-report-{date_from}-{date_to}.csv"'
+            return response
+        if export == 'json':
+            return StreamingHttpResponse(self._report_json(service, materialized), content_type='application/json')
         
-        # آمار کلی
-        total_transactions = transactions.count()
-        total_amount = transactions.aggregate(total=Sum('amount'))['total'] or 0
-        total_tax = transactions.aggregate(total=Sum('tax_amount'))['total'] or 0
-        
-        # آمار بر اساس نوع تراکنش
-        type_stats = {}
-        for transaction_type, _ in TaxTransaction.TRANSACTION_TYPES:
-            type_transactions = transactions.filter(transaction_type=transaction_type)
-            type_stats[transaction_type] = {
-                'count': type_transactions.count(),
-                'amount': type_transactions.aggregate(total=Sum('amount'))['total'] or 0,
-                'tax': type_transactions.aggregate(total=Sum('tax_amount'))['total'] or 0,
-            }
-        
-        # آمار بر اساس مودی
-        taxpayer_stats = {}
-        for taxpayer in transactions.values('taxpayer__name').distinct():
-            taxpayer_name = taxpayer['taxpayer__name']
-            taxpayer_transactions = transactions.filter(taxpayer__name=taxpayer_name)
-            taxpayer_stats[taxpayer_name] = {
-                'count': taxpayer_transactions.count(),
-                'amount': taxpayer_transactions.aggregate(total=Sum('amount'))['total'] or 0,
-                'tax': taxpayer_transactions.aggregate(total=Sum('tax_amount'))['total'] or 0,
-            }
-        
-        return Response({
-            'period': {
-                'from': date_from,
-                'to': date_to,
-            },
-            'summary': {
-                'total_transactions': total_transactions,
-                'total_amount': total_amount,
-                'total_tax': total_tax,
-            },
-            'by_type': type_stats,
-            'by_taxpayer': taxpayer_stats,
-        })
\ No newline at end of file
+        return Response(service.build(materialized=materialized))
+    
+    @action(detail=False, methods=['post'])
+    def materialize(self, request):
+        """ذخیره خلاصه گزارش مالیاتی یک دوره"""
+        try:
+            date_from, date_to = self._parse_period(request.data)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        rows = TaxReportService(date_from, date_to).materialize()
+        
+        return Response({'message': 'خلاصه گزارش مالیاتی ذخیره شد', 'rows': rows})
+    
+    @staticmethod
+    def _parse_period(params):
+        """date_from/date_to as dates; ValueError with the message for the response otherwise"""
+        try:
+            date_from = parse_date(str(params.get('date_from') or ''))
+            date_to = parse_date(str(params.get('date_to') or ''))
+        except ValueError:
+            raise ValueError('تاریخ نامعتبر است')
+        if not date_from or not date_to:
+            raise ValueError('تاریخ شروع و پایان الزامی است')
+        return date_from, date_to
+    
+    def _report_filters(self, request):
+        """Query parameters that narrow get_queryset() beyond the report period"""
+        names = [*self.filterset_fields, 'search', 'min_amount', 'max_amount']
+        return [name for name in names if request.query_params.get(name)]
+    
+    @staticmethod
+    def _report_csv(service, materialized):
+        writer = csv.writer(Echo())
+        type_codes = [transaction_type for transaction_type, _ in TaxTransaction.TRANSACTION_TYPES]
+        yield writer.writerow(
+            ['taxpayer_id', 'economic_code', 'name', 'count', *AMOUNT_FIELDS]
+            + [f'{code}_{column}' for code in type_codes for column in ('count', 'amount', 'tax')]
+        )
+        for taxpayer in service.iter_taxpayers(materialized):
+            by_type = taxpayer['by_type']
+            yield writer.writerow(
+                [taxpayer['taxpayer_code'], taxpayer['economic_code'], taxpayer['name'], taxpayer['count']]
+                + [taxpayer[field] for field in AMOUNT_FIELDS]
+                + [by_type.get(code, {}).get(column, 0) for code in type_codes for column in ('count', 'amount', 'tax')]
+            )
+    
+    @staticmethod
+    def _report_json(service, materialized):
+        # Taxpayers are written as they are read; the totals follow once all rows were seen
+        encoder = DjangoJSONEncoder(ensure_ascii=False)
+        totals = service.empty_summary()
+        period = {'from': service.date_from, 'to': service.date_to}
+        yield f'{{"period": {encoder.encode(period)}, "materialized": {encoder.encode(materialized)}, "by_taxpayer": ['
+        for index, taxpayer in enumerate(service.iter_taxpayers(materialized)):
+            service.add_to_summary(totals, taxpayer)
+            yield (', ' if index else '') + encoder.encode(taxpayer)
+        yield f'], "summary": {encoder.encode(totals["summary"])}, "by_type": {encoder.encode(totals["by_type"])}}}'
@@ -5,6 +5,8 @@ interface RealtimeMessage {
   type: string;
   data?: any;
   notification?: any;
+  notifications?: any[];
+  next_cursor?: string | null;
   count?: number;
 }
 
@@ -105,6 +107,9 @@ export const useNotifications = () => {
   const { lastMessage, sendMessage } = useRealtime('notifications');
   const [notifications, setNotifications] = useState<any[]>([]);
   const [unreadCount, setUnreadCount] = useState(0);
+  // Cursor of the next (older) page; null when the last page has been loaded
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
+  const loadingMoreRef = useRef(false);
 
   useEffect(() => {
     if (lastMessage) {
@@ -115,9 +120,13 @@ export const useNotifications = () => {
         case 'unread_count':
           setUnreadCount(lastMessage.count || 0);
           break;
-        case 'notifications_list':
-          setNotifications(lastMessage.notifications || []);
+        case 'notifications_list': {
+          const page = lastMessage.notifications || [];
+          setNotifications(prev => (loadingMoreRef.current ? [...prev, ...page] : page));
+          setNextCursor(lastMessage.next_cursor ?? null);
+          loadingMoreRef.current = false;
           break;
+        }
       }
     }
   }, [lastMessage]);
@@ -135,19 +144,31 @@ export const useNotifications = () => {
     });
   };
 
-  const loadNotifications = (page: number = 1) => {
+  // Keyset pagination: the first page without a cursor, older pages with the returned next_cursor
+  const loadNotifications = (cursor: string | null = null, limit: number = 20) => {
+    loadingMoreRef.current = cursor !== null;
     sendMessage({
       type: 'get_notifications',
-      page
+      cursor,
+      limit
     });
   };
 
+  const loadMoreNotifications = () => {
+    if (nextCursor) {
+      loadNotifications(nextCursor);
+    }
+  };
+
   return {
     notifications,
     unreadCount,
+    nextCursor,
+    hasMore: nextCursor !== null,
     markAsRead,
     markAllAsRead,
-    loadNotifications
+    loadNotifications,
+    loadMoreNotifications
   };
 };
 